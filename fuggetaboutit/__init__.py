@@ -1,5 +1,6 @@
 from counting_bloom_filter import CountingBloomFilter
 from timing_bloom_filter import TimingBloomFilter
 from scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from filter_group import FilterGroup
 
-__all__ = [CountingBloomFilter, TimingBloomFilter, ScalingTimingBloomFilter]
+__all__ = [CountingBloomFilter, TimingBloomFilter, ScalingTimingBloomFilter, FilterGroup]
@@ -2,12 +2,273 @@
 #include <numpy/arrayobject.h>
 #include <stdbool.h>
 #include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
  
 /* Docstrings */
 static char module_docstring[] = "Provides fast implemintations of possibly slow functions in fuggetaboutit.  In addition, this module implements the bloom filters in 4 bits instead of 8.";
 static char timing_bloom_decay_docstring[] = "Decay a timing bloom";
 static char timing_bloom_contains_docstring[] = "Check if a bloom contains a key";
 static char timing_bloom_add_docstring[] = "Adds a tick to a bloom";
+static char timing_bloom_multi_contains_docstring[] = "Hashes a key once and checks if any bloom in a descriptor table contains it";
+static char timing_bloom_multi_contains_batch_docstring[] = "Runs timing_bloom_multi_contains over a sequence of keys";
+static char timing_bloom_multi_last_seen_docstring[] = "Hashes a key once and returns how many ticks ago the bloom in a descriptor table that saw it last did, or None";
+static char timing_bloom_multi_contains_between_docstring[] = "Hashes a key once and checks if any bloom in a descriptor table saw it last between two ages in ticks";
+static char timing_bloom_multi_contains_between_batch_docstring[] = "Runs timing_bloom_multi_contains_between over a sequence of keys";
+static char timing_bloom_multi_add_if_new_docstring[] = "Hashes a key once, checks if any bloom in a descriptor table contains it and adds it to one of them";
+static char timing_bloom_multi_add_if_new_batch_docstring[] = "Runs timing_bloom_multi_add_if_new over a sequence of keys until a number of buckets became non-zero";
+static char timing_bloom_multi_add_docstring[] = "Hashes a key once and adds it to every bloom in a descriptor table, counting the new buckets of each";
+static char timing_bloom_multi_add_batch_docstring[] = "Runs timing_bloom_multi_add over a sequence of keys";
+static char timing_bloom_multi_contains_mask_docstring[] = "Hashes a key once and returns a bit mask of the blooms in a descriptor table that contain it";
+static char timing_bloom_multi_contains_mask_batch_docstring[] = "Runs timing_bloom_multi_contains_mask over a sequence of keys";
+static char timing_bloom_add_batch_docstring[] = "Adds a sequence of keys, each at its own tick, to the bloom in a descriptor row until a number of buckets became non-zero";
+
+/* Descriptor tables are C-contiguous int64 arrays with one row per bloom */
+#define DESC_DATA 0
+#define DESC_SIZE 1
+#define DESC_NUM_HASHES 2
+#define DESC_TICK_MIN 3
+#define DESC_TICK_MAX 4
+#define DESC_WIDTH 5
+
+/* Number of distinct non-zero 4 bit ticks */
+#define RING_SIZE 15
+
+/* MurmurHash3_x64_128 by Austin Appleby (public domain), matching mmh3.hash64 */
+static inline uint64_t rotl64(uint64_t x, int8_t r) {
+    return (x << r) | (x >> (64 - r));
+}
+
+static inline uint64_t fmix64(uint64_t k) {
+    k ^= k >> 33;
+    k *= 0xff51afd7ed558ccdULL;
+    k ^= k >> 33;
+    k *= 0xc4ceb9fe1a85ec53ULL;
+    k ^= k >> 33;
+    return k;
+}
+
+static void murmurhash3_x64_128(const uint8_t *data, const Py_ssize_t len, int64_t *out1, int64_t *out2) {
+    const Py_ssize_t nblocks = len / 16;
+    uint64_t h1 = 0, h2 = 0, k1, k2;
+    const uint64_t c1 = 0x87c37b91114253d5ULL;
+    const uint64_t c2 = 0x4cf5ad432745937fULL;
+
+    for (Py_ssize_t i = 0; i < nblocks; i++) {
+        memcpy(&k1, data + i * 16, 8);
+        memcpy(&k2, data + i * 16 + 8, 8);
+
+        k1 *= c1; k1 = rotl64(k1, 31); k1 *= c2; h1 ^= k1;
+        h1 = rotl64(h1, 27); h1 += h2; h1 = h1 * 5 + 0x52dce729;
+        k2 *= c2; k2 = rotl64(k2, 33); k2 *= c1; h2 ^= k2;
+        h2 = rotl64(h2, 31); h2 += h1; h2 = h2 * 5 + 0x38495ab5;
+    }
+
+    const uint8_t *tail = data + nblocks * 16;
+    k1 = 0;
+    k2 = 0;
+    switch (len & 15) {
+        case 15: k2 ^= ((uint64_t)tail[14]) << 48;
+        case 14: k2 ^= ((uint64_t)tail[13]) << 40;
+        case 13: k2 ^= ((uint64_t)tail[12]) << 32;
+        case 12: k2 ^= ((uint64_t)tail[11]) << 24;
+        case 11: k2 ^= ((uint64_t)tail[10]) << 16;
+        case 10: k2 ^= ((uint64_t)tail[ 9]) << 8;
+        case  9: k2 ^= ((uint64_t)tail[ 8]) << 0;
+                 k2 *= c2; k2 = rotl64(k2, 33); k2 *= c1; h2 ^= k2;
+        case  8: k1 ^= ((uint64_t)tail[ 7]) << 56;
+        case  7: k1 ^= ((uint64_t)tail[ 6]) << 48;
+        case  6: k1 ^= ((uint64_t)tail[ 5]) << 40;
+        case  5: k1 ^= ((uint64_t)tail[ 4]) << 32;
+        case  4: k1 ^= ((uint64_t)tail[ 3]) << 24;
+        case  3: k1 ^= ((uint64_t)tail[ 2]) << 16;
+        case  2: k1 ^= ((uint64_t)tail[ 1]) << 8;
+        case  1: k1 ^= ((uint64_t)tail[ 0]) << 0;
+                 k1 *= c1; k1 = rotl64(k1, 31); k1 *= c2; h1 ^= k1;
+    }
+
+    h1 ^= (uint64_t)len;
+    h2 ^= (uint64_t)len;
+    h1 += h2;
+    h2 += h1;
+    h1 = fmix64(h1);
+    h2 = fmix64(h2);
+    h1 += h2;
+    h2 += h1;
+
+    *out1 = (int64_t)h1;
+    *out2 = (int64_t)h2;
+}
+
+static bool hash_key(PyObject *key, int64_t *h1, int64_t *h2) {
+    char *buffer;
+    Py_ssize_t length;
+    if (PyString_AsStringAndSize(key, &buffer, &length) == -1) {
+        return false;
+    }
+    murmurhash3_x64_128((const uint8_t *)buffer, length, h1, h2);
+    return true;
+}
+
+/* The modulo of a signed hash value with python's (non-negative) semantics */
+static inline uint64_t py_mod(int64_t value, uint64_t size) {
+    int64_t result = value % (int64_t)size;
+    if (result < 0) {
+        result += size;
+    }
+    return (uint64_t)result;
+}
+
+static inline uint8_t get_cell(const uint8_t *values, uint64_t index) {
+    if (index % 2 == 0) {
+        return (values[index / 2] & 0xf0) >> 4;
+    }
+    return values[index / 2] & 0x0f;
+}
+
+static inline void set_cell(uint8_t *values, uint64_t index, uint8_t tick) {
+    if (index % 2 == 0) {
+        values[index / 2] = ((tick << 4) & 0xf0) | (values[index / 2] & 0x0f);
+    } else {
+        values[index / 2] = (tick & 0x0f) | (values[index / 2] & 0xf0);
+    }
+}
+
+/* How many ticks before tick_max the given tick is */
+static inline int tick_age(uint8_t tick, uint8_t tick_max) {
+    return ((int)tick_max - (int)tick + RING_SIZE) % RING_SIZE;
+}
+
+static inline bool tick_is_live(uint8_t value, uint8_t tick_min, uint8_t tick_max) {
+    if (value == 0) {
+        return false;
+    }
+    if (tick_min < tick_max) {
+        return tick_min < value && value <= tick_max;
+    }
+    return !(tick_max < value && value <= tick_min);
+}
+
+/*
+ * Checks every index of the key given by (h1, h2) in the bloom described by
+ * row and returns the age, in ticks, of the oldest one or -1 if one of them
+ * isn't live
+ */
+static int desc_age(const int64_t *row, int64_t h1, int64_t h2) {
+    const uint8_t *values = (const uint8_t *)(intptr_t)row[DESC_DATA];
+    const uint64_t size = (uint64_t)row[DESC_SIZE];
+    const int64_t num_hashes = row[DESC_NUM_HASHES];
+    const uint8_t tick_min = (uint8_t)row[DESC_TICK_MIN];
+    const uint8_t tick_max = (uint8_t)row[DESC_TICK_MAX];
+    const uint64_t step = py_mod(h2, size);
+    uint64_t index = py_mod(h1, size);
+    int max_age = 0, age;
+    uint8_t value;
+
+    for (int64_t i = 0; i < num_hashes; i++) {
+        value = get_cell(values, index);
+        if (!tick_is_live(value, tick_min, tick_max)) {
+            return -1;
+        }
+        age = tick_age(value, tick_max);
+        if (age > max_age) {
+            max_age = age;
+        }
+        index += step;
+        if (index >= size) {
+            index -= size;
+        }
+    }
+    return max_age;
+}
+
+static inline bool desc_contains(const int64_t *row, int64_t h1, int64_t h2) {
+    return desc_age(row, h1, h2) >= 0;
+}
+
+/*
+ * Sets every index of the key given by (h1, h2) in the bloom described by row
+ * to tick, unless the bucket holds a more recent tick, and returns the number
+ * of buckets that were empty
+ */
+static int64_t desc_add(const int64_t *row, int64_t h1, int64_t h2, uint8_t tick) {
+    uint8_t *values = (uint8_t *)(intptr_t)row[DESC_DATA];
+    const uint64_t size = (uint64_t)row[DESC_SIZE];
+    const int64_t num_hashes = row[DESC_NUM_HASHES];
+    const uint8_t tick_max = (uint8_t)row[DESC_TICK_MAX];
+    const int age = tick_age(tick, tick_max);
+    const uint64_t step = py_mod(h2, size);
+    uint64_t index = py_mod(h1, size);
+    int64_t num_new = 0;
+    uint8_t value;
+
+    for (int64_t i = 0; i < num_hashes; i++) {
+        value = get_cell(values, index);
+        if (value == 0) {
+            num_new += 1;
+            set_cell(values, index, tick);
+        } else if (tick_age(value, tick_max) >= age) {
+            set_cell(values, index, tick);
+        }
+        index += step;
+        if (index >= size) {
+            index -= size;
+        }
+    }
+    return num_new;
+}
+
+static bool table_contains(const int64_t *table, npy_intp num_rows, int64_t h1, int64_t h2) {
+    for (npy_intp row = 0; row < num_rows; row++) {
+        if (desc_contains(table + row * DESC_WIDTH, h1, h2)) {
+            return true;
+        }
+    }
+    return false;
+}
+
+/* Returns the age of the key in the bloom that saw it last or -1 if none of them contain it */
+static int table_age(const int64_t *table, npy_intp num_rows, int64_t h1, int64_t h2) {
+    int min_age = -1, age;
+    for (npy_intp row = 0; row < num_rows && min_age != 0; row++) {
+        age = desc_age(table + row * DESC_WIDTH, h1, h2);
+        if (age >= 0 && (min_age < 0 || age < min_age)) {
+            min_age = age;
+        }
+    }
+    return min_age;
+}
+
+/* Checks if any of the blooms saw the key between min_age and max_age ticks ago, both included */
+static bool table_contains_between(const int64_t *table, npy_intp num_rows, int64_t h1, int64_t h2,
+                                   int min_age, int max_age) {
+    int age;
+    for (npy_intp row = 0; row < num_rows; row++) {
+        age = desc_age(table + row * DESC_WIDTH, h1, h2);
+        if (age >= 0 && min_age <= age && age <= max_age) {
+            return true;
+        }
+    }
+    return false;
+}
+
+static bool check_table(PyArrayObject *table) {
+    if (!PyArray_Check(table) || !PyArray_ISCONTIGUOUS(table) || PyArray_NDIM(table) != 2 ||
+            PyArray_DIM(table, 1) != DESC_WIDTH || PyArray_TYPE(table) != NPY_INT64) {
+        PyErr_SetString(PyExc_RuntimeError, "descriptor table not in the correct format");
+        return false;
+    }
+    return true;
+}
+
+static bool check_row(PyArrayObject *row) {
+    if (!PyArray_Check(row) || !PyArray_ISCONTIGUOUS(row) || PyArray_NDIM(row) != 1 ||
+            PyArray_DIM(row, 0) != DESC_WIDTH || PyArray_TYPE(row) != NPY_INT64) {
+        PyErr_SetString(PyExc_RuntimeError, "descriptor row not in the correct format");
+        return false;
+    }
+    return true;
+}
 
 PyObject* py_timing_bloom_add(PyObject* self, PyObject* args) {
     PyArrayObject* data;
@@ -124,42 +385,463 @@ PyObject* py_timing_bloom_decay(PyObject* self, PyObject* args) {
         return NULL;
     }
     
-    const int N = (int) PyArray_DIM(data, 0) * 2;
-    uint8_t value;
+    /* what every byte, holding two ticks, decays to and how many live ticks it holds */
+    uint8_t decayed[256], num_live[256];
+    for (int byte = 0; byte < 256; byte++) {
+        uint8_t high = byte >> 4, low = byte & 0x0f;
+        decayed[byte] = 0;
+        num_live[byte] = 0;
+        if (tick_is_live(high, tick_min, tick_max)) {
+            decayed[byte] |= byte & 0xf0;
+            num_live[byte] += 1;
+        }
+        if (tick_is_live(low, tick_min, tick_max)) {
+            decayed[byte] |= low;
+            num_live[byte] += 1;
+        }
+    }
+
+    const npy_intp N = PyArray_DIM(data, 0);
     uint8_t *values = PyArray_DATA(data);
-    int num_non_zero = 0;
-    bool ring_interval = (tick_max < tick_min);
-    long access_index;
+    Py_ssize_t num_non_zero = 0;
+    uint8_t value;
 
-    if (ring_interval) {
-        uint8_t tmp = tick_min;
-        tick_min = tick_max;
-        tick_max = tmp;
+    for (npy_intp i = 0; i < N; i++) {
+        value = values[i];
+        num_non_zero += num_live[value];
+        /* only write changed bytes so clean pages of memory mapped blooms stay clean */
+        if (decayed[value] != value) {
+            values[i] = decayed[value];
+        }
+    }
+    return Py_BuildValue("n", num_non_zero);
+}
+
+
+PyObject* py_timing_bloom_multi_contains(PyObject* self, PyObject* args) {
+    PyObject* key;
+    PyArrayObject* table;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OO", &key, &table)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !hash_key(key, &h1, &h2)) {
+        return NULL;
+    }
+
+    bool contains = table_contains(PyArray_DATA(table), PyArray_DIM(table, 0), h1, h2);
+    return PyBool_FromLong(contains);
+}
+
+PyObject* py_timing_bloom_multi_last_seen(PyObject* self, PyObject* args) {
+    PyObject* key;
+    PyArrayObject* table;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OO", &key, &table)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !hash_key(key, &h1, &h2)) {
+        return NULL;
+    }
+
+    int age = table_age(PyArray_DATA(table), PyArray_DIM(table, 0), h1, h2);
+    if (age < 0) {
+        Py_RETURN_NONE;
+    }
+    return Py_BuildValue("i", age);
+}
+
+PyObject* py_timing_bloom_multi_contains_between(PyObject* self, PyObject* args) {
+    PyObject* key;
+    PyArrayObject* table;
+    int min_age, max_age;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OOii", &key, &table, &min_age, &max_age)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !hash_key(key, &h1, &h2)) {
+        return NULL;
+    }
+
+    bool contains = table_contains_between(PyArray_DATA(table), PyArray_DIM(table, 0), h1, h2, min_age, max_age);
+    return PyBool_FromLong(contains);
+}
+
+PyObject* py_timing_bloom_multi_contains_between_batch(PyObject* self, PyObject* args) {
+    PyObject* keys;
+    PyArrayObject* table;
+    int min_age, max_age;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OOii", &keys, &table, &min_age, &max_age)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table)) {
+        return NULL;
+    }
+    PyObject *seq = PySequence_Fast(keys, "keys argument must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    npy_intp num_keys = PySequence_Fast_GET_SIZE(seq);
+    PyArrayObject *result = (PyArrayObject *)PyArray_SimpleNew(1, &num_keys, NPY_BOOL);
+    if (result == NULL) {
+        Py_DECREF(seq);
+        return NULL;
     }
 
-    for(long i=0; i<N; i+=2) {
-        access_index = i / 2;
-        value = (values[access_index] & 0xf0) >> 4;
-        
-        if (value != 0) {
-            if ((value > tick_max || value <= tick_min) ^ ring_interval)  {
-                values[access_index] &= 0x0f;
-            } else {
-                num_non_zero += 1;
-            }
+    const int64_t *rows = PyArray_DATA(table);
+    const npy_intp num_rows = PyArray_DIM(table, 0);
+    npy_bool *out = PyArray_DATA(result);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    for (npy_intp i = 0; i < num_keys; i++) {
+        if (!hash_key(items[i], &h1, &h2)) {
+            Py_DECREF(seq);
+            Py_DECREF(result);
+            return NULL;
         }
+        out[i] = table_contains_between(rows, num_rows, h1, h2, min_age, max_age);
+    }
+    Py_DECREF(seq);
+
+    return (PyObject *)result;
+}
+
+PyObject* py_timing_bloom_multi_contains_batch(PyObject* self, PyObject* args) {
+    PyObject* keys;
+    PyArrayObject* table;
+    int64_t h1, h2;
 
-        value = values[access_index] & 0x0f;
-        if (value != 0) {
-            if ((value > tick_max || value <= tick_min) ^ ring_interval)  {
-                values[access_index] &= 0xf0;
-            } else {
-                num_non_zero += 1;
-            }
+    if (!PyArg_ParseTuple(args, "OO", &keys, &table)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table)) {
+        return NULL;
+    }
+    PyObject *seq = PySequence_Fast(keys, "keys argument must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    npy_intp num_keys = PySequence_Fast_GET_SIZE(seq);
+    PyArrayObject *result = (PyArrayObject *)PyArray_SimpleNew(1, &num_keys, NPY_BOOL);
+    if (result == NULL) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+
+    const int64_t *rows = PyArray_DATA(table);
+    const npy_intp num_rows = PyArray_DIM(table, 0);
+    npy_bool *out = PyArray_DATA(result);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    for (npy_intp i = 0; i < num_keys; i++) {
+        if (!hash_key(items[i], &h1, &h2)) {
+            Py_DECREF(seq);
+            Py_DECREF(result);
+            return NULL;
         }
+        out[i] = table_contains(rows, num_rows, h1, h2);
     }
-    PyObject *ret = Py_BuildValue("i", num_non_zero);
-    return ret;
+    Py_DECREF(seq);
+
+    return (PyObject *)result;
+}
+
+PyObject* py_timing_bloom_add_batch(PyObject* self, PyObject* args) {
+    PyObject* keys;
+    PyArrayObject* ticks;
+    Py_ssize_t start;
+    PyArrayObject* row;
+    long long max_new;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OOnOL", &keys, &ticks, &start, &row, &max_new)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_row(row)) {
+        return NULL;
+    }
+    if (!PyArray_Check(ticks) || !PyArray_ISCONTIGUOUS(ticks) || PyArray_NDIM(ticks) != 1 ||
+            PyArray_TYPE(ticks) != NPY_UINT8) {
+        PyErr_SetString(PyExc_RuntimeError, "ticks not in the correct format");
+        return NULL;
+    }
+    PyObject *seq = PySequence_Fast(keys, "keys argument must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    const Py_ssize_t num_keys = PySequence_Fast_GET_SIZE(seq);
+    if (PyArray_DIM(ticks, 0) < num_keys || start < 0) {
+        Py_DECREF(seq);
+        PyErr_SetString(PyExc_RuntimeError, "ticks must have one entry per key");
+        return NULL;
+    }
+
+    const int64_t *desc = PyArray_DATA(row);
+    const uint8_t *tick_values = PyArray_DATA(ticks);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    int64_t num_new = 0;
+    Py_ssize_t i;
+    /* like single adds, the first key is added even without headroom */
+    for (i = start; i < num_keys && (i == start || num_new < max_new); i++) {
+        if (!hash_key(items[i], &h1, &h2)) {
+            Py_DECREF(seq);
+            return NULL;
+        }
+        num_new += desc_add(desc, h1, h2, tick_values[i]);
+    }
+    Py_DECREF(seq);
+
+    return Py_BuildValue("nL", i, (long long)num_new);
+}
+
+/* Checks the key given by (h1, h2) against every row of table and then adds it to the active row at its current tick */
+static bool table_add_if_new(const int64_t *table, npy_intp num_rows, npy_intp active_row, int64_t h1, int64_t h2, int64_t *num_new) {
+    const int64_t *active = table + active_row * DESC_WIDTH;
+    bool contains = table_contains(table, num_rows, h1, h2);
+    *num_new += desc_add(active, h1, h2, (uint8_t)active[DESC_TICK_MAX]);
+    return !contains;
+}
+
+static bool check_active_row(PyArrayObject *table, Py_ssize_t active_row) {
+    if (active_row < 0 || active_row >= PyArray_DIM(table, 0)) {
+        PyErr_SetString(PyExc_RuntimeError, "active row not in the descriptor table");
+        return false;
+    }
+    return true;
+}
+
+PyObject* py_timing_bloom_multi_add_if_new(PyObject* self, PyObject* args) {
+    PyObject* key;
+    PyArrayObject* table;
+    Py_ssize_t active_row;
+    int64_t h1, h2, num_new = 0;
+
+    if (!PyArg_ParseTuple(args, "OOn", &key, &table, &active_row)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !check_active_row(table, active_row) || !hash_key(key, &h1, &h2)) {
+        return NULL;
+    }
+
+    bool is_new = table_add_if_new(PyArray_DATA(table), PyArray_DIM(table, 0), active_row, h1, h2, &num_new);
+    return Py_BuildValue("NL", PyBool_FromLong(is_new), (long long)num_new);
+}
+
+PyObject* py_timing_bloom_multi_add_if_new_batch(PyObject* self, PyObject* args) {
+    PyObject* keys;
+    PyArrayObject* table;
+    Py_ssize_t active_row;
+    Py_ssize_t start;
+    long long max_new;
+    PyArrayObject* result;
+    int64_t h1, h2, num_new = 0;
+
+    if (!PyArg_ParseTuple(args, "OOnnLO", &keys, &table, &active_row, &start, &max_new, &result)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !check_active_row(table, active_row)) {
+        return NULL;
+    }
+    if (!PyArray_Check(result) || !PyArray_ISCONTIGUOUS(result) || PyArray_NDIM(result) != 1 ||
+            PyArray_TYPE(result) != NPY_BOOL) {
+        PyErr_SetString(PyExc_RuntimeError, "result not in the correct format");
+        return NULL;
+    }
+    PyObject *seq = PySequence_Fast(keys, "keys argument must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    const Py_ssize_t num_keys = PySequence_Fast_GET_SIZE(seq);
+    if (PyArray_DIM(result, 0) < num_keys || start < 0) {
+        Py_DECREF(seq);
+        PyErr_SetString(PyExc_RuntimeError, "result must have one entry per key");
+        return NULL;
+    }
+
+    const int64_t *rows = PyArray_DATA(table);
+    const npy_intp num_rows = PyArray_DIM(table, 0);
+    npy_bool *out = PyArray_DATA(result);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    Py_ssize_t i;
+    /* like single adds, the first key is added even without headroom */
+    for (i = start; i < num_keys && (i == start || num_new < max_new); i++) {
+        if (!hash_key(items[i], &h1, &h2)) {
+            Py_DECREF(seq);
+            return NULL;
+        }
+        out[i] = table_add_if_new(rows, num_rows, active_row, h1, h2, &num_new);
+    }
+    Py_DECREF(seq);
+
+    return Py_BuildValue("nL", i, (long long)num_new);
+}
+
+/* Bit masks hold one bit per row */
+#define MAX_MASK_ROWS 64
+
+static bool check_mask_table(PyArrayObject *table) {
+    if (!check_table(table)) {
+        return false;
+    }
+    if (PyArray_DIM(table, 0) > MAX_MASK_ROWS) {
+        PyErr_SetString(PyExc_RuntimeError, "descriptor table has too many rows for a bit mask");
+        return false;
+    }
+    return true;
+}
+
+static bool check_counts(PyArrayObject *counts, npy_intp num_rows) {
+    if (!PyArray_Check(counts) || !PyArray_ISCONTIGUOUS(counts) || PyArray_NDIM(counts) != 1 ||
+            PyArray_TYPE(counts) != NPY_INT64 || PyArray_DIM(counts, 0) != num_rows) {
+        PyErr_SetString(PyExc_RuntimeError, "counts must be an int64 array with one entry per row");
+        return false;
+    }
+    return true;
+}
+
+static uint64_t table_contains_mask(const int64_t *table, npy_intp num_rows, int64_t h1, int64_t h2) {
+    uint64_t mask = 0;
+    for (npy_intp row = 0; row < num_rows; row++) {
+        if (desc_contains(table + row * DESC_WIDTH, h1, h2)) {
+            mask |= (uint64_t)1 << row;
+        }
+    }
+    return mask;
+}
+
+/* Adds the key to every row at its current tick */
+static void table_add(const int64_t *table, npy_intp num_rows, int64_t h1, int64_t h2, int64_t *counts) {
+    const int64_t *row;
+    for (npy_intp i = 0; i < num_rows; i++) {
+        row = table + i * DESC_WIDTH;
+        counts[i] += desc_add(row, h1, h2, (uint8_t)row[DESC_TICK_MAX]);
+    }
+}
+
+PyObject* py_timing_bloom_multi_add(PyObject* self, PyObject* args) {
+    PyObject* key;
+    PyArrayObject* table;
+    PyArrayObject* counts;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OOO", &key, &table, &counts)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !check_counts(counts, PyArray_DIM(table, 0)) || !hash_key(key, &h1, &h2)) {
+        return NULL;
+    }
+
+    table_add(PyArray_DATA(table), PyArray_DIM(table, 0), h1, h2, PyArray_DATA(counts));
+    Py_RETURN_NONE;
+}
+
+PyObject* py_timing_bloom_multi_add_batch(PyObject* self, PyObject* args) {
+    PyObject* keys;
+    PyArrayObject* table;
+    PyArrayObject* counts;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OOO", &keys, &table, &counts)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_table(table) || !check_counts(counts, PyArray_DIM(table, 0))) {
+        return NULL;
+    }
+    PyObject *seq = PySequence_Fast(keys, "keys argument must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    const Py_ssize_t num_keys = PySequence_Fast_GET_SIZE(seq);
+    const int64_t *rows = PyArray_DATA(table);
+    const npy_intp num_rows = PyArray_DIM(table, 0);
+    int64_t *out = PyArray_DATA(counts);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    for (Py_ssize_t i = 0; i < num_keys; i++) {
+        if (!hash_key(items[i], &h1, &h2)) {
+            Py_DECREF(seq);
+            return NULL;
+        }
+        table_add(rows, num_rows, h1, h2, out);
+    }
+    Py_DECREF(seq);
+
+    Py_RETURN_NONE;
+}
+
+PyObject* py_timing_bloom_multi_contains_mask(PyObject* self, PyObject* args) {
+    PyObject* key;
+    PyArrayObject* table;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OO", &key, &table)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_mask_table(table) || !hash_key(key, &h1, &h2)) {
+        return NULL;
+    }
+
+    uint64_t mask = table_contains_mask(PyArray_DATA(table), PyArray_DIM(table, 0), h1, h2);
+    return PyLong_FromUnsignedLongLong(mask);
+}
+
+PyObject* py_timing_bloom_multi_contains_mask_batch(PyObject* self, PyObject* args) {
+    PyObject* keys;
+    PyArrayObject* table;
+    int64_t h1, h2;
+
+    if (!PyArg_ParseTuple(args, "OO", &keys, &table)) { 
+        PyErr_SetString(PyExc_RuntimeError, "Invalid arguments");
+        return NULL;
+    }
+    if (!check_mask_table(table)) {
+        return NULL;
+    }
+    PyObject *seq = PySequence_Fast(keys, "keys argument must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    npy_intp num_keys = PySequence_Fast_GET_SIZE(seq);
+    PyArrayObject *result = (PyArrayObject *)PyArray_SimpleNew(1, &num_keys, NPY_UINT64);
+    if (result == NULL) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+
+    const int64_t *rows = PyArray_DATA(table);
+    const npy_intp num_rows = PyArray_DIM(table, 0);
+    npy_uint64 *out = PyArray_DATA(result);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    for (npy_intp i = 0; i < num_keys; i++) {
+        if (!hash_key(items[i], &h1, &h2)) {
+            Py_DECREF(seq);
+            Py_DECREF(result);
+            return NULL;
+        }
+        out[i] = table_contains_mask(rows, num_rows, h1, h2);
+    }
+    Py_DECREF(seq);
+
+    return (PyObject *)result;
 }
 
 
@@ -168,6 +850,18 @@ static PyMethodDef module_methods[] = {
     {"timing_bloom_decay"    , py_timing_bloom_decay    , METH_VARARGS , timing_bloom_decay_docstring    }  , 
     {"timing_bloom_contains" , py_timing_bloom_contains , METH_VARARGS , timing_bloom_contains_docstring }  , 
     {"timing_bloom_add"      , py_timing_bloom_add      , METH_VARARGS , timing_bloom_add_docstring      }  , 
+    {"timing_bloom_multi_contains"       , py_timing_bloom_multi_contains       , METH_VARARGS , timing_bloom_multi_contains_docstring       }  , 
+    {"timing_bloom_multi_contains_batch" , py_timing_bloom_multi_contains_batch , METH_VARARGS , timing_bloom_multi_contains_batch_docstring }  , 
+    {"timing_bloom_add_batch"            , py_timing_bloom_add_batch            , METH_VARARGS , timing_bloom_add_batch_docstring            }  , 
+    {"timing_bloom_multi_last_seen"        , py_timing_bloom_multi_last_seen        , METH_VARARGS , timing_bloom_multi_last_seen_docstring        }  , 
+    {"timing_bloom_multi_contains_between"       , py_timing_bloom_multi_contains_between       , METH_VARARGS , timing_bloom_multi_contains_between_docstring       }  , 
+    {"timing_bloom_multi_contains_between_batch" , py_timing_bloom_multi_contains_between_batch , METH_VARARGS , timing_bloom_multi_contains_between_batch_docstring }  , 
+    {"timing_bloom_multi_add"                    , py_timing_bloom_multi_add                    , METH_VARARGS , timing_bloom_multi_add_docstring                    }  , 
+    {"timing_bloom_multi_add_batch"              , py_timing_bloom_multi_add_batch              , METH_VARARGS , timing_bloom_multi_add_batch_docstring              }  , 
+    {"timing_bloom_multi_contains_mask"          , py_timing_bloom_multi_contains_mask          , METH_VARARGS , timing_bloom_multi_contains_mask_docstring          }  , 
+    {"timing_bloom_multi_contains_mask_batch"    , py_timing_bloom_multi_contains_mask_batch    , METH_VARARGS , timing_bloom_multi_contains_mask_batch_docstring    }  , 
+    {"timing_bloom_multi_add_if_new"       , py_timing_bloom_multi_add_if_new       , METH_VARARGS , timing_bloom_multi_add_if_new_docstring       }  , 
+    {"timing_bloom_multi_add_if_new_batch" , py_timing_bloom_multi_add_if_new_batch , METH_VARARGS , timing_bloom_multi_add_if_new_batch_docstring }  , 
     {NULL                    , NULL                     , 0            , NULL                            } 
 };
  
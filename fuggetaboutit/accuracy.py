@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+Streams synthetic keys through ``ScalingTimingBloomFilter`` in simulated time
+and measures how accurate it really is for every combination of the given
+settings, against the memory it used and how fast it went::
+
+    $ python -m fuggetaboutit.accuracy --num-keys 2e6 --pattern spike \\
+          --error 0.01 0.001 --growth-factor 2 4 --output accuracy.json
+
+Keys arrive over ``--duration`` simulated seconds following ``--pattern``
+on a ``ManualClock`` and the bloom is decayed every tick by a
+``ClockTicker``.  Every
+``--measure-interval`` seconds the bloom is probed with samples of:
+
+* keys that were never added, for the false positive rate
+* keys that expired more than a tick ago, for the stale positive rate
+* keys added within the window, for the false negative rate
+* keys within two ticks of the end of the window, whose expiry depends on
+  tick rounding, for the boundary false negative rate
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+
+from .clocks import ManualClock
+from .scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from .tickers import ClockTicker
+
+START_TIME = 1e9
+
+RATE_PATTERNS = {
+    'constant': lambda x: np.ones_like(x),
+    'spike': lambda x: np.where((0.4 <= x) & (x < 0.5), 10.0, 1.0),
+    'diurnal': lambda x: 1.5 + np.sin(8 * np.pi * x),
+    'ramp': lambda x: 0.1 + x,
+}
+SETTINGS = ('error', 'error_tightening_ratio', 'growth_factor', 'max_fill_factor', 'min_fill_factor')
+
+
+def get_arrival_times(pattern, num_keys, duration, rng):
+    """
+    Returns sorted arrival times, in seconds from the start, of ``num_keys``
+    keys whose rate over time follows ``pattern``
+    """
+    grid = np.linspace(0, duration, 10001)
+    rate = RATE_PATTERNS[pattern](grid / duration)
+    cumulative = np.concatenate(([0.0], np.cumsum((rate[1:] + rate[:-1]) / 2.0)))
+    cumulative /= cumulative[-1]
+    return np.interp(np.sort(rng.random_sample(num_keys)), cumulative, grid)
+
+
+def get_key(i):
+    return 'k%d' % i
+
+
+class Simulation(object):
+    def __init__(self, args, settings):
+        self.args = args
+        self.settings = settings
+        self.rng = np.random.RandomState(args.seed)
+        self.times = get_arrival_times(args.pattern, args.num_keys, args.duration, self.rng)
+        self.measurements = []
+        self.num_negatives = 0
+        self.max_nbytes = 0
+        self.max_blooms = 0
+
+    def sample(self, lo, hi):
+        if hi <= lo:
+            return []
+        return [get_key(i) for i in self.rng.randint(lo, hi, size=self.args.samples)]
+
+    def get_rate(self, bloom, keys):
+        if not keys:
+            return None
+        return float(np.count_nonzero(bloom.contains_batch(keys))) / len(keys)
+
+    def measure(self, bloom, now, num_added):
+        decay_time = self.args.decay_time
+        seconds_per_tick = bloom.seconds_per_tick
+        added = self.times[:num_added]
+        # indexes of the keys added before each age bound
+        window_start = np.searchsorted(added, now - decay_time + 2 * seconds_per_tick)
+        boundary_start = np.searchsorted(added, now - decay_time)
+        expired_end = np.searchsorted(added, now - decay_time - seconds_per_tick)
+
+        negatives = ['n%d' % i for i in xrange(self.num_negatives, self.num_negatives + self.args.samples)]
+        self.num_negatives += self.args.samples
+        self.measurements.append({
+            'time': now,
+            'size': bloom.get_size(),
+            'nbytes': bloom.get_data_nbytes(),
+            'blooms': len(bloom.blooms),
+            'expected_error': bloom.get_expected_error(),
+            'fp_rate': self.get_rate(bloom, negatives),
+            'stale_rate': self.get_rate(bloom, self.sample(0, expired_end)),
+            'fn_rate': self.invert(self.get_rate(bloom, self.sample(window_start, num_added))),
+            'boundary_fn_rate': self.invert(self.get_rate(bloom, self.sample(boundary_start, window_start))),
+        })
+
+    def invert(self, rate):
+        return None if rate is None else 1 - rate
+
+    def run(self):
+        args = self.args
+        clock = ManualClock(START_TIME)
+        bloom = ScalingTimingBloomFilter(
+            capacity=args.capacity, decay_time=args.decay_time,
+            ticker=ClockTicker(clock), clock=clock, **self.settings
+        )
+        next_measure = args.measure_interval
+        measure_seconds = 0.0
+
+        start = time.time()
+        for i, arrival in enumerate(self.times):
+            while next_measure <= arrival:
+                clock.set(START_TIME + next_measure)
+                measure_start = time.time()
+                self.measure(bloom, next_measure, i)
+                measure_seconds += time.time() - measure_start
+                next_measure += args.measure_interval
+            clock.set(START_TIME + arrival)
+            bloom.add(get_key(i))
+            if not i % 1000:
+                self.max_nbytes = max(self.max_nbytes, bloom.get_data_nbytes())
+                self.max_blooms = max(self.max_blooms, len(bloom.blooms))
+        elapsed = time.time() - start - measure_seconds
+
+        return self.summarize(args.num_keys / elapsed if elapsed else None)
+
+    def summarize(self, ops_per_second):
+        summary = dict(self.settings)
+        for rate in ('fp_rate', 'stale_rate', 'fn_rate', 'boundary_fn_rate', 'expected_error'):
+            values = [m[rate] for m in self.measurements if m[rate] is not None]
+            summary[rate] = float(np.mean(values)) if values else None
+            summary['max_' + rate] = max(values) if values else None
+        summary['max_nbytes'] = self.max_nbytes
+        summary['max_blooms'] = self.max_blooms
+        summary['ops_per_second'] = ops_per_second
+        summary['measurements'] = self.measurements
+        return summary
+
+
+def get_settings(args):
+    values = [getattr(args, setting) for setting in SETTINGS]
+    for combination in itertools.product(*values):
+        settings = dict(zip(SETTINGS, combination))
+        if settings['min_fill_factor'] is not None and \
+                settings['min_fill_factor'] >= settings['max_fill_factor']:
+            continue
+        yield settings
+
+
+def print_summary(summary, stream):
+    def rate(value):
+        return '%.2e' % value if value is not None else '-'
+    stream.write("error=%g tightening=%g growth=%g fill=%s..%g  fp=%s stale=%s fn=%s boundary_fn=%s  "
+                 "%.1fMB %d blooms %.0f adds/s\n" % (
+        summary['error'], summary['error_tightening_ratio'], summary['growth_factor'],
+        summary['min_fill_factor'], summary['max_fill_factor'],
+        rate(summary['fp_rate']), rate(summary['stale_rate']),
+        rate(summary['fn_rate']), rate(summary['boundary_fn_rate']),
+        summary['max_nbytes'] / 1e6, summary['max_blooms'], summary['ops_per_second'] or 0,
+    ))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Measure the accuracy of ScalingTimingBloomFilter settings")
+    number = lambda value: int(float(value))
+    optional_float = lambda value: None if value.lower() == 'none' else float(value)
+    parser.add_argument('--num-keys', type=number, default=int(2e5))
+    parser.add_argument('--duration', type=float, default=4 * 3600,
+                        help="Simulated seconds the keys arrive over")
+    parser.add_argument('--decay-time', type=float, default=3600)
+    parser.add_argument('--pattern', choices=sorted(RATE_PATTERNS), default='constant')
+    parser.add_argument('--capacity', type=number, default=None,
+                        help="Initial capacity, defaults to a quarter of the keys in a window")
+    parser.add_argument('--measure-interval', type=float, default=None,
+                        help="Simulated seconds between measurements, defaults to half the decay time")
+    parser.add_argument('--samples', type=int, default=2000, help="Keys probed per rate per measurement")
+    parser.add_argument('--error', type=float, nargs='+', default=[0.005])
+    parser.add_argument('--error-tightening-ratio', type=float, nargs='+', default=[0.5])
+    parser.add_argument('--growth-factor', type=float, nargs='+', default=[2])
+    parser.add_argument('--max-fill-factor', type=float, nargs='+', default=[0.8])
+    parser.add_argument('--min-fill-factor', type=optional_float, nargs='+', default=[0.2])
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    if args.capacity is None:
+        args.capacity = max(int(args.num_keys * args.decay_time / args.duration / 4), 100)
+    if args.measure_interval is None:
+        args.measure_interval = args.decay_time / 2.0
+
+    results = []
+    for settings in get_settings(args):
+        summary = Simulation(args, settings).run()
+        print_summary(summary, sys.stderr)
+        results.append(summary)
+
+    output = {'config': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2)
+    return output
+
+
+if __name__ == "__main__":
+    main()
@@ -1,124 +1,343 @@
 #!/usr/bin/env python
+"""
+Benchmarks the blooms across sizes, tick widths and layouts and writes the
+results as JSON so that runs can be compared between releases::
 
-from fuggetaboutit import ScalingTimingBloomFilter, TimingBloomFilter
+    $ python -m fuggetaboutit.benchmark --sizes 1e4 1e6 --output new.json
+    $ python -m fuggetaboutit.benchmark --sizes 1e4 1e6 --compare old.json
 
-import time
+Keys are generated before any timing starts and every benchmark is repeated
+``--repeat`` times, keeping the fastest run.  The layouts are a single
+``TimingBloomFilter`` ("timing"), a ``ScalingTimingBloomFilter`` with one
+sub-bloom ("scaling") and one that has scaled to three sub-blooms
+("scaled").  Every sub-bloom is pre-filled to ``--fill`` of the items it
+holds before scaling (``max_fill_factor`` of its capacity), counting the
+keys added by the benchmarks, so lookups see realistic densities and the
+layouts don't scale any further.  Benchmarks that add keys get a fresh bloom
+for every run.
+"""
+
+import argparse
+import json
+import math
+import platform
 import random
+import shutil
 import string
-from functools import wraps
-
-def time_benchmark(fxn):
-    @wraps(fxn)
-    def _(*args, **kwargs):
-        start = time.time()
-        fxn(*args, **kwargs)
-        return time.time() - start
-    return _
-
-def key(N=5):
-    return "".join(random.sample(string.ascii_lowercase, N))
-
-@time_benchmark
-def bench_keygen(N):
-    for i in xrange(N):
-        t = key()
-
-@time_benchmark
-def bench_add(bloom, N):
-    for i in xrange(N):
-        bloom.add(key())
-
-@time_benchmark
-def bench_contains(bloom, N):
-    for i in xrange(N):
-        t = key() in bloom
-
-@time_benchmark
-def bench_decay(bloom, N):
-    for i in xrange(N):
-        bloom.decay()
-
-def print_benchmark(b):
-    print "Benchmarking blooms with size %d" % b["metadata"]["N"]
-    print "(baseline timing of keygeneration: %.2es, already subtracted from results)" % b["metadata"]["baseline"]
-
-    test_names = [t["fxn"].func_name for t in b["metadata"]["tests"]]
-    l = "| %s | " % (" "*34) + " | ".join(test_names) + " |"
-    print '.' + ("-" * (len(l)-2)) + '.'
-    print l
-    print '|' + ("=" * (len(l)-2)) + '|'
-    for result in b["data"]:
-        print ("| %34s |" % result["name"]),
-        for t in test_names:
-            n = len(t) - 7
-            print ("%%.%des" % n) % result["result"][t], "|",
-        print ""
-    print "'" + ("-" * (len(l)-2)) + "'"
-
-
-
-def benchmark():
-    N = int(1e5)
-    n = int(1e4)
-    d = 10
-    stbf = ScalingTimingBloomFilter(N, decay_time=d)
-    sstbf = ScalingTimingBloomFilter(N, decay_time=d)
-    tbf  = TimingBloomFilter(N, decay_time=d)
-
-    # Add a bunch of values so that this bloom has to scale up
-    for i in xrange(int(N*1.5)):
-        sstbf.add(key())
-
-    baseline = bench_keygen(N) / float(N)
-    tests = [
-        {
-            "fxn" : bench_add,
-            "N" : n,
-        },
-        {
-            "fxn" : bench_contains,
-            "N" : n,
-        },
-        {
-            "fxn" : bench_decay,
-            "N" : 10,
-        },
-    ]
-    results = {
-        "data" : [
-            {
-                "name" : "Timing Bloom Filter",
-                "object" : tbf,
-            },
-            {
-                "name" : "Scaling Timing Bloom Filter",
-                "object" : stbf,
-            },
-            {
-                "name" : "Scaled Scaling Timing Bloom Filter",
-                "object" : sstbf,
-            },
-        ],
-        "metadata" : {
-            "baseline" : baseline,
-            "N" : N,
-            "d" : d,
-            "tests" : tests
-        }
+import sys
+import tempfile
+from timeit import default_timer
+
+import numpy as np
+
+from . import _optimizations
+from .scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from .timing_bloom_filter import TimingBloomFilter
+
+DECAY_TIME = 86400
+MAX_FILL_FACTOR = 0.8
+LAYOUTS = ('timing', 'scaling', 'scaled')
+TICK_BITS = (4, 8)
+
+
+def get_keys(n, seed, length=16):
+    rng = random.Random(seed)
+    letters = string.ascii_letters + string.digits
+    return [''.join(rng.choice(letters) for _ in xrange(length)) for _ in xrange(n)]
+
+
+def fill_bloom(bloom, num_items, rng):
+    """
+    Sets as many buckets of a ``TimingBloomFilter`` to the current tick as
+    ``num_items`` keys would, without going through ``add``
+    """
+    fill = 1 - math.exp(-bloom.num_hashes * num_items / float(bloom.num_bytes))
+    tick = bloom.get_tick()
+    cells = np.where(rng.random_sample(bloom.num_bytes) < fill, tick, 0).astype(np.uint8)
+    bloom.set_cells(cells)
+
+
+def get_sub_blooms(bloom):
+    return getattr(bloom, 'blooms', [bloom])
+
+
+def get_adding_bloom(bloom):
+    """
+    Returns the sub-bloom that adds go to while it has room
+    """
+    if hasattr(bloom, 'blooms'):
+        return next(iter(bloom.get_bloom_iter()))
+    return bloom
+
+
+def make_bloom(layout, size, tick_bits):
+    disable_optimizations = tick_bits == 8
+    if layout == 'timing':
+        return TimingBloomFilter(size, decay_time=DECAY_TIME,
+                                 disable_optimizations=disable_optimizations)
+
+    bloom = ScalingTimingBloomFilter(size, decay_time=DECAY_TIME, max_fill_factor=MAX_FILL_FACTOR,
+                                     disable_optimizations=disable_optimizations)
+    if layout == 'scaled':
+        bloom._add_new_bloom()
+        bloom._add_new_bloom()
+    return bloom
+
+
+class Case(object):
+    """
+    A bloom with pre-generated ``positives`` that were added to it and
+    ``negatives`` that weren't.  The keys are cut down to what the bloom
+    can take twice over, once as positives and once from the benchmarks that
+    add, while staying under ``max_fill_factor``.
+    """
+    def __init__(self, layout, size, tick_bits, positives, negatives, fill, rng):
+        self.layout = layout
+        self.size = size
+        self.tick_bits = tick_bits
+        self.fill = fill
+        self.rng = rng
+        self.bloom = make_bloom(layout, size, tick_bits)
+
+        adding_bloom = get_adding_bloom(self.bloom)
+        max_items = MAX_FILL_FACTOR * adding_bloom.capacity
+        # leave a margin since the size of a bloom is only estimated
+        num_keys = int(min(len(positives), fill * max_items, 0.9 * (1 - fill) * max_items))
+        self.positives = positives[:num_keys]
+        self.negatives = negatives[:num_keys]
+        self._all_positives = positives
+        self._all_negatives = negatives
+
+        for sub_bloom in get_sub_blooms(self.bloom):
+            num_items = fill * MAX_FILL_FACTOR * sub_bloom.capacity
+            if sub_bloom is adding_bloom:
+                num_items -= num_keys
+            if num_items > 0:
+                fill_bloom(sub_bloom, num_items, rng)
+        for key in self.positives:
+            self.bloom.add(key)
+
+    def fresh(self):
+        """
+        Returns a new case like this one, for benchmarks that add keys
+        """
+        return Case(self.layout, self.size, self.tick_bits, self._all_positives,
+                    self._all_negatives, self.fill, self.rng)
+
+
+def bench_add(case):
+    case = case.fresh()
+    add = case.bloom.add
+    keys = case.negatives
+    start = default_timer()
+    for key in keys:
+        add(key)
+    return default_timer() - start, len(keys)
+
+def bench_add_batch(case):
+    case = case.fresh()
+    keys = case.negatives
+    start = default_timer()
+    case.bloom.add_batch(keys)
+    return default_timer() - start, len(keys)
+
+def bench_add_if_new_batch(case):
+    if not hasattr(case.bloom, 'add_if_new_batch'):
+        return None
+    case = case.fresh()
+    # half of the keys are in the bloom and half are fresh
+    keys = case.positives + case.negatives
+    start = default_timer()
+    case.bloom.add_if_new_batch(keys)
+    return default_timer() - start, len(keys)
+
+def _bench_contains(case, keys):
+    contains = case.bloom.contains
+    start = default_timer()
+    for key in keys:
+        contains(key)
+    return default_timer() - start, len(keys)
+
+def bench_contains_hit(case):
+    return _bench_contains(case, case.positives)
+
+def bench_contains_miss(case):
+    return _bench_contains(case, case.negatives)
+
+def _bench_contains_batch(case, keys):
+    if not hasattr(case.bloom, 'contains_batch'):
+        return None
+    start = default_timer()
+    case.bloom.contains_batch(keys)
+    return default_timer() - start, len(keys)
+
+def bench_contains_batch_hit(case):
+    return _bench_contains_batch(case, case.positives)
+
+def bench_contains_batch_miss(case):
+    return _bench_contains_batch(case, case.negatives)
+
+def bench_decay(case):
+    start = default_timer()
+    case.bloom.decay()
+    return default_timer() - start, 1
+
+def bench_save_load(case):
+    path = tempfile.mkdtemp()
+    try:
+        start = default_timer()
+        case.bloom.save(path)
+        type(case.bloom).load(path)
+        return default_timer() - start, 1
+    finally:
+        shutil.rmtree(path)
+
+def bench_scale_up(case):
+    if case.layout != 'scaling':
+        return None
+    bloom = make_bloom(case.layout, case.size, case.tick_bits)
+    start = default_timer()
+    bloom._add_new_bloom()
+    return default_timer() - start, 1
+
+BENCHMARKS = [
+    bench_add,
+    bench_add_batch,
+    bench_add_if_new_batch,
+    bench_contains_hit,
+    bench_contains_miss,
+    bench_contains_batch_hit,
+    bench_contains_batch_miss,
+    bench_decay,
+    bench_save_load,
+    bench_scale_up,
+]
+BENCHMARKS_BY_NAME = dict((fxn.func_name[len('bench_'):], fxn) for fxn in BENCHMARKS)
+
+
+def run_benchmark(fxn, case, repeat):
+    timings = []
+    for _ in xrange(repeat):
+        timing = fxn(case)
+        if timing is None:
+            return None
+        timings.append(timing)
+    seconds, ops = min(timings)
+    return {
+        'benchmark': fxn.func_name[len('bench_'):],
+        'layout': case.layout,
+        'size': case.size,
+        'tick_bits': case.tick_bits,
+        'ops': ops,
+        'seconds': seconds,
+        'per_op': seconds / ops,
+        'timings': [timing[0] for timing in timings],
+    }
+
+
+def get_metadata(args):
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'optimizations': _optimizations is not None,
+        'num_keys': args.num_keys,
+        'fill': args.fill,
+        'repeat': args.repeat,
+        'seed': args.seed,
     }
 
-    for item in results["data"]:
-        result = {}
-        b = item["object"]
-        for test in tests:
-            name = test["fxn"].func_name
-            n = test["N"]
-            value = test["fxn"](b, n) / float(n)
-            result[name] = value - baseline
-        item["result"] = result
 
-    return results
+def benchmark(args):
+    results = []
+    rng = np.random.RandomState(args.seed)
+    for size in args.sizes:
+        num_keys = min(args.num_keys, size)
+        positives = get_keys(num_keys, seed=args.seed + 2 * size)
+        negatives = get_keys(num_keys, seed=args.seed + 2 * size + 1)
+        for tick_bits in args.tick_bits:
+            for layout in args.layouts:
+                case = Case(layout, size, tick_bits, positives, negatives, args.fill, rng)
+                for name in args.benchmarks:
+                    result = run_benchmark(BENCHMARKS_BY_NAME[name], case, args.repeat)
+                    if result is not None:
+                        results.append(result)
+                        print_result(result, sys.stderr)
+    return {'metadata': get_metadata(args), 'results': results}
+
+
+def get_result_key(result):
+    return (result['benchmark'], result['layout'], result['size'], result['tick_bits'])
+
+
+def compare(old, new, threshold):
+    """
+    Returns (result, old per_op, ratio) for every result of ``new`` that got
+    more than ``threshold`` slower than in ``old``
+    """
+    old_results = dict((get_result_key(result), result) for result in old['results'])
+    regressions = []
+    for result in new['results']:
+        old_result = old_results.get(get_result_key(result))
+        if old_result is None:
+            continue
+        ratio = result['per_op'] / old_result['per_op']
+        if ratio > 1 + threshold:
+            regressions.append((result, old_result['per_op'], ratio))
+    return regressions
+
+
+def print_result(result, stream):
+    stream.write("%-20s %-8s %12d %2d-bit %.4es/op\n" % (
+        result['benchmark'], result['layout'], result['size'],
+        result['tick_bits'], result['per_op'],
+    ))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the fuggetaboutit blooms")
+    parser.add_argument('--sizes', type=lambda size: int(float(size)), nargs='+',
+                        default=[int(1e4), int(1e5), int(1e6)],
+                        help="Capacities to benchmark, up to 1e9 memory permitting")
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument('--tick-bits', type=int, nargs='+', choices=TICK_BITS, default=[4],
+                        help="4 bit ticks use the C optimizations, 8 bit ticks the pure python paths")
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS_BY_NAME),
+                        default=[fxn.func_name[len('bench_'):] for fxn in BENCHMARKS])
+    parser.add_argument('--num-keys', type=int, default=int(1e4),
+                        help="Number of keys per add/contains benchmark")
+    parser.add_argument('--fill', type=float, default=0.5,
+                        help="Fraction of max_fill_factor every sub-bloom is filled to before benchmarking")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    parser.add_argument('--compare', default=None,
+                        help="JSON results of an earlier run to check for regressions against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Fraction by which a benchmark can get slower before it's a regression")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    results = benchmark(args)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as old_file:
+            regressions = compare(json.load(old_file), results, args.threshold)
+        for result, old_per_op, ratio in regressions:
+            sys.stderr.write("REGRESSION %.2fx (was %.4es/op): " % (ratio, old_per_op))
+            print_result(result, sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
 
 if __name__ == "__main__":
-    result = benchmark()
-    print_benchmark(result)
+    sys.exit(main())
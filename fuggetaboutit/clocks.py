@@ -0,0 +1,81 @@
+import time
+
+
+class WallClock(object):
+    '''
+    Clock that reads the system time.  This is what the blooms use unless
+    they're given another clock.
+    '''
+    def time(self):
+        return time.time()
+
+    def observe(self, timestamp):
+        pass
+
+    def add_listener(self, listener):
+        raise NotImplementedError("The wall clock can't notify listeners, use a TornadoTicker")
+
+
+class ManualClock(object):
+    '''
+    Clock that only moves when it is told to, for simulations and
+    deterministic tests.  Listeners, like a ``ClockTicker``, are called with
+    the new time whenever the clock moves forward.
+    '''
+    def __init__(self, now=0.0):
+        self.now = now
+        self._listeners = []
+
+    def time(self):
+        return self.now
+
+    def observe(self, timestamp):
+        pass
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def set(self, now):
+        if now > self.now:
+            self.now = now
+            for listener in self._listeners:
+                listener(now)
+
+    def advance(self, seconds):
+        self.set(self.now + seconds)
+
+
+class WatermarkClock(ManualClock):
+    '''
+    Event time clock that follows the newest timestamp added to the blooms so
+    that a log of events can be replayed faster than real time.  Events older
+    than the watermark minus ``decay_time`` are dropped like they would have
+    been when they happened.
+    '''
+    def observe(self, timestamp):
+        self.set(timestamp)
+
+
+class CoarseClock(ManualClock):
+    '''
+    Clock that caches the time of another clock, the system time by default,
+    and only reads it again every ``resolution`` seconds when ``ticker``
+    calls ``refresh``.  Adds and contains then skip reading the time, at the
+    cost of ticks changing up to ``resolution`` seconds late.
+    '''
+    def __init__(self, ticker, resolution=0.1, clock=None):
+        self.clock = clock or WALL_CLOCK
+        self.resolution = resolution
+        self.ticker = ticker
+        super(CoarseClock, self).__init__(self.clock.time())
+        ticker.setup(self.refresh, resolution)
+        ticker.start()
+
+    def refresh(self):
+        self.set(self.clock.time())
+
+    def stop(self):
+        self.ticker.stop()
+
+
+WALL_CLOCK = WallClock()
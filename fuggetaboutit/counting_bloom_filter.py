@@ -1,4 +1,5 @@
 import logging
+import mmap
 import os
 import json
 import shutil
@@ -8,6 +9,7 @@ import math
 import mmh3
 
 from .exceptions import PersistenceDisabledException
+from .tracing import trace
 
 
 BLOOM_FILENAME = 'bloom.npy'
@@ -27,8 +29,9 @@ class CountingBloomFilter(object):
         self.data_path = data_path
         self.id = id
 
-        self.num_bytes = int(-capacity * math.log(error) / math.log(2)**2) + 1
+        self.num_bytes = self.get_num_bytes(capacity, error)
         self.num_hashes = int(self.num_bytes / capacity * math.log(2)) + 1
+        self.num_bytes = self._adjust_num_bytes(self.num_bytes)
 
         bloom_filename = None
 
@@ -44,6 +47,20 @@ class CountingBloomFilter(object):
             self.data = np.zeros((size,), dtype=np.uint8, order='C')
             self.num_non_zero = 0
 
+    @staticmethod
+    def get_num_bytes(capacity, error):
+        """
+        Returns the number of buckets needed to hold `capacity` items with the
+        given error
+        """
+        return int(-capacity * math.log(error) / math.log(2)**2) + 1
+
+    def _adjust_num_bytes(self, num_bytes):
+        """
+        Hook for subclasses that need to constrain the number of buckets
+        """
+        return num_bytes
+
     def get_indexes(self, key):
         """
         Generates the indicies corresponding to the given key
@@ -108,8 +125,32 @@ class CountingBloomFilter(object):
         """
         Returns the density of the bloom which can be used to determine if the bloom is "full"
         """
+        if self.num_non_zero >= self.num_bytes:
+            return float('inf')
         return -self.num_bytes * math.log(1 - self.num_non_zero / float(self.num_bytes)) / float(self.num_hashes) 
 
+    def get_current_error(self):
+        """
+        Returns the false positive rate implied by the current number of
+        non-zero buckets
+        """
+        return (self.num_non_zero / float(self.num_bytes)) ** self.num_hashes
+
+    def get_headroom(self, size):
+        """
+        Returns how many more buckets can become non-zero before the value of
+        `get_size` reaches `size`
+        """
+        max_non_zero = self.num_bytes * (1 - math.exp(-size * self.num_hashes / float(self.num_bytes)))
+        return max_non_zero - self.num_non_zero
+
+    def touch_pages(self):
+        """
+        Writes to every page of the bloom's data so that the memory is
+        resident before it is first used
+        """
+        self.data[::mmap.PAGESIZE] = self.data[::mmap.PAGESIZE]
+
     def get_meta(self):
         return {
             'capacity': self.capacity,
@@ -128,14 +169,15 @@ class CountingBloomFilter(object):
         data_path, meta_path, bloom_path = self._get_paths(data_path)
         tmp_data_path, tmp_meta_path, tmp_bloom_path = self._get_paths(data_path + '-tmp')
 
-        remove_recursive(tmp_data_path)
-        os.makedirs(tmp_data_path)
+        with trace('save', bloom=self, data_path=data_path, nbytes=self.data.nbytes):
+            remove_recursive(tmp_data_path)
+            os.makedirs(tmp_data_path)
 
-        self._save_meta(tmp_meta_path)
-        self._save_data(tmp_bloom_path)
+            self._save_meta(tmp_meta_path)
+            self._save_data(tmp_bloom_path)
 
-        remove_recursive(data_path)
-        os.rename(tmp_data_path, data_path)
+            remove_recursive(data_path)
+            os.rename(tmp_data_path, data_path)
 
     def _get_paths(self, data_path):
         if not (data_path or self.data_path):
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Drops the lines of a stream that were already seen within a time window::
+
+    $ tail -F access.log | fuggetaboutit-dedup --window 24h --capacity 1e8 --state /var/lib/dedup
+
+stdin is read ``--buffer-size`` bytes at a time and every buffer is split
+into lines with a single call.  The lines are checked against and added to a
+``ScalingTimingBloomFilter`` as a batch with ``add_if_new_batch`` and only
+the ones that weren't seen within the window are written to stdout.  Lines
+that were seen are added again, so a line is only written again once it went
+unseen for a whole window.  The bloom is loaded from ``--state`` when it
+exists, in which case ``--window`` and ``--capacity`` are ignored, and saved
+back on exit, including on SIGTERM.  Like with any bloom filter about
+``--error`` of the new lines are mistaken for ones that were seen and dropped.
+"""
+
+import argparse
+import errno
+import io
+import itertools
+import os
+import signal
+import sys
+import time
+
+from .clocks import CoarseClock
+from .scaling_timing_bloom_filter import ScalingTimingBloomFilter, META_FILENAME
+from .tickers import ClockTicker, NoOpTicker
+
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_window(value):
+    """
+    Parses a window like ``90``, ``30m``, ``24h`` or ``7d`` into seconds
+    """
+    if value[-1:] in WINDOW_UNITS:
+        return float(value[:-1]) * WINDOW_UNITS[value[-1]]
+    return float(value)
+
+
+def read_lines(stream, buffer_size=1 << 20):
+    """
+    Generates the list of complete lines, without their newlines, of every
+    ``buffer_size`` bytes read from ``stream``.  Reads return as soon as some
+    data is available so that slow streams aren't held back.
+    """
+    try:
+        fd = stream.fileno()
+        read = lambda: os.read(fd, buffer_size)
+    except (AttributeError, io.UnsupportedOperation):
+        read = lambda: stream.read(buffer_size)
+
+    remainder = ''
+    while True:
+        data = read()
+        if not data:
+            break
+        lines = data.split('\n')
+        if remainder:
+            lines[0] = remainder + lines[0]
+        remainder = lines.pop()
+        if lines:
+            yield lines
+    if remainder:
+        yield [remainder]
+
+
+def get_new_lines(bloom, lines):
+    """
+    Adds the lines to ``bloom`` and returns the ones it didn't contain, once
+    each and in order.  Lines that were seen are added again so that they're
+    remembered for another window from now.
+    """
+    return list(itertools.compress(lines, bloom.add_if_new_batch(lines).tolist()))
+
+
+def dedup(bloom, clock, input_stream, output_stream, buffer_size=1 << 20, counts=None):
+    """
+    Copies the new lines of ``input_stream`` to ``output_stream`` and returns
+    ``counts``, a list of the number of lines read, the number written and
+    the bytes read that is kept up to date as the stream is read.  ``clock``
+    is refreshed before every buffer.
+    """
+    counts = counts if counts is not None else [0, 0, 0]
+    for lines in read_lines(input_stream, buffer_size):
+        clock.refresh()
+        new_lines = get_new_lines(bloom, lines)
+        if new_lines:
+            output_stream.write('\n'.join(new_lines))
+            output_stream.write('\n')
+            output_stream.flush()
+        counts[0] += len(lines)
+        counts[1] += len(new_lines)
+        counts[2] += sum(itertools.imap(len, lines)) + len(lines)
+    return counts
+
+
+def get_bloom(args, clock):
+    ticker = ClockTicker(clock)
+    if os.path.exists(os.path.join(args.state, META_FILENAME)):
+        return ScalingTimingBloomFilter.load(args.state, ticker=ticker, clock=clock)
+    return ScalingTimingBloomFilter(
+        capacity=args.capacity, decay_time=args.window, error=args.error,
+        data_path=args.state, ticker=ticker, clock=clock,
+    )
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Drop lines of stdin that were seen within a window")
+    parser.add_argument('--window', type=parse_window, default=86400,
+                        help="How long lines are remembered, in seconds or with an s/m/h/d suffix")
+    parser.add_argument('--capacity', type=lambda value: int(float(value)), default=int(1e6),
+                        help="Expected number of distinct lines per window")
+    parser.add_argument('--error', type=float, default=0.001,
+                        help="Fraction of new lines that may be mistaken for seen ones")
+    parser.add_argument('--state', required=True,
+                        help="Directory the bloom is loaded from and saved to on exit")
+    parser.add_argument('--buffer-size', type=int, default=1 << 20, help="Bytes read at a time")
+    parser.add_argument('--quiet', action='store_true', help="Don't report the counts on exit")
+    return parser
+
+
+def main(argv=None, input_stream=None, output_stream=None):
+    args = get_parser().parse_args(argv)
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+
+    clock = CoarseClock(NoOpTicker())
+    bloom = get_bloom(args, clock)
+    start_time = time.time()
+    counts = [0, 0, 0]
+    try:
+        dedup(bloom, clock, input_stream or sys.stdin, output_stream or sys.stdout,
+              args.buffer_size, counts)
+    except KeyboardInterrupt:
+        pass
+    except IOError as e:
+        # whatever reads our output went away
+        if e.errno != errno.EPIPE:
+            raise
+    finally:
+        bloom.save()
+
+    elapsed = time.time() - start_time
+    if not args.quiet:
+        num_lines, num_new, num_bytes = counts
+        sys.stderr.write("%d lines, %d new, %.1f MB/s\n" % (
+            num_lines, num_new, num_bytes / 1e6 / elapsed if elapsed else 0,
+        ))
+    return counts
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import math
+
+import numpy as np
+
+from . import _optimizations
+from .tickers import NoOpTicker
+from .timing_bloom_filter import DESCRIPTOR_WIDTH, DESCRIPTOR_TICK_MIN
+
+# Probes return one bit per member
+MAX_MEMBERS = 64
+
+
+class FilterGroup(object):
+    '''
+    Group of ``TimingBloomFilter``s over the same stream of keys, with their
+    own ``decay_time`` and capacity, that hashes every key once and adds it
+    to or probes all of the members in a single call into C.  Probes return
+    a bit mask with bit ``i`` set when ``blooms[i]`` contains the key.
+
+    The group's ``ticker`` decays every member once per tick of that member.
+    The shortest tick is split into one slot per member and every member
+    decays in its own slot, so that when the ticks are multiples of the
+    shortest one, like for windows of 5 minutes, an hour and a day, no two
+    members decay at once.  The members must share a clock.
+
+    :param blooms: the members of the group
+    :type blooms: list of TimingBloomFilter
+
+    :param ticker: calls back to decay the members, by default nothing does
+    :type ticker: NoOpTicker, TornadoTicker or ClockTicker
+    '''
+    def __init__(self, blooms, ticker=None):
+        self.blooms = list(blooms)
+        if not 0 < len(self.blooms) <= MAX_MEMBERS:
+            raise ValueError("A group needs between 1 and %d blooms" % MAX_MEMBERS)
+        self.clock = self.blooms[0].clock
+        if any(bloom.clock is not self.clock for bloom in self.blooms):
+            raise ValueError("The blooms of a group must share a clock")
+
+        # The descriptor table of the members and the tick ranges and data
+        # arrays it was last filled in with.  The table is False when some
+        # member can't be probed from C.
+        self._table = None
+        self._table_ticks = None
+        self._table_data = None
+
+        now = self.clock.time()
+        self._next_decays = [self._get_next_decay(i, now) for i in xrange(len(self.blooms))]
+        self.ticker = ticker or NoOpTicker()
+        self.ticker.setup(self.decay, self.get_decay_interval())
+        self.ticker.start()
+
+    def get_decay_interval(self):
+        """
+        Returns the length of the slots the members decay in, which is how
+        often the ticker checks for members that are due
+        """
+        return min(bloom.seconds_per_tick for bloom in self.blooms) / len(self.blooms)
+
+    def _get_next_decay(self, i, now):
+        seconds_per_tick = self.blooms[i].seconds_per_tick
+        offset = i * self.get_decay_interval()
+        return (math.floor((now - offset) / seconds_per_tick) + 1) * seconds_per_tick + offset
+
+    def decay(self):
+        """
+        Decays the members whose turn has come and returns how many were
+        decayed
+        """
+        now = self.clock.time()
+        num_decayed = 0
+        for i, bloom in enumerate(self.blooms):
+            if now >= self._next_decays[i]:
+                bloom.decay()
+                self._next_decays[i] = self._get_next_decay(i, now)
+                num_decayed += 1
+        return num_decayed
+
+    def _get_table(self):
+        data = [bloom.data for bloom in self.blooms]
+        if self._table_data is None or any(a is not b for a, b in zip(data, self._table_data)):
+            self._table = self._build_table()
+            self._table_data = data
+        table = self._table
+        if table is False:
+            return None
+
+        tick_ranges = [bloom.get_tick_range() for bloom in self.blooms]
+        if tick_ranges != self._table_ticks:
+            table[:, DESCRIPTOR_TICK_MIN:] = tick_ranges
+            self._table_ticks = tick_ranges
+        return table
+
+    def _build_table(self):
+        self._table_ticks = None
+        for bloom in self.blooms:
+            if not (bloom._optimize and bloom.data.flags['C_CONTIGUOUS']):
+                return False
+
+        table = np.empty((len(self.blooms), DESCRIPTOR_WIDTH), dtype=np.int64)
+        for row, bloom in enumerate(self.blooms):
+            table[row] = bloom.get_descriptor()
+        return table
+
+    def add(self, key):
+        """
+        Adds the key to every member at the current time
+        """
+        table = self._get_table()
+        if table is None:
+            for bloom in self.blooms:
+                bloom.add(key)
+            return
+        counts = np.zeros((len(self.blooms),), dtype=np.int64)
+        _optimizations.timing_bloom_multi_add(key, table, counts)
+        self._add_counts(counts)
+
+    def add_batch(self, keys):
+        """
+        Adds the keys to every member at the current time
+        """
+        table = self._get_table()
+        if table is None:
+            for key in keys:
+                self.add(key)
+            return
+        counts = np.zeros((len(self.blooms),), dtype=np.int64)
+        _optimizations.timing_bloom_multi_add_batch(keys, table, counts)
+        self._add_counts(counts)
+
+    def _add_counts(self, counts):
+        for bloom, num_new in zip(self.blooms, counts.tolist()):
+            bloom.num_non_zero += num_new
+
+    def contains(self, key):
+        """
+        Returns a bit mask of the members that contain the key
+
+        :rtype: int
+        """
+        table = self._get_table()
+        if table is not None:
+            return _optimizations.timing_bloom_multi_contains_mask(key, table)
+        mask = 0
+        for i, bloom in enumerate(self.blooms):
+            if bloom.contains(key):
+                mask |= 1 << i
+        return mask
+
+    def contains_batch(self, keys):
+        """
+        Returns the bit mask of the members that contain each of the keys
+
+        :rtype: numpy.ndarray of uint64
+        """
+        table = self._get_table()
+        if table is None:
+            return np.array([self.contains(key) for key in keys], dtype=np.uint64)
+        return _optimizations.timing_bloom_multi_contains_mask_batch(keys, table)
+
+    def start(self):
+        """
+        Start the periodic decays of the members
+        """
+        self.ticker.start()
+
+    def stop(self):
+        """
+        Stop the periodic decays of the members
+        """
+        self.ticker.stop()
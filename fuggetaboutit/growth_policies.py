@@ -0,0 +1,71 @@
+import math
+
+
+class GeometricGrowthPolicy(object):
+    '''
+    Growth policy that gives sub-bloom ``bloom_id`` a capacity of
+    ``log(2) * capacity * growth_factor ** bloom_id``, or simply ``capacity``
+    when ``growth_factor`` is None.
+    '''
+    def __init__(self, growth_factor=2):
+        self.growth_factor = growth_factor
+
+    def setup(self, bloom):
+        pass
+
+    def get_capacity(self, bloom, bloom_id):
+        return self.scale_capacity(bloom.capacity, bloom_id)
+
+    def scale_capacity(self, capacity, bloom_id):
+        if self.growth_factor:
+            return int(math.log(2) * capacity * self.growth_factor ** bloom_id)
+        return capacity
+
+
+class RateGrowthPolicy(object):
+    '''
+    Growth policy that sizes new sub-blooms from the observed rate of distinct
+    inserts so that a single sub-bloom can hold a whole ``decay_time`` worth of
+    items while staying under ``max_fill_factor``.  Bursts therefore result in
+    one right-sized sub-bloom instead of a chain of small ones.
+
+    Capacities never drop below what ``fallback`` gives the first sub-bloom
+    and never exceed ``max_growth`` times the largest current sub-bloom, which
+    keeps a short burst from allocating a huge bloom.  ``fallback`` is used
+    until ``min_elapsed`` seconds have been observed and defaults to geometric
+    growth by the bloom's ``growth_factor``.
+    '''
+    def __init__(self, headroom=1.25, max_growth=16, min_elapsed=1.0, fallback=None):
+        self.headroom = headroom
+        self.max_growth = max_growth
+        self.min_elapsed = min_elapsed
+        self.fallback = fallback
+        self.start_time = None
+
+    def setup(self, bloom):
+        self.start_time = bloom.clock.time()
+        if self.fallback is None:
+            self.fallback = GeometricGrowthPolicy(bloom.growth_factor)
+        self.fallback.setup(bloom)
+
+    def get_insert_rate(self, bloom):
+        '''
+        Returns the number of distinct items inserted per second, estimated
+        from the items currently held by the bloom
+        '''
+        elapsed = min(bloom.clock.time() - self.start_time, bloom.decay_time)
+        if elapsed < self.min_elapsed or elapsed <= 0 or not bloom.blooms:
+            return None
+        return bloom.get_size() / elapsed
+
+    def get_capacity(self, bloom, bloom_id):
+        min_capacity = self.fallback.get_capacity(bloom, 0)
+        rate = self.get_insert_rate(bloom)
+        if rate is None:
+            return max(self.fallback.get_capacity(bloom, bloom_id), min_capacity)
+
+        capacity = rate * bloom.decay_time * self.headroom / bloom.max_fill_factor
+        if self.max_growth:
+            max_capacity = self.max_growth * max(b.capacity for b in bloom.blooms)
+            capacity = min(capacity, max_capacity)
+        return max(int(capacity), min_capacity)
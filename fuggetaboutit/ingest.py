@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Rebuilds a ``ScalingTimingBloomFilter`` from a log of events, replaying them
+in event time::
+
+    $ python -m fuggetaboutit.ingest events.log.gz --data-path /var/lib/bloom \\
+          --capacity 1e6 --decay-time 86400
+
+Every line of a log holds a key and its unix timestamp separated by
+``--separator`` (``key<TAB>timestamp`` by default or ``timestamp<TAB>key``
+with ``--timestamp-first``).  Lines are read ``--chunk-size`` at a time,
+parsed into a list of keys and an array of timestamps and handed to
+``add_batch``, which hashes the whole chunk in C.  The bloom runs on a
+``WatermarkClock`` with a ``ClockTicker`` so that it decays as the replayed
+time passes and events that are already older than ``decay_time`` are
+skipped.  Logs should be roughly sorted by time: events that arrive after
+newer ones have moved the clock past their window are dropped.
+"""
+
+import argparse
+import gzip
+import itertools
+import operator
+import os
+import sys
+import time
+
+import numpy as np
+
+from .clocks import WatermarkClock
+from .scaling_timing_bloom_filter import ScalingTimingBloomFilter, META_FILENAME
+from .tickers import ClockTicker
+
+
+class Progress(object):
+    """
+    Counts the rows seen by ``ingest`` and how fast they went by
+    """
+    def __init__(self):
+        self.rows = 0
+        self.added = 0
+        self.skipped = 0
+        self.malformed = 0
+        self.start_time = time.time()
+        self.event_time = None
+
+    def update(self, num_rows, num_skipped, num_malformed, event_time):
+        self.rows += num_rows
+        self.added += num_rows - num_skipped - num_malformed
+        self.skipped += num_skipped
+        self.malformed += num_malformed
+        self.event_time = event_time
+
+    def get_rows_per_second(self):
+        elapsed = time.time() - self.start_time
+        return self.rows / elapsed if elapsed > 0 else None
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'added': self.added,
+            'skipped': self.skipped,
+            'malformed': self.malformed,
+            'elapsed': time.time() - self.start_time,
+            'rows_per_second': self.get_rows_per_second(),
+            'event_time': self.event_time,
+        }
+
+
+def open_log(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_chunks(lines, chunk_size):
+    """
+    Splits an iterable of lines, like an open file, into lists of up to
+    ``chunk_size`` lines
+    """
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parse_line(line, separator, timestamp_first):
+    fields = line.rstrip('\r\n').split(separator, 1) if timestamp_first else \
+        line.rstrip('\r\n').rsplit(separator, 1)
+    if len(fields) != 2:
+        return None
+    if timestamp_first:
+        fields.reverse()
+    try:
+        return fields[0], float(fields[1])
+    except ValueError:
+        return None
+
+
+def parse_chunk(lines, separator='\t', timestamp_first=False):
+    """
+    Parses a chunk of lines into a list of keys and an array of timestamps.
+    Returns the keys, the timestamps and the number of malformed lines that
+    were dropped.
+    """
+    # When every line has exactly one separator the whole chunk can be split
+    # at once, which is a lot faster than splitting line by line.  As many
+    # separators as lines and none with two means one on every line.
+    blob = ''.join(lines)
+    if not blob.endswith('\n'):
+        blob += '\n'
+    if blob.count(separator) == len(lines) == blob.count('\n') and '\r' not in blob and \
+            max(itertools.imap(operator.methodcaller('count', separator), lines)) == 1:
+        fields = blob.replace('\n', separator).split(separator)
+        fields.pop()
+        if timestamp_first:
+            keys, timestamps = fields[1::2], fields[0::2]
+        else:
+            keys, timestamps = fields[0::2], fields[1::2]
+        try:
+            return keys, np.array(map(float, timestamps), dtype=np.float64), 0
+        except ValueError:
+            pass
+
+    # some line didn't parse, go through them one by one
+    parsed = [_parse_line(line, separator, timestamp_first) for line in lines]
+    parsed = [event for event in parsed if event is not None]
+    keys = [key for key, _ in parsed]
+    timestamps = np.array([timestamp for _, timestamp in parsed], dtype=np.float64)
+    return keys, timestamps, len(lines) - len(parsed)
+
+
+def iter_batches(lines, chunk_size=100000, separator='\t', timestamp_first=False):
+    """
+    Generates (keys, timestamps, number of lines, number of malformed lines)
+    for every chunk of ``lines``
+    """
+    for chunk in read_chunks(lines, chunk_size):
+        keys, timestamps, num_malformed = parse_chunk(chunk, separator, timestamp_first)
+        yield keys, timestamps, len(chunk), num_malformed
+
+
+def ingest(bloom, lines, chunk_size=100000, separator='\t', timestamp_first=False,
+           progress=None, report=None, report_interval=5.0):
+    """
+    Adds every event of ``lines`` to ``bloom`` in chunks and returns the
+    ``Progress``.  ``report`` is called with the progress at most every
+    ``report_interval`` seconds.
+    """
+    progress = progress or Progress()
+    next_report = time.time() + report_interval
+    batches = iter_batches(lines, chunk_size, separator, timestamp_first)
+    for keys, timestamps, num_rows, num_malformed in batches:
+        num_added = bloom.add_batch(keys, timestamps) if keys else 0
+        progress.update(num_rows, len(keys) - num_added, num_malformed, bloom.clock.time())
+
+        if report is not None and time.time() >= next_report:
+            report(progress)
+            next_report = time.time() + report_interval
+    return progress
+
+
+def print_progress(progress, stream=sys.stderr):
+    stream.write("%d rows (%d added, %d skipped, %d malformed) %.0f rows/s, event time %s\n" % (
+        progress.rows, progress.added, progress.skipped, progress.malformed,
+        progress.get_rows_per_second() or 0,
+        time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(progress.event_time))
+        if progress.event_time else '-',
+    ))
+
+
+def get_bloom(args, clock):
+    ticker = ClockTicker(clock)
+    if os.path.exists(os.path.join(args.data_path, META_FILENAME)):
+        return ScalingTimingBloomFilter.load(args.data_path, ticker=ticker, clock=clock)
+    return ScalingTimingBloomFilter(
+        capacity=args.capacity, decay_time=args.decay_time, error=args.error,
+        data_path=args.data_path, ticker=ticker, clock=clock,
+    )
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Rebuild a bloom from a log of timestamped keys")
+    number = lambda value: int(float(value))
+    parser.add_argument('logs', nargs='+', help="Log files, optionally gzipped, or - for stdin")
+    parser.add_argument('--data-path', required=True,
+                        help="Where the bloom is saved, an existing bloom there is added to")
+    parser.add_argument('--capacity', type=number, default=int(1e6))
+    parser.add_argument('--decay-time', type=float, default=86400)
+    parser.add_argument('--error', type=float, default=0.005)
+    parser.add_argument('--separator', default='\t')
+    parser.add_argument('--timestamp-first', action='store_true',
+                        help="Lines are timestamp<separator>key instead of key<separator>timestamp")
+    parser.add_argument('--chunk-size', type=number, default=100000, help="Lines per batch")
+    parser.add_argument('--progress-interval', type=float, default=5.0,
+                        help="Seconds between progress reports")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    bloom = get_bloom(args, WatermarkClock())
+
+    progress = Progress()
+    for path in args.logs:
+        log = open_log(path)
+        try:
+            ingest(bloom, log, chunk_size=args.chunk_size, separator=args.separator,
+                   timestamp_first=args.timestamp_first, progress=progress,
+                   report=print_progress, report_interval=args.progress_interval)
+        finally:
+            if log is not sys.stdin:
+                log.close()
+
+    bloom.save()
+    print_progress(progress)
+    return progress.summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""
+Drives a bloom from several processes and reports throughput and latency
+percentiles::
+
+    $ python -m fuggetaboutit.loadtest --processes 4 --duration 30 --spawn-server
+    $ python -m fuggetaboutit.loadtest --target inprocess --distribution zipf
+
+With ``--target server`` every process talks to a ``fuggetaboutit-server``
+(started by the load test with ``--spawn-server``) and with ``--target
+inprocess`` every process drives its own ``ScalingTimingBloomFilter``,
+decaying it inline every ``--decay-interval`` seconds like the tornado ticker
+would.  For in-process runs the requests that overlapped a decay, scale up or
+other traced event are also reported separately.
+
+Keys are drawn uniformly or from a Zipf distribution over ``--key-space``
+keys, or replayed from the lines of ``--replay``.  Latencies go into
+log-linear histograms in the style of HdrHistogram.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import socket
+import sys
+import time
+from timeit import default_timer
+
+import numpy as np
+
+from . import tracing
+from .scaling_timing_bloom_filter import ScalingTimingBloomFilter
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear latency histogram: every power of two of microseconds is split
+    into ``2 ** (sub_bucket_bits - 1)`` linear buckets so that values are kept
+    with a relative precision of ``2 ** (1 - sub_bucket_bits)``.  Values under
+    ``2 ** sub_bucket_bits`` microseconds are kept exactly.
+    """
+    def __init__(self, sub_bucket_bits=5, max_magnitude=40):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.counts = np.zeros(((max_magnitude + 1) * self.sub_buckets,), dtype=np.int64)
+        self.total = 0
+        self.max = 0.0
+
+    def get_index(self, micros):
+        micros = int(micros)
+        if micros < self.sub_buckets:
+            return micros
+        magnitude = micros.bit_length() - self.sub_bucket_bits
+        sub_bucket = micros >> magnitude
+        return min(magnitude * self.sub_buckets + sub_bucket, self.counts.shape[0] - 1)
+
+    def get_value(self, index):
+        """
+        Returns the highest latency, in seconds, that falls in bucket ``index``
+        """
+        magnitude, sub_bucket = divmod(index, self.sub_buckets)
+        if not magnitude:
+            return (sub_bucket + 1) / 1e6
+        return (((sub_bucket + 1) << magnitude) - 1) / 1e6
+
+    def record(self, seconds):
+        self.counts[self.get_index(seconds * 1e6)] += 1
+        self.total += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def get_percentile(self, percentile):
+        if not self.total:
+            return None
+        rank = int(math.ceil(percentile / 100.0 * self.total))
+        index = int(np.searchsorted(np.cumsum(self.counts), max(rank, 1)))
+        return min(self.get_value(index), self.max)
+
+    def summary(self):
+        summary = dict(('p%s' % percentile, self.get_percentile(percentile))
+                       for percentile in PERCENTILES)
+        summary['count'] = self.total
+        summary['max'] = self.max
+        return summary
+
+
+def iter_uniform_keys(args, rng):
+    while True:
+        for key in rng.randint(0, args.key_space, size=10000):
+            yield 'key-%d' % key
+
+def iter_zipf_keys(args, rng):
+    while True:
+        for key in rng.zipf(args.zipf_exponent, size=10000):
+            yield 'key-%d' % ((key - 1) % args.key_space)
+
+def iter_replayed_keys(args, worker_id):
+    with open(args.replay) as replay:
+        keys = [line.strip() for line in replay if line.strip()]
+    return itertools.cycle(keys[worker_id::args.processes] or keys)
+
+def get_keys(args, worker_id):
+    if args.replay:
+        return iter_replayed_keys(args, worker_id)
+    rng = np.random.RandomState(args.seed + worker_id)
+    if args.distribution == 'zipf':
+        return iter_zipf_keys(args, rng)
+    return iter_uniform_keys(args, rng)
+
+
+class InProcessTarget(object):
+    """
+    Drives a bloom in the worker process and decays it inline
+    """
+    def __init__(self, args):
+        self.bloom = ScalingTimingBloomFilter(
+            capacity=args.capacity, decay_time=args.decay_time, error=args.error,
+        )
+        self.decay_interval = args.decay_interval
+        self.next_decay = time.time() + self.decay_interval
+        self.had_event = False
+        tracing.add_hook(self._on_event)
+
+    def _on_event(self, event, phase, info):
+        self.had_event = True
+
+    def _maybe_decay(self):
+        if self.decay_interval and time.time() >= self.next_decay:
+            self.next_decay += self.decay_interval
+            self.bloom.decay()
+
+    def add(self, keys):
+        self._maybe_decay()
+        for key in keys:
+            self.bloom.add(key)
+
+    def contains(self, keys):
+        self._maybe_decay()
+        for key in keys:
+            self.bloom.contains(key)
+
+    def pop_event(self):
+        had_event, self.had_event = self.had_event, False
+        return had_event
+
+    def close(self):
+        tracing.remove_hook(self._on_event)
+
+
+class ServerTarget(object):
+    """
+    Sends every request to a ``fuggetaboutit-server`` and waits for the reply
+    """
+    def __init__(self, args):
+        if args.unix_socket:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(args.unix_socket)
+        else:
+            self.socket = socket.create_connection((args.address, args.port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.socket.makefile('r')
+
+    def request(self, command, keys):
+        self.socket.sendall('%s %s\n' % (command, ' '.join(keys)))
+        reply = self.reader.readline()
+        if not reply.startswith('+'):
+            raise Exception("Server replied %r" % reply)
+
+    def add(self, keys):
+        self.request('ADD', keys)
+
+    def contains(self, keys):
+        self.request('CONTAINS', keys)
+
+    def pop_event(self):
+        return False
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+def get_target(args):
+    if args.target == 'inprocess':
+        return InProcessTarget(args)
+    return ServerTarget(args)
+
+
+def run_worker(args, worker_id, results):
+    keys = get_keys(args, worker_id)
+    rng = np.random.RandomState(args.seed + 1000 + worker_id)
+    target = get_target(args)
+    histograms = {
+        'add': LatencyHistogram(),
+        'contains': LatencyHistogram(),
+        'events': LatencyHistogram(),
+    }
+    # worst latency in every second of the run to spot stalls
+    timeline = {}
+
+    start = time.time()
+    deadline = start + args.duration
+    try:
+        while True:
+            now = time.time()
+            if now >= deadline:
+                break
+            batch = list(itertools.islice(keys, args.batch_size))
+            if rng.random_sample() < args.add_ratio:
+                operation, fxn = 'add', target.add
+            else:
+                operation, fxn = 'contains', target.contains
+
+            request_start = default_timer()
+            fxn(batch)
+            latency = default_timer() - request_start
+
+            histograms[operation].record(latency)
+            if target.pop_event():
+                histograms['events'].record(latency)
+            second = int(now - start)
+            timeline[second] = max(timeline.get(second, 0.0), latency)
+    finally:
+        target.close()
+
+    results.put((worker_id, histograms, timeline, time.time() - start))
+
+
+def run_server(args):
+    from .server import main
+    main([
+        '--port', str(args.port), '--address', args.address,
+        '--capacity', str(args.capacity), '--decay-time', str(args.decay_time),
+        '--error', str(args.error),
+    ] + (['--unix-socket', args.unix_socket] if args.unix_socket else []))
+
+
+def wait_for_server(args, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            ServerTarget(args).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def loadtest(args):
+    server = None
+    if args.target == 'server' and args.spawn_server:
+        server = multiprocessing.Process(target=run_server, args=(args,))
+        server.daemon = True
+        server.start()
+        wait_for_server(args)
+
+    try:
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=run_worker, args=(args, worker_id, results))
+                   for worker_id in xrange(args.processes)]
+        for worker in workers:
+            worker.start()
+        worker_results = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    return summarize(args, worker_results)
+
+
+def summarize(args, worker_results):
+    histograms = {}
+    timeline = {}
+    elapsed = 0.0
+    for _, worker_histograms, worker_timeline, worker_elapsed in worker_results:
+        for name, histogram in worker_histograms.iteritems():
+            if name in histograms:
+                histograms[name].merge(histogram)
+            else:
+                histograms[name] = histogram
+        for second, latency in worker_timeline.iteritems():
+            timeline[second] = max(timeline.get(second, 0.0), latency)
+        elapsed = max(elapsed, worker_elapsed)
+
+    requests = histograms['add'].total + histograms['contains'].total
+    return {
+        'config': vars(args),
+        'elapsed': elapsed,
+        'requests': requests,
+        'requests_per_second': requests / elapsed if elapsed else None,
+        'keys_per_second': requests * args.batch_size / elapsed if elapsed else None,
+        'latency': dict((name, histogram.summary()) for name, histogram in histograms.iteritems()),
+        'max_latency_per_second': [timeline[second] for second in sorted(timeline)],
+    }
+
+
+def print_summary(summary, stream):
+    stream.write("%d requests in %.1fs: %.0f requests/s, %.0f keys/s\n" % (
+        summary['requests'], summary['elapsed'],
+        summary['requests_per_second'] or 0, summary['keys_per_second'] or 0,
+    ))
+    for name in ('add', 'contains', 'events'):
+        latency = summary['latency'][name]
+        if not latency['count']:
+            continue
+        stream.write("%-9s %8d  " % (name, latency['count']) + "  ".join(
+            "p%s=%.3fms" % (percentile, latency['p%s' % percentile] * 1e3)
+            for percentile in PERCENTILES
+        ) + "  max=%.3fms\n" % (latency['max'] * 1e3))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Load test a fuggetaboutit bloom")
+    parser.add_argument('--target', choices=('server', 'inprocess'), default='server')
+    parser.add_argument('--spawn-server', action='store_true',
+                        help="Start a server for the duration of the test")
+    parser.add_argument('--port', type=int, default=7654)
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--add-ratio', type=float, default=0.5,
+                        help="Fraction of the requests that are adds rather than contains")
+    parser.add_argument('--batch-size', type=int, default=1, help="Keys per request")
+    parser.add_argument('--distribution', choices=('uniform', 'zipf'), default='uniform')
+    parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    parser.add_argument('--key-space', type=int, default=int(1e7))
+    parser.add_argument('--replay', default=None, help="File with one key per line to replay")
+    parser.add_argument('--capacity', type=int, default=int(1e6))
+    parser.add_argument('--decay-time', type=float, default=60)
+    parser.add_argument('--decay-interval', type=float, default=1,
+                        help="Seconds between decays of in-process blooms")
+    parser.add_argument('--error', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    summary = loadtest(args)
+    print_summary(summary, sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(summary, output, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import ctypes
+import ctypes.util
+import mmap
+
+import numpy as np
+
+from .growth_policies import GeometricGrowthPolicy
+from .timing_bloom_filter import TimingBloomFilter
+
+try:
+    _mincore = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True).mincore
+    _mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+    _mincore.restype = ctypes.c_int
+except (OSError, TypeError, AttributeError):
+    _mincore = None
+
+
+def is_mapped(array):
+    '''
+    Whether the memory of ``array`` comes from a memory mapped file
+    '''
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, 'base', None)
+    return False
+
+
+def get_resident_bytes(array):
+    '''
+    Returns how many bytes of ``array`` are in pages that are resident in
+    memory or None if that can't be found out on this platform
+    '''
+    if _mincore is None or not array.nbytes:
+        return None
+    start = array.ctypes.data
+    aligned_start = start - start % mmap.PAGESIZE
+    length = start + array.nbytes - aligned_start
+    num_pages = (length + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+
+    pages = (ctypes.c_ubyte * num_pages)()
+    if _mincore(aligned_start, length, pages) != 0:
+        return None
+    resident = np.count_nonzero(np.frombuffer(pages, dtype=np.uint8) & 1)
+    return min(resident * mmap.PAGESIZE, array.nbytes)
+
+
+def get_bits_per_item(nbytes, num_items):
+    if not num_items:
+        return None
+    return nbytes * 8 / float(num_items)
+
+
+def get_bloom_memory_usage(bloom):
+    '''
+    Returns the memory held by a single ``TimingBloomFilter``
+    '''
+    nbytes = bloom.data.nbytes
+    return {
+        'id': bloom.id,
+        'nbytes': nbytes,
+        'num_cells': bloom.num_bytes,
+        'bits_per_cell': 8 // bloom._ENTRIES_PER_8BYTE,
+        'mapped': is_mapped(bloom.data),
+        'resident_bytes': get_resident_bytes(bloom.data),
+        'bits_per_item': get_bits_per_item(nbytes, bloom.get_size()),
+    }
+
+
+def estimate_memory(capacity, error=0.005, num_blooms=1, error_tightening_ratio=0.5,
+                    growth_factor=2, disable_optimizations=False, foldable=False):
+    '''
+    Estimates the memory a ``ScalingTimingBloomFilter`` created with these
+    arguments will hold once it has scaled to ``num_blooms`` sub-blooms, for
+    capacity planning.  ``decay_time`` doesn't matter since every tick takes
+    the same number of bits.
+
+    :rtype: dict
+    '''
+    policy = GeometricGrowthPolicy(growth_factor)
+    error_initial = error * (1 - error_tightening_ratio)
+    blooms = []
+    for bloom_id in xrange(num_blooms):
+        bloom_capacity = policy.scale_capacity(capacity, bloom_id)
+        nbytes = TimingBloomFilter.get_data_nbytes(
+            capacity=bloom_capacity,
+            error=error_initial * (error_tightening_ratio ** bloom_id),
+            disable_optimizations=disable_optimizations,
+            foldable=foldable,
+        )
+        blooms.append({
+            'id': bloom_id,
+            'capacity': bloom_capacity,
+            'nbytes': nbytes,
+            'bits_per_item': get_bits_per_item(nbytes, bloom_capacity),
+        })
+
+    total_bytes = sum(bloom['nbytes'] for bloom in blooms)
+    total_capacity = sum(bloom['capacity'] for bloom in blooms)
+    return {
+        'nbytes': total_bytes,
+        'capacity': total_capacity,
+        'bits_per_item': get_bits_per_item(total_bytes, total_capacity),
+        'blooms': blooms,
+    }
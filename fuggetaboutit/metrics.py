@@ -0,0 +1,115 @@
+"""
+Renders the health of a ``ScalingTimingBloomFilter`` in the Prometheus text
+exposition format and serves it from a tornado ``RequestHandler`` so it can be
+scraped and alerted on::
+
+    app = get_metrics_app(bloom)
+    app.listen(9654)
+
+Decay timings and operation counters are only included when the bloom was
+created with a ``BloomStats``.
+"""
+
+from tornado.web import Application, RequestHandler
+
+from .stats import COUNTER_NAMES
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % item for item in labels)
+
+
+class _MetricsWriter(object):
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lines = []
+
+    def add(self, name, metric_type, help_text, samples):
+        """
+        Adds a metric family where ``samples`` is a list of (suffix, labels,
+        value) tuples
+        """
+        name = '%s_%s' % (self.prefix, name)
+        self.lines.append('# HELP %s %s' % (name, help_text))
+        self.lines.append('# TYPE %s %s' % (name, metric_type))
+        for suffix, labels, value in samples:
+            self.lines.append('%s%s%s %s' % (name, suffix, _format_labels(labels), _format_value(value)))
+
+    def gauge(self, name, help_text, value):
+        self.add(name, 'gauge', help_text, [('', (), value)])
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def render_metrics(bloom, prefix='fuggetaboutit'):
+    """
+    Returns the metrics of ``bloom`` in the Prometheus text format
+
+    :param bloom: the bloom to describe
+    :type bloom: ScalingTimingBloomFilter
+
+    :param prefix: prefix of every metric name
+    :type prefix: str
+
+    :rtype: str
+    """
+    writer = _MetricsWriter(prefix)
+    writer.gauge('size', 'Approximate number of items in the filter', bloom.get_size())
+    writer.gauge('expected_error', 'Nominal false positive rate of the sub-blooms', bloom.get_expected_error())
+    writer.gauge('current_error', 'False positive rate implied by how full the sub-blooms are', bloom.get_current_error())
+    writer.gauge('saturated', 'Whether growth is being refused because of max_bytes', bloom.saturated)
+    writer.gauge('blooms', 'Number of sub-blooms', len(bloom.blooms))
+    writer.gauge('data_bytes', 'Bytes allocated for the data of the sub-blooms', bloom.get_data_nbytes())
+
+    sub_blooms = [(('bloom', sub.id),) for sub in bloom.blooms]
+    writer.add('bloom_num_non_zero', 'gauge', 'Number of non-zero buckets of a sub-bloom',
+               [('', labels, sub.num_non_zero) for labels, sub in zip(sub_blooms, bloom.blooms)])
+    writer.add('bloom_capacity', 'gauge', 'Capacity of a sub-bloom',
+               [('', labels, sub.capacity) for labels, sub in zip(sub_blooms, bloom.blooms)])
+
+    stats = bloom.get_stats()
+    if stats is not None:
+        for counter in COUNTER_NAMES:
+            writer.add('%s_total' % counter, 'counter', 'Number of %s' % counter.replace('_', ' '),
+                       [('', (), stats[counter])])
+
+        decay = stats['decay']
+        samples = [('_bucket', (('le', _format_value(upper_bound)),), count)
+                   for upper_bound, count in decay['histogram']]
+        samples.append(('_sum', (), decay['sum']))
+        samples.append(('_count', (), decay['count']))
+        writer.add('decay_seconds', 'histogram', 'Time spent decaying the filter', samples)
+
+    return writer.render()
+
+
+class MetricsHandler(RequestHandler):
+    """
+    Serves ``render_metrics(bloom)`` on GET
+    """
+    def initialize(self, bloom, prefix='fuggetaboutit'):
+        self.bloom = bloom
+        self.prefix = prefix
+
+    def get(self):
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.write(render_metrics(self.bloom, self.prefix))
+
+
+def get_metrics_app(bloom, path='/metrics', **kwargs):
+    """
+    Returns a tornado ``Application`` serving the metrics of ``bloom`` on
+    ``path``
+    """
+    return Application([(path, MetricsHandler, {'bloom': bloom})], **kwargs)
@@ -0,0 +1,113 @@
+import binascii
+from collections import deque
+import logging
+import os
+
+import numpy as np
+
+from . import _optimizations
+
+
+class FalsePositiveMonitor(object):
+    '''
+    Measures the real false positive rate of every sub-bloom of a
+    ``ScalingTimingBloomFilter`` by probing it with batches of canary keys
+    that are never inserted.  The rate is kept over the last ``window``
+    batches of each sub-bloom.
+
+    Pass the monitor as ``monitor`` when creating the scaling bloom.  Once a
+    sub-bloom has seen at least ``min_probes`` canaries and its measured rate
+    is above ``tolerance`` times its nominal error, it no longer receives adds
+    so the bloom scales on the measured error rather than on the estimate
+    from ``get_size``.
+
+    Probing runs every ``interval`` seconds on ``ticker`` or whenever ``run``
+    is called, never on the add or contains paths.
+    '''
+    def __init__(self, batch_size=1000, window=20, tolerance=2.0, min_probes=10000,
+                 ticker=None, interval=60):
+        self.batch_size = batch_size
+        self.window = window
+        self.tolerance = tolerance
+        self.min_probes = min_probes
+        self.ticker = ticker
+        self.interval = interval
+        self.bloom = None
+
+        # keys are made unique to this monitor so they can't collide with
+        # real items
+        self._prefix = '\x00canary:%s:' % binascii.hexlify(os.urandom(8))
+        self._next_key = 0
+        # id(sub-bloom) -> (sub-bloom, deque of (hits, probes))
+        self._samples = {}
+
+    def setup(self, bloom):
+        self.bloom = bloom
+        if self.ticker is not None:
+            self.ticker.setup(self.run, self.interval)
+            self.ticker.start()
+
+    def get_canaries(self):
+        '''
+        Returns the next batch of never inserted keys
+        '''
+        start = self._next_key
+        self._next_key += self.batch_size
+        return ['%s%d' % (self._prefix, i) for i in xrange(start, self._next_key)]
+
+    def probe(self, sub_bloom, keys):
+        '''
+        Returns how many of ``keys`` the given sub-bloom claims to contain
+        '''
+        if sub_bloom._optimize and sub_bloom.data.flags['C_CONTIGUOUS']:
+            table = np.array([sub_bloom.get_descriptor()], dtype=np.int64)
+            return int(np.count_nonzero(_optimizations.timing_bloom_multi_contains_batch(keys, table)))
+        return sum(sub_bloom.contains(key) for key in keys)
+
+    def run(self):
+        '''
+        Probes every sub-bloom with a new batch of canaries and re-evaluates
+        the active bloom when one of them is over its error
+        '''
+        keys = self.get_canaries()
+        samples = {}
+        for sub_bloom in self.bloom.blooms:
+            _, history = self._samples.get(id(sub_bloom), (None, deque(maxlen=self.window)))
+            history.append((self.probe(sub_bloom, keys), len(keys)))
+            samples[id(sub_bloom)] = (sub_bloom, history)
+        # forget the blooms that were removed
+        self._samples = samples
+
+        over_error = [sub_bloom for sub_bloom in self.bloom.blooms if self.is_over_error(sub_bloom)]
+        for sub_bloom in over_error:
+            logging.warning("Bloom %d has a measured error of %f, above its error of %f",
+                            sub_bloom.id, self.get_error(sub_bloom), sub_bloom.error)
+        if over_error:
+            self.bloom.get_active_bloom()
+
+    def _get_totals(self, sub_bloom):
+        sample = self._samples.get(id(sub_bloom))
+        if sample is None or sample[0] is not sub_bloom:
+            return 0, 0
+        history = sample[1]
+        return sum(hits for hits, _ in history), sum(probes for _, probes in history)
+
+    def get_error(self, sub_bloom):
+        '''
+        Returns the measured false positive rate of a sub-bloom or None if it
+        hasn't been probed yet
+        '''
+        hits, probes = self._get_totals(sub_bloom)
+        if not probes:
+            return None
+        return hits / float(probes)
+
+    def is_over_error(self, sub_bloom):
+        '''
+        Whether enough canaries were probed to tell that the sub-bloom's real
+        error is above its nominal error
+        '''
+        hits, probes = self._get_totals(sub_bloom)
+        if probes < self.min_probes:
+            return False
+        return hits / float(probes) > sub_bloom.error * self.tolerance
@@ -2,14 +2,24 @@
 
 import json
 import logging
-import math
 import operator
 import os
+import threading
+import time
 from shutil import rmtree
 
+import numpy as np
+
+from . import _optimizations
+from .clocks import WALL_CLOCK
 from .exceptions import PersistenceDisabledException
+from .growth_policies import GeometricGrowthPolicy
+from .memory import get_bits_per_item, get_bloom_memory_usage
+from .stats import ADDS, SCALE_UPS, SHRINKS, BLOOMS_REMOVED, get_bloom_gauges
 from .tickers import NoOpTicker
-from .timing_bloom_filter import TimingBloomFilter
+from .tracing import trace
+from .timing_bloom_filter import (TimingBloomFilter, DESCRIPTOR_WIDTH,
+                                  DESCRIPTOR_TICK_MIN, _MAX_NEW)
 
 META_FILENAME = 'meta.json'
 BLOOMS_PATH = 'blooms'
@@ -33,7 +43,11 @@ class ScalingTimingBloomFilter(object):
     In addition, the bloom will automatically scale using Almeida's method
     from "Scalable Bloom Filters" using ``error_tightening_ratio`` and
     ``growth_factor``.  A bloom filter will be scaled up when approximately
-    ``max_fill_factor`` of the capacity of the bloom filter is in use.
+    ``max_fill_factor`` of the capacity of the bloom filter is in use, unless
+    the new bloom would take the data of all the blooms past ``max_bytes``.
+    In that case the blooms are compacted if possible and otherwise the
+    emptiest bloom keeps receiving adds past its capacity so that the error,
+    as reported by ``get_current_error``, rises instead of the memory use.
     Conversely, the bloom will be scaled down if there is one bloom left and it
     has a fill percentage less than ``min_fill_factor``.  Together, these two
     fill factor conditionals attempt to keep the scaling bloom at the right
@@ -62,15 +76,39 @@ class ScalingTimingBloomFilter(object):
     
     :param insert_tail: Whether to insert in order to optimize compactness or convergence
     :type insert_tail: True (convergence) or False (compactness)
+
+    :param foldable: whether sub-blooms use power of two sizes so they can be shrunk in place by folding
+    :type foldable: bool
+
+    :param max_bytes: maximum number of bytes of data for all of the sub-blooms together or None for no limit
+    :type max_bytes: integer or None
+
+    :param growth_policy: decides the capacity of new sub-blooms, defaults to geometric growth by ``growth_factor``
+    :type growth_policy: GeometricGrowthPolicy, RateGrowthPolicy or None
+
+    :param prewarm_fill_factor: fill factor of the active bloom at which the next bloom is allocated in a background thread
+    :type prewarm_fill_factor: 0 < float < max_fill_factor or None
     
+    :param monitor: measures the real error of the sub-blooms so that ones over their error stop receiving adds
+    :type monitor: FalsePositiveMonitor or None
+
+    :param stats: records counters and decay timings, see ``get_stats``
+    :type stats: BloomStats or None
+
+    :param clock: time source shared by all the sub-blooms, pair a ``ManualClock`` or ``WatermarkClock`` with a ``ClockTicker`` to decay in simulated or event time
+    :type clock: WallClock, ManualClock, WatermarkClock or None
+
     :param ioloop: an instance of an IOLoop to attach the periodic decay operation to
     :type ioloop: tornado.ioloop.IOLoop or None
     """
     def __init__(self, capacity, decay_time, ticker=None, data_path=None, error=0.005,
             error_tightening_ratio=0.5, growth_factor=2, min_fill_factor=0.2,
-            max_fill_factor=0.8, insert_tail=True, blooms=None, disable_optimizations=False):
+            max_fill_factor=0.8, insert_tail=True, blooms=None, disable_optimizations=False,
+            prewarm_fill_factor=None, growth_policy=None, foldable=False, max_bytes=None,
+            stats=None, monitor=None, clock=None):
         assert (min_fill_factor or 0) < max_fill_factor <= 1, "max_fill_factor must be min_fill_factor<max_fill_factor<=1"
         assert min_fill_factor is None or 0 < min_fill_factor < max_fill_factor, "min_fill_factor must be None or 0<min_fill_factor<max_fill_factor"
+        assert prewarm_fill_factor is None or 0 < prewarm_fill_factor < max_fill_factor, "prewarm_fill_factor must be None or 0<prewarm_fill_factor<max_fill_factor"
         assert growth_factor is None or 0 < growth_factor, "growth_factor must be None or >0"
         assert 0 < error < 1, "error must be 0 < error < 1"
 
@@ -78,22 +116,54 @@ class ScalingTimingBloomFilter(object):
         self.error_tightening_ratio = error_tightening_ratio
         self.error_initial = self.error * (1 - self.error_tightening_ratio)
         self.growth_factor = growth_factor
+        self.growth_policy = growth_policy or GeometricGrowthPolicy(growth_factor)
         self.capacity = capacity
         self.decay_time = decay_time
         self.max_fill_factor = max_fill_factor
         self.min_fill_factor = min_fill_factor
         self.insert_tail = insert_tail
+        self.prewarm_fill_factor = prewarm_fill_factor
         self.seconds_per_tick = None
         self.disable_optimizations = disable_optimizations
+        self.foldable = foldable
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.monitor = monitor
+        self.clock = clock or WALL_CLOCK
+        # set while growth is refused because of max_bytes
+        self.saturated = False
 
         self.data_path = None
         if data_path:
             self.data_path = os.path.normpath(data_path)
 
+        # The bloom currently receiving adds and how many more of its buckets
+        # can be filled before it reaches max_fill_factor.  This is re-evaluated
+        # by get_active_bloom when it runs out or after decay/scale events.
+        self._active_bloom = None
+        self._active_headroom = 0
+
+        # The sub-blooms in the order contains probes them and the matching
+        # descriptor table so they can be probed with a single call into
+        # _optimizations.  Both are rebuilt after decay/scale events and the
+        # table is False when some sub-bloom can't be probed from C.
+        self._probe_order = None
+        self._probe_table = None
+        self._probe_table_data = None
+        self._probe_ticks = None
+        self._probe_active_row = None
+
+        # (bloom_id, thread, result) of the bloom being allocated ahead of the
+        # next scale up when prewarm_fill_factor is set
+        self._prewarm = None
+
+        self.blooms = [ ]
+        self.growth_policy.setup(self)
         if blooms:
             self.blooms = blooms
+            for bloom in self.blooms:
+                bloom.clock = self.clock
         else:
-            self.blooms = [ ]
             self._add_new_bloom()
 
         if ticker is None:
@@ -102,6 +172,8 @@ class ScalingTimingBloomFilter(object):
             self.ticker = ticker
 
         self._setup_decay()
+        if self.monitor is not None:
+            self.monitor.setup(self)
 
 
     def _setup_decay(self):
@@ -119,29 +191,116 @@ class ScalingTimingBloomFilter(object):
         return os.path.join(blooms_path, str(bloom_id))
 
     def get_capacity_for_id(self, bloom_id):
-        if self.growth_factor:
-            capacity = int(math.log(2) * self.capacity * self.growth_factor ** bloom_id)
-        else:
-            capacity = self.capacity
-
-        return capacity
+        return self.growth_policy.get_capacity(self, bloom_id)
 
-    def _add_new_bloom(self, bloom_id=None):
-        bloom_id = bloom_id or self._get_next_id()
+    def _create_bloom(self, bloom_id):
         error = self.error_initial * (self.error_tightening_ratio ** bloom_id)
         capacity = self.get_capacity_for_id(bloom_id)
 
-        bloom = TimingBloomFilter(
+        return TimingBloomFilter(
             capacity=capacity,
             decay_time=self.decay_time,
             error=error,
             id=bloom_id,
             disable_optimizations=self.disable_optimizations,
+            foldable=self.foldable,
+            clock=self.clock,
         )
-        self.blooms.append(bloom)
+
+    def get_data_nbytes(self):
+        """
+        Returns the number of bytes of data held by the sub-blooms
+
+        :rtype: int
+        """
+        return sum(bloom.data.nbytes for bloom in self.blooms)
+
+    def memory_usage(self):
+        """
+        Returns the bytes of data held by every sub-bloom, how many of them
+        are resident in memory, whether they are memory mapped and the
+        number of bits used per live item.  Resident bytes are None where
+        they can't be found out.
+
+        :rtype: dict
+        """
+        blooms = [get_bloom_memory_usage(bloom) for bloom in self.blooms]
+        resident = [bloom['resident_bytes'] for bloom in blooms]
+        nbytes = sum(bloom['nbytes'] for bloom in blooms)
+        return {
+            'nbytes': nbytes,
+            'resident_bytes': None if None in resident else sum(resident),
+            'mapped_bytes': sum(bloom['nbytes'] for bloom in blooms if bloom['mapped']),
+            'bits_per_item': get_bits_per_item(nbytes, self.get_size()),
+            'blooms': blooms,
+        }
+
+    def _can_add_bloom(self, bloom_id=None):
+        """
+        Checks whether adding the bloom with the given id (or the next id)
+        keeps the data of all the blooms within ``max_bytes``
+        """
+        if self.max_bytes is None:
+            return True
+        if bloom_id is None:
+            bloom_id = self._get_next_id()
+        nbytes = TimingBloomFilter.get_data_nbytes(
+            capacity=self.get_capacity_for_id(bloom_id),
+            error=self.error_initial * (self.error_tightening_ratio ** bloom_id),
+            disable_optimizations=self.disable_optimizations,
+            foldable=self.foldable,
+        )
+        return self.get_data_nbytes() + nbytes <= self.max_bytes
+
+    def _add_new_bloom(self, bloom_id=None):
+        if bloom_id is None:
+            bloom_id = self._get_next_id()
+
+        with trace('add_new_bloom', bloom=self, bloom_id=bloom_id) as info:
+            bloom = self._take_prewarmed_bloom(bloom_id)
+            info['prewarmed'] = bloom is not None
+            if bloom is None:
+                bloom = self._create_bloom(bloom_id)
+            self.blooms.append(bloom)
+            self._active_bloom = None
+            self._reset_probes()
+            info['capacity'] = bloom.capacity
+            info['num_blooms'] = len(self.blooms)
 
         return bloom
 
+    def _start_prewarm(self):
+        """
+        Starts allocating the bloom that the next scale up will add in a
+        background thread so that scaling doesn't have to wait on the
+        allocation.
+        """
+        bloom_id = self._get_next_id()
+        if self._prewarm is not None and self._prewarm[0] == bloom_id:
+            return
+        if not self._can_add_bloom(bloom_id):
+            return
+
+        logging.debug("Prewarming bloom %d", bloom_id)
+        result = {}
+        thread = threading.Thread(target=self._prewarm_bloom, args=(bloom_id, result))
+        thread.daemon = True
+        self._prewarm = (bloom_id, thread, result)
+        thread.start()
+
+    def _prewarm_bloom(self, bloom_id, result):
+        bloom = self._create_bloom(bloom_id)
+        bloom.touch_pages()
+        result['bloom'] = bloom
+
+    def _take_prewarmed_bloom(self, bloom_id):
+        if self._prewarm is None or self._prewarm[0] != bloom_id:
+            return None
+        _, thread, result = self._prewarm
+        self._prewarm = None
+        thread.join()
+        return result.get('bloom')
+
     def get_size(self):
         """
         Returns the approximate size of the current bloom state.
@@ -161,6 +320,18 @@ class ScalingTimingBloomFilter(object):
             return 0.0
         return 1 - reduce(operator.mul, (1 - bloom.error for bloom in self.blooms))
 
+    def get_current_error(self):
+        """
+        Return the error rate implied by how full the blooms currently are.
+        Unlike ``get_expected_error`` this keeps rising when the blooms are
+        filled past their capacity because growth was refused.
+
+        :rtype: float
+        """
+        if not self.blooms:
+            return 0.0
+        return 1 - reduce(operator.mul, (1 - bloom.get_current_error() for bloom in self.blooms))
+
     def add(self, key, timestamp=None):
         """
         Add key to the bloom filter and scale if necissary.  The key will be
@@ -173,34 +344,203 @@ class ScalingTimingBloomFilter(object):
         :param timestamp: timestamp of the item
         :type timestamp: int
         """
-        cur_bloom = self.get_active_bloom()
-        cur_bloom.add(key, timestamp)
+        if self.stats is not None:
+            self.stats.counts[ADDS] += 1
+        if timestamp:
+            # advance event time clocks first so that any decay they trigger
+            # happens before the active bloom is picked
+            self.clock.observe(timestamp)
+        cur_bloom = self._active_bloom
+        if cur_bloom is None:
+            cur_bloom = self.get_active_bloom()
+        self._active_headroom -= cur_bloom.add(key, timestamp)
+        if self._active_headroom <= 0:
+            self._active_bloom = None
+
+    def add_batch(self, keys, timestamps=None):
+        """
+        Adds a batch of keys, hashing them in C when optimizations are
+        enabled, and scales like ``add`` would.  Keys are inserted at the
+        matching entry of ``timestamps`` or at the current time, and ones
+        that are older than ``decay_time`` are skipped.  Timestamped batches
+        are added one tick of event time at a time so that event time clocks
+        decay the bloom between ticks like they would between single adds.
+
+        :param keys: keys to be added
+        :type keys: list of str
+
+        :param timestamps: timestamps of the items
+        :type timestamps: sequence of float or None
+
+        :rtype: number of keys that were recent enough to be added
+        """
+        if self.stats is not None:
+            self.stats.counts[ADDS] += len(keys)
+        if timestamps is None or not len(timestamps):
+            return self._add_batch(keys, None)
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        tick_numbers = np.maximum.accumulate(timestamps) // self.seconds_per_tick
+        bounds = (np.flatnonzero(np.diff(tick_numbers)) + 1).tolist()
+        num_added = 0
+        for start, end in zip([0] + bounds, bounds + [len(keys)]):
+            segment = timestamps[start:end]
+            self.clock.observe(segment.max())
+            num_added += self._add_batch(keys[start:end], segment)
+        return num_added
+
+    def _add_batch(self, keys, timestamps):
+        # all the sub-blooms share the clock and tick length
+        keys, ticks = (self._active_bloom or self.get_active_bloom()).get_batch_ticks(keys, timestamps)
+
+        start = 0
+        while start < len(keys):
+            cur_bloom = self._active_bloom
+            if cur_bloom is None:
+                cur_bloom = self.get_active_bloom()
+            start, num_new = cur_bloom._add_batch(keys, ticks, start, self._active_headroom)
+            self._active_headroom -= num_new
+            if self._active_headroom <= 0:
+                self._active_bloom = None
+        return len(keys)
+
+    def add_if_new(self, key):
+        """
+        Adds the key now and returns whether none of the blooms contained it
+        before.  With optimizations the key is hashed once and checked
+        against every bloom and added to the active one in a single call, so
+        no other thread can add it in between.
+
+        :param key: key to be added
+        :type key: str
+
+        :rtype: bool
+        """
+        if self.stats is not None:
+            self.stats.counts[ADDS] += 1
+        cur_bloom = self._active_bloom
+        if cur_bloom is None:
+            cur_bloom = self.get_active_bloom()
+        table = self._get_probe_table()
+        if table is not None and self._probe_active_row is not None:
+            is_new, num_new = _optimizations.timing_bloom_multi_add_if_new(key, table, self._probe_active_row)
+            cur_bloom.num_non_zero += num_new
+        else:
+            is_new = not any(bloom.contains(key) for bloom in self.get_probe_order())
+            num_new = cur_bloom.add(key)
+        self._active_headroom -= num_new
+        if self._active_headroom <= 0:
+            self._active_bloom = None
+        if self.stats is not None:
+            self.stats.record_contains(not is_new)
+        return is_new
+
+    def add_if_new_batch(self, keys):
+        """
+        Runs ``add_if_new`` over a batch of keys, in order, hashing them in C
+        when optimizations are enabled.  Repeats of a key within the batch
+        aren't new.
+
+        :param keys: keys to be added
+        :type keys: sequence of str
+
+        :rtype: numpy.ndarray of bool
+        """
+        result = np.zeros((len(keys),), dtype=np.bool_)
+        if self.stats is not None:
+            self.stats.counts[ADDS] += len(keys)
+
+        start = 0
+        while start < len(keys):
+            cur_bloom = self._active_bloom
+            if cur_bloom is None:
+                cur_bloom = self.get_active_bloom()
+            table = self._get_probe_table()
+            if table is None or self._probe_active_row is None:
+                result[start] = not any(bloom.contains(keys[start]) for bloom in self.get_probe_order())
+                num_new = cur_bloom.add(keys[start])
+                start += 1
+            else:
+                max_new = int(min(self._active_headroom, _MAX_NEW))
+                start, num_new = _optimizations.timing_bloom_multi_add_if_new_batch(
+                    keys, table, self._probe_active_row, start, max_new, result
+                )
+                cur_bloom.num_non_zero += num_new
+            self._active_headroom -= num_new
+            if self._active_headroom <= 0:
+                self._active_bloom = None
+
+        if self.stats is not None:
+            num_new_keys = int(np.count_nonzero(result))
+            self.stats.record_contains(len(keys) - num_new_keys, len(keys))
+        return result
 
     def get_active_bloom(self):
+        """
+        Finds the bloom that new items should be added to, scaling up if none
+        of the blooms have available capacity, and caches it for `add`.
+        """
         cur_bloom = None
         bloom_iter = self.get_bloom_iter()
 
         bloom_count = len(self.blooms)
-        logging.debug("Available Blooms:  %d" % bloom_count)
+        logging.debug("Available Blooms:  %d", bloom_count)
         for n, bloom in enumerate(bloom_iter):
             if self.insert_tail:
                 n = bloom_count - n
-            logging.debug("Checking if bloom %d has available capacity..." % n)
+            logging.debug("Checking if bloom %d has available capacity...", n)
             size = bloom.get_size()
-            logging.debug("size:  %r" % size)
-            logging.debug("max_fill_factor:  %r" % self.max_fill_factor)
-            logging.debug("capacity:  %r" % bloom.capacity)
+            logging.debug("size: %r, max_fill_factor: %r, capacity: %r",
+                          size, self.max_fill_factor, bloom.capacity)
 
-            if size < self.max_fill_factor * bloom.capacity:
-                logging.debug("Bloom %d has available capacity." % n)
+            if size < self.max_fill_factor * bloom.capacity and not self._is_over_error(bloom):
+                logging.debug("Bloom %d has available capacity.", n)
                 cur_bloom = bloom
                 break
 
         if cur_bloom is None:
+            cur_bloom = self._scale_up()
+
+        self._active_bloom = cur_bloom
+        self._active_headroom = cur_bloom.get_headroom(self.max_fill_factor * cur_bloom.capacity)
+        if self.saturated:
+            # keep adding to this bloom until the next decay frees up space
+            self._active_headroom = float('inf')
+        elif self.prewarm_fill_factor:
+            # stop at the prewarm point first so the next bloom can be
+            # allocated before this one is full
+            prewarm_headroom = cur_bloom.get_headroom(self.prewarm_fill_factor * cur_bloom.capacity)
+            if prewarm_headroom > 0:
+                self._active_headroom = prewarm_headroom
+            else:
+                self._start_prewarm()
+        # the probe order skips empty blooms unless they are receiving adds
+        self._reset_probes()
+        return cur_bloom
+
+    def _is_over_error(self, bloom):
+        return self.monitor is not None and self.monitor.is_over_error(bloom)
+
+    def _scale_up(self):
+        """
+        Adds a new bloom unless that would go over ``max_bytes``, in which
+        case the blooms are compacted or, failing that, growth is refused and
+        the emptiest bloom is returned to keep receiving adds.
+        """
+        if self._can_add_bloom():
             logging.debug("No available blooms, adding new bloom")
-            cur_bloom = self._add_new_bloom()
+            if self.stats is not None:
+                self.stats.counts[SCALE_UPS] += 1
+            return self._add_new_bloom()
 
-        return cur_bloom
+        if self.compact():
+            return self.blooms[0]
+
+        if not self.saturated:
+            logging.warning("Growing would exceed max_bytes=%d, error will rise above %f",
+                            self.max_bytes, self.get_expected_error())
+        self.saturated = True
+        return min(self.blooms, key=lambda bloom: bloom.get_size() / float(bloom.capacity))
 
     def get_bloom_iter(self):
         if self.insert_tail:
@@ -219,33 +559,197 @@ class ScalingTimingBloomFilter(object):
 
         :rtype: bool
         """
-        return any(bloom.contains(key) for bloom in self.blooms)
+        table = self._get_probe_table()
+        if table is not None:
+            result = _optimizations.timing_bloom_multi_contains(key, table)
+        else:
+            result = any(bloom.contains(key) for bloom in self.get_probe_order())
+        if self.stats is not None:
+            self.stats.record_contains(result)
+        return result
+
+    def contains_batch(self, keys):
+        """
+        Check which of the given keys are contained in the bloom filter
+
+        :param keys: keys to be checked
+        :type keys: sequence of str
+
+        :rtype: numpy.ndarray of bool
+        """
+        table = self._get_probe_table()
+        if table is None:
+            return np.array([self.contains(key) for key in keys], dtype=np.bool_)
+        result = _optimizations.timing_bloom_multi_contains_batch(keys, table)
+        if self.stats is not None:
+            self.stats.record_contains(int(np.count_nonzero(result)), len(result))
+        return result
+
+    def last_seen(self, key):
+        """
+        Returns roughly how many seconds ago the key was last added, or None
+        if it isn't contained in the bloom filter.  See
+        ``TimingBloomFilter.last_seen`` for how approximate the age is.
+
+        :param key: key to be checked
+        :type key: str
+
+        :rtype: float or None
+        """
+        table = self._get_probe_table()
+        if table is not None:
+            age = _optimizations.timing_bloom_multi_last_seen(key, table)
+            age = age * self.seconds_per_tick if age is not None else None
+        else:
+            ages = [bloom.last_seen(key) for bloom in self.get_probe_order()]
+            ages = [age for age in ages if age is not None]
+            age = min(ages) if ages else None
+        if self.stats is not None:
+            self.stats.record_contains(age is not None)
+        return age
+
+    def contains_between(self, key, start, end):
+        """
+        Check if any of the blooms last saw the key between the timestamps
+        ``start`` and ``end``, to the precision of a tick.  With
+        ``end`` in the future this checks if the key was seen since
+        ``start``, which lets one bloom answer for every window shorter
+        than ``decay_time``.
+
+        :param key: key to be checked
+        :type key: str
+
+        :param start: earliest time the key may have been added
+        :type start: float
+
+        :param end: latest time the key may have been added
+        :type end: float
+
+        :rtype: bool
+        """
+        table = self._get_probe_table()
+        if table is not None:
+            min_age, max_age = self.blooms[0].get_age_range(start, end)
+            result = min_age <= max_age and \
+                _optimizations.timing_bloom_multi_contains_between(key, table, min_age, max_age)
+        else:
+            result = any(bloom.contains_between(key, start, end) for bloom in self.get_probe_order())
+        if self.stats is not None:
+            self.stats.record_contains(result)
+        return result
+
+    def contains_between_batch(self, keys, start, end):
+        """
+        Check which of the given keys any of the blooms last saw between the
+        timestamps ``start`` and ``end``
+
+        :param keys: keys to be checked
+        :type keys: sequence of str
+
+        :rtype: numpy.ndarray of bool
+        """
+        table = self._get_probe_table()
+        if table is None:
+            return np.array([self.contains_between(key, start, end) for key in keys], dtype=np.bool_)
+        min_age, max_age = self.blooms[0].get_age_range(start, end)
+        if min_age > max_age:
+            result = np.zeros((len(keys),), dtype=np.bool_)
+        else:
+            result = _optimizations.timing_bloom_multi_contains_between_batch(keys, table, min_age, max_age)
+        if self.stats is not None:
+            self.stats.record_contains(int(np.count_nonzero(result)), len(result))
+        return result
+
+    def get_probe_order(self):
+        """
+        Returns the sub-blooms in the order that ``contains`` probes them.
+        Blooms holding the most items come first so that lookups of present
+        keys exit early, and empty blooms that aren't receiving adds are
+        skipped without being touched.
+
+        :rtype: list of TimingBloomFilter
+        """
+        if self._probe_order is None:
+            blooms = [bloom for bloom in self.blooms
+                      if bloom.num_non_zero or bloom is self._active_bloom]
+            blooms.sort(key=lambda bloom: bloom.get_size(), reverse=True)
+            self._probe_order = blooms
+        return self._probe_order
+
+    def _reset_probes(self):
+        self._probe_order = None
+        self._probe_table = None
+
+    def _get_probe_table(self):
+        if self._probe_table is None:
+            self._probe_table = self._build_probe_table()
+        table = self._probe_table
+        if table is False:
+            return None
+
+        tick_range = self.blooms[0].get_tick_range()
+        if tick_range != self._probe_ticks:
+            table[:, DESCRIPTOR_TICK_MIN:] = tick_range
+            self._probe_ticks = tick_range
+        return table
+
+    def _build_probe_table(self):
+        self._probe_ticks = None
+        self._probe_table_data = None
+        self._probe_active_row = None
+        blooms = self.get_probe_order()
+        if not blooms:
+            return False
+        for bloom in blooms:
+            if not (bloom._optimize and bloom.data.flags['C_CONTIGUOUS']):
+                return False
+
+        table = np.empty((len(blooms), DESCRIPTOR_WIDTH), dtype=np.int64)
+        for row, bloom in enumerate(blooms):
+            table[row] = bloom.get_descriptor()
+            if bloom is self._active_bloom:
+                self._probe_active_row = row
+        # keep the arrays the table points into alive
+        self._probe_table_data = [bloom.data for bloom in blooms]
+        return table
 
     def decay(self):
         """
         Decay the bloom filter and remove items that are older than
         ``decay_time``.  This will also remove empty bloom filters.
         """
-        for bloom in self.blooms:
-            bloom.decay()
-            
-
-        self.cleanup_empty_blooms()
-        self.try_to_shrink()
+        start_time = time.time()
+        with trace('decay', bloom=self, num_blooms=len(self.blooms)) as info:
+            for bloom in self.blooms:
+                bloom.decay()
+
+            self._active_bloom = None
+            self.saturated = False
+            self._reset_probes()
+            info['num_removed'] = self.cleanup_empty_blooms()
+            info['did_shrink'] = self.try_to_shrink()
+        if self.stats is not None:
+            self.stats.record_decay(start_time)
 
     def cleanup_empty_blooms(self):
         num_empty_blooms = sum(bloom.num_non_zero == 0 for bloom in self.blooms)
 
         if num_empty_blooms:
-            to_remove = num_empty_blooms
-            for i, bloom in enumerate(self.blooms):
-                if bloom.num_non_zero == 0:
-                    rmtree(bloom.data_path)
-                    del self.blooms[i]
-                    to_remove -= 1
-
-                    if to_remove <= 0:
-                        break
+            with trace('cleanup_empty_blooms', bloom=self, num_removed=num_empty_blooms):
+                to_remove = num_empty_blooms
+                for i, bloom in enumerate(self.blooms):
+                    if bloom.num_non_zero == 0:
+                        if bloom.data_path:
+                            rmtree(bloom.data_path)
+                        del self.blooms[i]
+                        self._reset_probes()
+                        to_remove -= 1
+
+                        if to_remove <= 0:
+                            break
+
+            if self.stats is not None:
+                self.stats.counts[BLOOMS_REMOVED] += num_empty_blooms
 
         return num_empty_blooms
 
@@ -253,20 +757,99 @@ class ScalingTimingBloomFilter(object):
         """
         In the case that there is only one active bloom filter, check if its
         load factor is <= the minimum load factor and, if so, create a new
-        bloom with a smaller capacity
+        bloom with a smaller capacity.  Foldable blooms are instead halved in
+        place so the memory is reclaimed immediately.
         """
         did_shrink = False
 
         if self.min_fill_factor and len(self.blooms) == 1:
             bloom = self.blooms[0]
-            if 0 < bloom.get_size() < self.min_fill_factor * bloom.capacity:
+            size = bloom.get_size()
+            if 0 < size < self.min_fill_factor * bloom.capacity:
                 max_id = bloom.id
-                if max_id > 0:
+                if bloom.foldable and size < self.max_fill_factor * bloom.capacity / 2.0:
+                    did_shrink = bloom.shrink()
+                    self._active_bloom = None
+                    self._reset_probes()
+                elif max_id > 0 and self._can_add_bloom(max_id - 1):
                     self._add_new_bloom(max_id - 1)
                     did_shrink = True
 
+        if did_shrink and self.stats is not None:
+            self.stats.counts[SHRINKS] += 1
         return did_shrink
 
+    def compact(self):
+        """
+        Consolidates every live sub-bloom into the one with the fewest
+        buckets so that ``contains`` only has to probe a single bloom after a
+        spike recedes.  Every other bloom is folded down to the target's size
+        and the newest live tick of each bucket is kept, which is exact since
+        ``foldable`` blooms have power of two sizes and later blooms use at
+        least as many hashes.  Nothing is changed if the blooms aren't
+        compatible, if the target would go over ``max_fill_factor`` or if its
+        projected false positive rate would exceed ``get_expected_error``.
+        Returns whether the blooms were compacted.
+
+        :rtype: bool
+        """
+        blooms = [bloom for bloom in self.blooms if bloom.num_non_zero]
+        if len(blooms) < 2:
+            return False
+
+        target = min(blooms, key=lambda bloom: bloom.num_bytes)
+        for bloom in blooms:
+            if not bloom.foldable or bloom.num_bytes % target.num_bytes or \
+                    bloom.num_hashes < target.num_hashes or \
+                    bloom.ring_size != target.ring_size:
+                logging.debug("Bloom %d can't be folded into bloom %d", bloom.id, target.id)
+                return False
+
+        # Only a copy of the target's data is allocated, so compacting a
+        # bloom that is at max_bytes doesn't go much over it
+        data, num_non_zero = target.fold_blooms(blooms)
+
+        num_new = num_non_zero - target.num_non_zero
+        if num_new > target.get_headroom(self.max_fill_factor * target.capacity):
+            logging.debug("Compacting would overfill bloom %d", target.id)
+            return False
+        fill = (target.num_non_zero + num_new) / float(target.num_bytes)
+        if fill ** target.num_hashes > self.get_expected_error():
+            logging.debug("Compacting would exceed the expected error")
+            return False
+
+        logging.info("Compacting %d blooms into bloom %d", len(self.blooms), target.id)
+        with trace('compact', bloom=self, num_blooms=len(self.blooms), target_id=target.id):
+            target.data = data
+            target.num_non_zero = num_non_zero
+            for bloom in self.blooms:
+                if bloom is not target and bloom.data_path:
+                    rmtree(bloom.data_path)
+        if self.stats is not None:
+            self.stats.counts[BLOOMS_REMOVED] += len(self.blooms) - 1
+        self.blooms = [target]
+        self._active_bloom = None
+        self._reset_probes()
+        return True
+
+    def get_stats(self):
+        """
+        Returns a snapshot of the recorded stats along with the fill factor
+        and estimated error of every sub-bloom, or None if stats aren't
+        enabled
+
+        :rtype: dict or None
+        """
+        if self.stats is None:
+            return None
+        snapshot = self.stats.snapshot()
+        snapshot['size'] = self.get_size()
+        snapshot['expected_error'] = self.get_expected_error()
+        snapshot['current_error'] = self.get_current_error()
+        snapshot['saturated'] = self.saturated
+        snapshot['blooms'] = [get_bloom_gauges(bloom) for bloom in self.blooms]
+        return snapshot
+
     def start(self):
         """
         Start a periodic callback on the IOLoop to decay the bloom at every
@@ -291,21 +874,36 @@ class ScalingTimingBloomFilter(object):
             'max_fill_factor': self.max_fill_factor,
             'insert_tail': self.insert_tail,
             'disable_optimizations': self.disable_optimizations,
+            'prewarm_fill_factor': self.prewarm_fill_factor,
+            'foldable': self.foldable,
+            'max_bytes': self.max_bytes,
         }
 
     def save(self, data_path=None):
         data_path, meta_filename, blooms_path = _get_paths(self.data_path, data_path)
 
-        if not os.path.exists(data_path):
-            logging.debug("Data path doesn't exist, creating:  %s" % data_path)
-            os.makedirs(data_path)
-
-        meta = self.get_meta()
-        with open(meta_filename, 'w') as meta_file:
-            json.dump(meta, meta_file)
-
-        for bloom in self.blooms:
-            bloom.save(self.get_bloom_path(blooms_path, bloom.id))
+        with trace('save', bloom=self, data_path=data_path, num_blooms=len(self.blooms)):
+            if not os.path.exists(data_path):
+                logging.debug("Data path doesn't exist, creating:  %s" % data_path)
+                os.makedirs(data_path)
+
+            meta = self.get_meta()
+            with open(meta_filename, 'w') as meta_file:
+                json.dump(meta, meta_file)
+
+            bloom_paths = set()
+            for bloom in self.blooms:
+                bloom_path = self.get_bloom_path(blooms_path, bloom.id)
+                bloom.save(bloom_path)
+                bloom_paths.add(bloom_path)
+
+            # Sub-blooms that were removed since the last save would
+            # otherwise be loaded back
+            if os.path.exists(blooms_path):
+                for bloom_path in self.discover_blooms(blooms_path):
+                    if bloom_path not in bloom_paths:
+                        logging.debug("Removing stale sub-bloom at '%s'" % bloom_path)
+                        rmtree(bloom_path)
 
     @classmethod
     def discover_blooms(cls, blooms_path):
@@ -321,12 +919,13 @@ class ScalingTimingBloomFilter(object):
         return paths
 
     @classmethod
-    def load(cls, data_path, ticker=None):
+    def load(cls, data_path, ticker=None, growth_policy=None, stats=None, monitor=None, clock=None):
         logging.debug("Loading scaling timing bloom from %s" % data_path)
         data_path, meta_filename, blooms_path = _get_paths(None, data_path)
         blooms = []
         
-        kwargs = {'data_path': data_path, 'ticker': ticker}
+        kwargs = {'data_path': data_path, 'ticker': ticker, 'growth_policy': growth_policy,
+                  'stats': stats, 'monitor': monitor, 'clock': clock}
 
         with open(meta_filename, 'r') as meta_file:
             kwargs.update(json.load(meta_file))
@@ -334,7 +933,7 @@ class ScalingTimingBloomFilter(object):
         bloom_paths = cls.discover_blooms(blooms_path)
         for path in bloom_paths:
             logging.debug("Loading sub-bloom from '%s'" % path)
-            blooms.append(TimingBloomFilter.load(path))
+            blooms.append(TimingBloomFilter.load(path, clock=clock))
 
         if not blooms:
             logging.warn("No sub-blooms found in '%s'" % blooms_path)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+A small line based TCP / unix-socket server exposing a
+``ScalingTimingBloomFilter`` so that many processes (in any language) can
+share a single dedup cache.
+
+The protocol is pipelined: clients may write any number of commands without
+waiting for the replies, and replies are written back in the same order.  Every
+command is a single line of space separated tokens::
+
+    ADD <key> [<key> ...]           ->  +OK
+    CONTAINS <key> [<key> ...]      ->  +<one 0/1 digit per key>
+    ADD_IF_NEW <key> [<key> ...]    ->  +<one 0/1 digit per key, 1 if new>
+
+Errors are reported with a line starting with ``-ERR``.  Keys therefore can
+not contain whitespace.  Connections that send a line longer than the
+server's ``max_line_size`` get an error and are closed.
+"""
+
+import argparse
+import logging
+import os
+
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets, bind_unix_socket
+from tornado.tcpserver import TCPServer
+
+from .clocks import CoarseClock
+from .metrics import get_metrics_app
+from .scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from .stats import BloomStats
+from .tickers import TornadoTicker
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_LINE_SIZE = 1024 * 1024
+REPLY_OK = '+OK'
+
+
+def _add(bloom, keys):
+    bloom.add_batch(keys)
+    return REPLY_OK
+
+def _contains(bloom, keys):
+    return '+' + ''.join('1' if found else '0' for found in bloom.contains_batch(keys))
+
+def _add_if_new(bloom, keys):
+    return '+' + ''.join('1' if is_new else '0' for is_new in bloom.add_if_new_batch(keys))
+
+COMMANDS = {
+    'ADD': _add,
+    'CONTAINS': _contains,
+    'ADD_IF_NEW': _add_if_new,
+}
+
+
+def execute(bloom, line):
+    """
+    Runs a single protocol line against ``bloom`` and returns the reply line
+    (without the trailing newline).
+    """
+    tokens = line.split()
+    if not tokens:
+        return '-ERR empty command'
+    command = COMMANDS.get(tokens[0].upper())
+    if command is None:
+        return "-ERR unknown command '%s'" % tokens[0]
+    if len(tokens) < 2:
+        return "-ERR '%s' needs at least one key" % tokens[0]
+    return command(bloom, tokens[1:])
+
+
+def process_buffer(bloom, data):
+    """
+    Executes every complete line in ``data``.  Returns the joined replies and
+    the trailing partial line that should be prepended to the next read.
+    """
+    lines = data.split('\n')
+    remainder = lines.pop()
+    replies = [execute(bloom, line.rstrip('\r')) for line in lines]
+    if replies:
+        return '\n'.join(replies) + '\n', remainder
+    return '', remainder
+
+
+class BloomServer(TCPServer):
+    """
+    Serves ``bloom`` over the pipelined protocol described in the module
+    docstring.  When the bloom has a ``data_path`` it will be saved every
+    ``checkpoint_interval`` seconds and when the server is stopped.
+
+    :param bloom: the bloom to serve
+    :type bloom: ScalingTimingBloomFilter
+
+    :param checkpoint_interval: seconds between checkpoints or None to disable
+    :type checkpoint_interval: float or None
+
+    :param io_loop: the IOLoop to serve on
+    :type io_loop: tornado.ioloop.IOLoop or None
+
+    :param max_line_size: longest command, in bytes, before the connection
+        is closed
+    :type max_line_size: int
+    """
+    def __init__(self, bloom, checkpoint_interval=None, io_loop=None,
+                 max_line_size=MAX_LINE_SIZE, **kwargs):
+        super(BloomServer, self).__init__(**kwargs)
+        self.bloom = bloom
+        self.max_line_size = max_line_size
+        self.io_loop = io_loop or IOLoop.current()
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoint_timer = None
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        remainder = ''
+        try:
+            while True:
+                data = yield stream.read_bytes(READ_CHUNK_SIZE, partial=True)
+                reply, remainder = process_buffer(self.bloom, remainder + data)
+                if len(remainder) > self.max_line_size:
+                    reply += '-ERR line longer than %d bytes\n' % self.max_line_size
+                    yield stream.write(reply)
+                    stream.close()
+                    return
+                if reply:
+                    yield stream.write(reply)
+        except StreamClosedError:
+            pass
+
+    def checkpoint(self):
+        if not self.bloom.data_path:
+            return
+        logging.info("Checkpointing bloom to %s", self.bloom.data_path)
+        self.bloom.save()
+
+    def start(self, *args, **kwargs):
+        super(BloomServer, self).start(*args, **kwargs)
+        if self.checkpoint_interval and self.bloom.data_path:
+            self._checkpoint_timer = PeriodicCallback(
+                self.checkpoint, self.checkpoint_interval * 1000, self.io_loop
+            )
+            self._checkpoint_timer.start()
+
+    def stop(self):
+        super(BloomServer, self).stop()
+        if self._checkpoint_timer:
+            self._checkpoint_timer.stop()
+            self._checkpoint_timer = None
+        self.checkpoint()
+
+
+def get_clock(args, io_loop=None):
+    """
+    Returns a ``CoarseClock`` refreshed every ``--clock-resolution`` seconds
+    on the IOLoop, so that commands don't read the system time, or None to
+    read it on every command when the resolution is 0
+    """
+    if not args.clock_resolution:
+        return None
+    return CoarseClock(TornadoTicker(io_loop=io_loop), resolution=args.clock_resolution)
+
+
+def get_bloom(args, io_loop=None):
+    ticker = TornadoTicker(io_loop=io_loop)
+    stats = BloomStats() if args.metrics_port else None
+    clock = get_clock(args, io_loop)
+    if args.data_path and os.path.exists(os.path.join(args.data_path, 'meta.json')):
+        return ScalingTimingBloomFilter.load(args.data_path, ticker=ticker, stats=stats, clock=clock)
+    return ScalingTimingBloomFilter(
+        capacity=args.capacity,
+        decay_time=args.decay_time,
+        error=args.error,
+        data_path=args.data_path,
+        ticker=ticker,
+        stats=stats,
+        clock=clock,
+    )
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Serve a ScalingTimingBloomFilter over TCP")
+    parser.add_argument('--port', type=int, default=7654)
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--unix-socket', default=None,
+                        help="Serve on this unix socket instead of TCP")
+    parser.add_argument('--capacity', type=float, default=1e6)
+    parser.add_argument('--decay-time', type=float, default=24 * 60 * 60)
+    parser.add_argument('--error', type=float, default=0.005)
+    parser.add_argument('--data-path', default=None,
+                        help="Directory to load the bloom from and checkpoint it to")
+    parser.add_argument('--checkpoint-interval', type=float, default=5 * 60)
+    parser.add_argument('--max-line-size', type=int, default=MAX_LINE_SIZE,
+                        help="Close connections that send longer lines, in bytes")
+    parser.add_argument('--clock-resolution', type=float, default=0.1,
+                        help="Seconds between reads of the system time, 0 to read it on every command")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Serve Prometheus metrics over HTTP on this port")
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    args.capacity = int(args.capacity)
+
+    io_loop = IOLoop.current()
+    bloom = get_bloom(args, io_loop)
+    server = BloomServer(
+        bloom,
+        checkpoint_interval=args.checkpoint_interval,
+        io_loop=io_loop,
+        max_line_size=args.max_line_size,
+    )
+    if args.unix_socket:
+        server.add_socket(bind_unix_socket(args.unix_socket))
+        logging.info("Serving bloom on %s", args.unix_socket)
+    else:
+        server.add_sockets(bind_sockets(args.port, address=args.address))
+        logging.info("Serving bloom on %s:%d", args.address, args.port)
+    server.start()
+    if args.metrics_port:
+        get_metrics_app(bloom).listen(args.metrics_port, address=args.address)
+        logging.info("Serving metrics on %s:%d", args.address, args.metrics_port)
+
+    try:
+        io_loop.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
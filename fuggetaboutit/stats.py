@@ -0,0 +1,81 @@
+import bisect
+import time
+
+# Indexes into BloomStats.counts.  They are plain module level constants so
+# that the hot paths only pay for a list index and an integer add.
+ADDS, CONTAINS_HITS, CONTAINS_MISSES, SCALE_UPS, SHRINKS, BLOOMS_REMOVED = range(6)
+COUNTER_NAMES = ('adds', 'contains_hits', 'contains_misses', 'scale_ups', 'shrinks', 'blooms_removed')
+
+# Upper bounds, in seconds, of the buckets of the decay duration histogram
+DECAY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, float('inf'))
+
+
+class BloomStats(object):
+    '''
+    Opt-in counters and timings for a ``TimingBloomFilter`` or
+    ``ScalingTimingBloomFilter``.  Pass an instance as ``stats`` when creating
+    the bloom and read it back with the bloom's ``get_stats``.
+
+    The counters are kept in a list indexed by the constants in this module
+    and decay durations go into a cumulative histogram with the upper bounds
+    in ``DECAY_BUCKETS``.
+    '''
+    def __init__(self):
+        self.counts = [0] * len(COUNTER_NAMES)
+        self.decay_buckets = [0] * len(DECAY_BUCKETS)
+        self.decay_count = 0
+        self.decay_sum = 0.0
+        self.last_decay = None
+
+    def record_contains(self, hits, total=1):
+        self.counts[CONTAINS_HITS] += hits
+        self.counts[CONTAINS_MISSES] += total - hits
+
+    def record_decay(self, start_time):
+        '''
+        Records a decay that started at ``start_time`` and just finished
+        '''
+        duration = time.time() - start_time
+        self.decay_buckets[bisect.bisect_left(DECAY_BUCKETS, duration)] += 1
+        self.decay_count += 1
+        self.decay_sum += duration
+        self.last_decay = duration
+
+    def get_decay_histogram(self):
+        '''
+        Returns (upper bound, cumulative count) pairs for the decay durations
+        '''
+        histogram = []
+        total = 0
+        for upper_bound, count in zip(DECAY_BUCKETS, self.decay_buckets):
+            total += count
+            histogram.append((upper_bound, total))
+        return histogram
+
+    def snapshot(self):
+        '''
+        Returns the counters and decay timings as a plain dict
+        '''
+        snapshot = dict(zip(COUNTER_NAMES, self.counts))
+        snapshot['decay'] = {
+            'count': self.decay_count,
+            'sum': self.decay_sum,
+            'last': self.last_decay,
+            'histogram': self.get_decay_histogram(),
+        }
+        return snapshot
+
+
+def get_bloom_gauges(bloom):
+    '''
+    Returns the fill factor and estimated false positive rate of a single
+    ``TimingBloomFilter`` along with the numbers they're derived from
+    '''
+    return {
+        'id': bloom.id,
+        'capacity': bloom.capacity,
+        'num_bytes': bloom.num_bytes,
+        'num_non_zero': int(bloom.num_non_zero),
+        'fill_factor': bloom.num_non_zero / float(bloom.num_bytes),
+        'error': bloom.get_current_error(),
+    }
@@ -1,4 +1,5 @@
 import logging
+import math
 
 
 class NoOpTicker(object):
@@ -15,6 +16,56 @@ class NoOpTicker(object):
         pass
 
 
+class ClockTicker(object):
+    '''
+    Ticker implementation that calls back when a ``ManualClock`` or
+    ``WatermarkClock`` moves past the next multiple of the interval, so that
+    decays follow simulated or event time.  A jump over several intervals
+    calls back once since a decay drops everything outside the window.
+    '''
+    def __init__(self, clock):
+        self.clock = clock
+        self.callback = None
+        self.interval = None
+        self._next_time = None
+        self._running = False
+        clock.add_listener(self._on_time)
+
+    def setup(self, callback, interval):
+        if self.callback:
+            raise Exception("Ticker already setup")
+
+        self.callback = callback
+        self.interval = interval
+
+    def start(self):
+        if not self.callback:
+            raise Exception("You need to call the setup method before calling start.")
+
+        if self._running:
+            raise Exception("Can't start an already running timer.")
+
+        self._running = True
+        self._next_time = self._get_next_time(self.clock.time())
+
+    def stop(self):
+        if not self.callback:
+            raise Exception("You need to call the setup method before calling stop.")
+
+        if not self._running:
+            raise Exception("Can't stop a timer that isn't running.")
+
+        self._running = False
+
+    def _get_next_time(self, now):
+        return (math.floor(now / self.interval) + 1) * self.interval
+
+    def _on_time(self, now):
+        if self._running and now >= self._next_time:
+            self._next_time = self._get_next_time(now)
+            self.callback()
+
+
 class TornadoTicker(object):
     '''
     Ticker implementation that uses Tornado's IO loop to perform periodic callbacks.
@@ -1,20 +1,62 @@
+import itertools
 import logging 
+import math
 import time
 import json
 import os
 
+import numpy as np
+
+from .clocks import WALL_CLOCK
 from .counting_bloom_filter import CountingBloomFilter
 from . import _optimizations
+from .stats import ADDS, get_bloom_gauges
+from .tracing import trace
 
 _ENTRIES_PER_8BYTE = 2 if _optimizations is not None else 1
 
 META_FILENAME = 'meta.json'
 
+# Columns of the descriptor tables handed to the _optimizations.timing_bloom_multi_* functions
+DESCRIPTOR_DATA, DESCRIPTOR_SIZE, DESCRIPTOR_NUM_HASHES, DESCRIPTOR_TICK_MIN, DESCRIPTOR_TICK_MAX = range(5)
+DESCRIPTOR_WIDTH = 5
+
+# Stands in for an unlimited number of new buckets in add_batch
+_MAX_NEW = 1 << 62
+
+# Number of buckets fold_blooms folds at a time, which bounds the memory it
+# uses besides the folded data
+FOLD_BLOCK_SIZE = 1 << 16
+
+def _fold_num_bytes(num_bytes, foldable, folds):
+    if foldable:
+        num_bytes = 1 << (num_bytes - 1).bit_length()
+    return num_bytes >> folds
+
 class TimingBloomFilter(CountingBloomFilter):
+    """
+    A counting bloom that stores the tick at which each bucket was last set so
+    that items can be decayed after ``decay_time`` seconds.
+
+    When ``foldable`` is set the number of buckets is rounded up to a power of
+    two so that the bloom can later be halved in place with ``shrink``.
+    ``folds`` is the number of times the bloom has already been shrunk.
+
+    Adds, contains and decays are recorded in ``stats`` when a ``BloomStats``
+    is given.
+
+    Ticks and the cutoff for old timestamps are read from ``clock``, the
+    system time by default.  A ``ManualClock`` or ``WatermarkClock`` can be
+    given to run simulations or replay old events faster than real time.
+    """
     _ENTRIES_PER_8BYTE = _ENTRIES_PER_8BYTE
 
-    def __init__(self, capacity, decay_time, disable_optimizations=False, *args, **kwargs):
+    def __init__(self, capacity, decay_time, disable_optimizations=False, foldable=False, folds=0, stats=None, clock=None, *args, **kwargs):
         self.decay_time = decay_time
+        self.stats = stats
+        self.clock = clock or WALL_CLOCK
+        self.foldable = foldable
+        self.folds = folds
         if disable_optimizations:
             self._optimize = False
             self._ENTRIES_PER_8BYTE = 1
@@ -23,18 +65,55 @@ class TimingBloomFilter(CountingBloomFilter):
 
         super(TimingBloomFilter, self).__init__(capacity, *args, **kwargs)
 
+        self.unfolded_capacity = capacity
+        self.capacity = capacity // (1 << folds)
+
         self.ring_size = (1 << (8 / self._ENTRIES_PER_8BYTE)) - 1
         self.dN = self.ring_size / 2
         self.seconds_per_tick = self.decay_time / float(self.dN)
 
+        # The current tick range and the times between which it stays
+        # current, so that it is only recomputed once per tick
+        self._tick_range = None
+        self._tick_range_start = self._tick_range_end = 0.0
+
+    def _adjust_num_bytes(self, num_bytes):
+        return _fold_num_bytes(num_bytes, self.foldable, self.folds)
+
+    @classmethod
+    def get_data_nbytes(cls, capacity, error, disable_optimizations=False, foldable=False, folds=0):
+        """
+        Returns the number of bytes of data that a bloom created with these
+        arguments would allocate
+        """
+        num_bytes = _fold_num_bytes(cls.get_num_bytes(capacity, error), foldable, folds)
+        entries_per_8byte = 1 if disable_optimizations else cls._ENTRIES_PER_8BYTE
+        return int(math.ceil(num_bytes / float(entries_per_8byte)))
 
     def get_tick(self, timestamp=None):
-        return int(((timestamp or time.time()) // self.seconds_per_tick) % self.ring_size) + 1
+        if timestamp:
+            return int((timestamp // self.seconds_per_tick) % self.ring_size) + 1
+        return self.get_tick_range()[1]
 
     def get_tick_range(self):
-        tick_max = self.get_tick()
+        now = self.clock.time()
+        if not self._tick_range_start <= now < self._tick_range_end:
+            self.refresh_tick_range(now)
+        return self._tick_range
+
+    def refresh_tick_range(self, now=None):
+        """
+        Recomputes the cached range of live ticks from the clock, or from
+        ``now`` when given
+        """
+        if now is None:
+            now = self.clock.time()
+        tick_number = now // self.seconds_per_tick
+        tick_max = int(tick_number % self.ring_size) + 1
         tick_min = (tick_max - self.dN - 1) % self.ring_size + 1
-        return tick_min, tick_max
+        self._tick_range = (tick_min, tick_max)
+        self._tick_range_start = tick_number * self.seconds_per_tick
+        self._tick_range_end = self._tick_range_start + self.seconds_per_tick
 
     def get_interval_test(self):
         tick_min, tick_max = self.get_tick_range()
@@ -45,51 +124,372 @@ class TimingBloomFilter(CountingBloomFilter):
             return lambda x : x != 0 and not tick_max < x <= tick_min
 
     def add(self, key, timestamp=None):
-        tick = self.get_tick(timestamp)
+        """
+        Adds the key at the given timestamp (or now) and returns the number of
+        buckets that became non-zero
+        """
+        if self.stats is not None:
+            self.stats.counts[ADDS] += 1
         if timestamp:
-            if timestamp < time.time() - self.decay_time:
-                return
+            tick = self.get_tick(timestamp)
+            self.clock.observe(timestamp)
+            if timestamp < self.clock.time() - self.decay_time:
+                return 0
+        else:
+            tick = self.get_tick_range()[1]
         if self._optimize and self.data.flags['C_CONTIGUOUS']:
-            self.num_non_zero += _optimizations.timing_bloom_add(self.data, self.get_indexes(key), tick)
+            num_new = _optimizations.timing_bloom_add(self.data, self.get_indexes(key), tick)
         else:
+            num_new = 0
             for index in self.get_indexes(key):
-                self.num_non_zero += (self.data[index] == 0)
+                num_new += (self.data[index] == 0)
                 self.data[index] = tick
+        self.num_non_zero += num_new
+        return num_new
 
-    def contains(self, key):
+    def add_batch(self, keys, timestamps=None):
         """
-        Check if the current bloom contains the key `key`
+        Adds the keys, each at the matching timestamp or now, and returns the
+        number of buckets that became non-zero.  Keys older than
+        ``decay_time`` are skipped.  Unlike ``add``, buckets that hold a more
+        recent tick keep it so that the order of the keys doesn't matter.
         """
+        if self.stats is not None:
+            self.stats.counts[ADDS] += len(keys)
+        if timestamps is not None and len(timestamps):
+            self.clock.observe(np.max(timestamps))
+        keys, ticks = self.get_batch_ticks(keys, timestamps)
+        return self._add_batch(keys, ticks)[1]
+
+    def get_batch_ticks(self, keys, timestamps=None):
+        """
+        Returns the keys that are within ``decay_time`` of the clock along
+        with a uint8 array of the tick each of them should be added at
+        """
+        if timestamps is None:
+            return keys, np.full((len(keys),), self.get_tick_range()[1], dtype=np.uint8)
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        live = timestamps >= self.clock.time() - self.decay_time
+        if not live.all():
+            keys = list(itertools.compress(keys, live.tolist()))
+            timestamps = timestamps[live]
+        ticks = (timestamps // self.seconds_per_tick) % self.ring_size + 1
+        return keys, ticks.astype(np.uint8)
+
+    def _add_batch(self, keys, ticks, start=0, max_new=None):
+        """
+        Adds ``keys[start:]`` at ``ticks[start:]`` until ``max_new`` buckets
+        became non-zero, always adding at least one key.  Returns the index of
+        the first key that wasn't added and the number of new buckets.
+        """
+        max_new = _MAX_NEW if max_new is None else int(min(max_new, _MAX_NEW))
         if self._optimize and self.data.flags['C_CONTIGUOUS']:
-            tick_min, tick_max = self.get_tick_range()
-            return bool(_optimizations.timing_bloom_contains(self.data, self.get_indexes(key), tick_min, tick_max))
+            descriptor = np.array(self.get_descriptor(), dtype=np.int64)
+            end, num_new = _optimizations.timing_bloom_add_batch(keys, ticks, start, descriptor, max_new)
+        else:
+            tick_max = self.get_tick_range()[1]
+            num_new = 0
+            end = start
+            while end < len(keys) and (end == start or num_new < max_new):
+                tick = int(ticks[end])
+                age = (tick_max - tick) % self.ring_size
+                for index in self.get_indexes(keys[end]):
+                    value = int(self.data[index])
+                    if value == 0:
+                        num_new += 1
+                    elif (tick_max - value) % self.ring_size < age:
+                        continue
+                    self.data[index] = tick
+                end += 1
+        self.num_non_zero += num_new
+        return end, num_new
+
+    def add_if_new(self, key):
+        """
+        Adds the key now and returns whether the bloom didn't contain it
+        before, hashing it only once
+        """
+        if self.stats is not None:
+            self.stats.counts[ADDS] += 1
+        is_new = self._add_if_new_batch([key], np.zeros((1,), dtype=np.bool_))[0]
+        if self.stats is not None:
+            self.stats.record_contains(not is_new)
+        return bool(is_new)
+
+    def add_if_new_batch(self, keys):
+        """
+        Runs ``add_if_new`` over the keys in order and returns a bool array
+        of which of them were new.  Repeats of a key within the batch aren't
+        new.
+        """
+        if self.stats is not None:
+            self.stats.counts[ADDS] += len(keys)
+        result = self._add_if_new_batch(keys, np.zeros((len(keys),), dtype=np.bool_))
+        if self.stats is not None:
+            num_new_keys = int(np.count_nonzero(result))
+            self.stats.record_contains(len(keys) - num_new_keys, len(keys))
+        return result
+
+    def _add_if_new_batch(self, keys, result):
+        if self._optimize and self.data.flags['C_CONTIGUOUS']:
+            table = np.array([self.get_descriptor()], dtype=np.int64)
+            _, num_new = _optimizations.timing_bloom_multi_add_if_new_batch(keys, table, 0, 0, _MAX_NEW, result)
         else:
             test_interval = self.get_interval_test()
-            return all(test_interval(self.data[index]) for index in self.get_indexes(key))
+            tick = self.get_tick_range()[1]
+            num_new = 0
+            for i, key in enumerate(keys):
+                indexes = list(self.get_indexes(key))
+                result[i] = not all(test_interval(self.data[index]) for index in indexes)
+                for index in indexes:
+                    num_new += (self.data[index] == 0)
+                    self.data[index] = tick
+        self.num_non_zero += num_new
+        return result
 
-    def decay(self):
+    def contains(self, key):
+        """
+        Check if the current bloom contains the key `key`
+        """
         if self._optimize and self.data.flags['C_CONTIGUOUS']:
-            logging.info("Starting optimized decay")
             tick_min, tick_max = self.get_tick_range()
-            self.num_non_zero = _optimizations.timing_bloom_decay(self.data, tick_min, tick_max)
-            logging.info("Optimized decay finished")
+            result = bool(_optimizations.timing_bloom_contains(self.data, self.get_indexes(key), tick_min, tick_max))
         else:
-            logging.info("Starting un-optimized decay")
             test_interval = self.get_interval_test()
-            self.num_non_zero = 0
-            for i in xrange(self.num_bytes):
-                value = self.data[i]
-                if value != 0:
-                    if not test_interval(value):
-                        self.data[i] = 0
-                    else:
-                        self.num_non_zero += 1
-            logging.info("Un-optimized decay finished")
+            result = all(test_interval(self.data[index]) for index in self.get_indexes(key))
+        if self.stats is not None:
+            self.stats.record_contains(result)
+        return result
+
+    def last_seen(self, key):
+        """
+        Returns roughly how many seconds ago the key was last added, or None
+        if the bloom doesn't contain it.  The age is that of the oldest of the
+        key's buckets rounded down to a whole number of ticks, so it can be
+        up to ``seconds_per_tick`` short, and less again when all of the
+        buckets were since set by other keys.
+        """
+        age = self._get_age(key)
+        if self.stats is not None:
+            self.stats.record_contains(age is not None)
+        return age * self.seconds_per_tick if age is not None else None
+
+    def contains_between(self, key, start, end):
+        """
+        Check if the key was last added between the timestamps ``start`` and
+        ``end``, to the precision of a tick.  Keys that were added in the
+        range and again after ``end`` aren't in it anymore.
+        """
+        min_age, max_age = self.get_age_range(start, end)
+        age = self._get_age(key)
+        result = age is not None and min_age <= age <= max_age
+        if self.stats is not None:
+            self.stats.record_contains(result)
+        return result
+
+    def contains_between_batch(self, keys, start, end):
+        """
+        Runs ``contains_between`` over the keys and returns a bool array of
+        which of them were last added between ``start`` and ``end``
+        """
+        min_age, max_age = self.get_age_range(start, end)
+        if min_age > max_age:
+            result = np.zeros((len(keys),), dtype=np.bool_)
+        elif self._optimize and self.data.flags['C_CONTIGUOUS']:
+            table = np.array([self.get_descriptor()], dtype=np.int64)
+            result = _optimizations.timing_bloom_multi_contains_between_batch(keys, table, min_age, max_age)
+        else:
+            ages = [self._get_age(key) for key in keys]
+            result = np.array([age is not None and min_age <= age <= max_age for age in ages], dtype=np.bool_)
+        if self.stats is not None:
+            self.stats.record_contains(int(np.count_nonzero(result)), len(result))
+        return result
+
+    def get_age_range(self, start, end):
+        """
+        Returns the youngest and oldest age, in ticks, of the live buckets
+        that were set between the timestamps ``start`` and ``end``.  The
+        range is empty when the youngest age is larger than the oldest, and
+        both ages are clamped to ``[-1, dN]`` so that they fit in a C int.
+        """
+        tick_number = self.clock.time() // self.seconds_per_tick
+        min_age = min(max(tick_number - end // self.seconds_per_tick, 0), self.dN)
+        max_age = max(min(tick_number - start // self.seconds_per_tick, self.dN - 1), -1)
+        return int(min_age), int(max_age)
+
+    def _get_age(self, key):
+        """
+        Returns the age, in ticks, of the oldest of the key's buckets or None
+        if some of them aren't live
+        """
+        if self._optimize and self.data.flags['C_CONTIGUOUS']:
+            table = np.array([self.get_descriptor()], dtype=np.int64)
+            return _optimizations.timing_bloom_multi_last_seen(key, table)
+
+        test_interval = self.get_interval_test()
+        tick_max = self.get_tick_range()[1]
+        ticks = [self.data[index] for index in self.get_indexes(key)]
+        if not all(test_interval(tick) for tick in ticks):
+            return None
+        return max((tick_max - int(tick)) % self.ring_size for tick in ticks)
+
+    def get_descriptor(self):
+        """
+        Returns the row describing this bloom in a descriptor table: the
+        address of the data, the number of buckets, the number of hashes and
+        the current tick range.  The row is only valid while ``self.data`` is
+        kept alive.
+        """
+        tick_min, tick_max = self.get_tick_range()
+        return (self.data.ctypes.data, self.num_bytes, self.num_hashes, tick_min, tick_max)
+
+    def decay(self):
+        start_time = time.time()
+        with trace('decay', bloom=self) as info:
+            self.refresh_tick_range()
+            if self._optimize and self.data.flags['C_CONTIGUOUS']:
+                logging.info("Starting optimized decay")
+                tick_min, tick_max = self.get_tick_range()
+                self.num_non_zero = _optimizations.timing_bloom_decay(self.data, tick_min, tick_max)
+                logging.info("Optimized decay finished")
+            else:
+                logging.info("Starting un-optimized decay")
+                test_interval = self.get_interval_test()
+                self.num_non_zero = 0
+                for i in xrange(self.num_bytes):
+                    value = self.data[i]
+                    if value != 0:
+                        if not test_interval(value):
+                            self.data[i] = 0
+                        else:
+                            self.num_non_zero += 1
+                logging.info("Un-optimized decay finished")
+            info['num_non_zero'] = self.num_non_zero
+        if self.stats is not None:
+            self.stats.record_decay(start_time)
+
+    def get_stats(self):
+        """
+        Returns a snapshot of the recorded stats along with the fill factor
+        and estimated error of the bloom, or None if stats aren't enabled
+        """
+        if self.stats is None:
+            return None
+        snapshot = self.stats.snapshot()
+        snapshot['blooms'] = [get_bloom_gauges(self)]
+        return snapshot
+
+    def get_cells(self, start=0, end=None):
+        """
+        Returns a copy of the buckets from ``start`` to ``end`` (all of them
+        by default) with one uint8 tick per bucket regardless of how the
+        data is packed
+        """
+        if end is None:
+            end = self.num_bytes
+        if self._ENTRIES_PER_8BYTE == 1:
+            return self.data[start:end].copy()
+        data = self.data[start // 2:(end + 1) // 2]
+        cells = np.empty((data.shape[0] * 2,), dtype=np.uint8)
+        cells[0::2] = data >> 4
+        cells[1::2] = data & 0x0f
+        return cells[start % 2:start % 2 + end - start]
+
+    def set_cells(self, cells):
+        """
+        Replaces the buckets (and the number of buckets) with the given array
+        of one uint8 tick per bucket
+        """
+        self.data = self._pack_cells(cells)
+        self.num_bytes = cells.shape[0]
+        self.num_non_zero = int(np.count_nonzero(cells))
+
+    def _pack_cells(self, cells):
+        if self._ENTRIES_PER_8BYTE == 1:
+            return np.array(cells, dtype=np.uint8, order='C')
+        num_bytes = cells.shape[0]
+        padded = np.zeros((num_bytes + num_bytes % 2,), dtype=np.uint8)
+        padded[:num_bytes] = cells
+        return np.ascontiguousarray((padded[0::2] << 4) | padded[1::2])
+
+    def newest_ticks(self, first, second):
+        """
+        Combines two arrays of ticks bucket by bucket, keeping the most recent
+        live tick of the two.  Expired ticks are dropped.
+        """
+        return self.fold_ticks(np.concatenate((first, second)), first.shape[0])
+
+    def fold_ticks(self, cells, num_bytes):
+        """
+        Folds an array of ticks whose length is a multiple of ``num_bytes``
+        down to ``num_bytes`` buckets, keeping the most recent live tick of
+        all the buckets ``i``, ``i + num_bytes``, ``i + 2 * num_bytes``, ...
+        Expired ticks are dropped.
+        """
+        tick_min, tick_max = self.get_tick_range()
+        cells = cells.reshape((-1, num_bytes))
+        ages = (tick_max - cells.astype(np.int16)) % self.ring_size
+        ages[(cells == 0) | (ages >= self.dN)] = self.ring_size
+
+        newest = ages.argmin(axis=0)
+        columns = np.arange(num_bytes)
+        result = cells[newest, columns]
+        result[ages[newest, columns] == self.ring_size] = 0
+        return result
+
+    def fold_blooms(self, blooms, block_size=FOLD_BLOCK_SIZE):
+        """
+        Folds the buckets of ``blooms``, whose numbers of buckets must be
+        multiples of this bloom's, like ``fold_ticks`` would and returns the
+        packed data for this bloom along with its number of non-zero
+        buckets.  The bloom itself isn't changed.  Buckets are folded
+        ``block_size`` at a time so that the memory used besides the
+        returned data doesn't grow with the size of the blooms.
+        """
+        num_bytes = self.num_bytes
+        width = min(num_bytes, block_size)
+        rows_per_chunk = max(block_size // num_bytes, 1)
+        data = np.empty_like(self.data)
+        num_non_zero = 0
+        for column in xrange(0, num_bytes, width):
+            end = min(column + width, num_bytes)
+            cells = np.zeros((end - column,), dtype=np.uint8)
+            for bloom in blooms:
+                num_rows = bloom.num_bytes // num_bytes
+                for row in xrange(0, num_rows, rows_per_chunk):
+                    last_row = min(row + rows_per_chunk, num_rows) - 1
+                    chunk = bloom.get_cells(row * num_bytes + column, last_row * num_bytes + end)
+                    cells = self.fold_ticks(np.concatenate((cells, chunk)), end - column)
+            packed = self._pack_cells(cells)
+            offset = column // self._ENTRIES_PER_8BYTE
+            data[offset:offset + packed.shape[0]] = packed
+            num_non_zero += int(np.count_nonzero(cells))
+        return data, num_non_zero
+
+    def shrink(self):
+        """
+        Halves the number of buckets in place by folding bucket ``i +
+        num_bytes / 2`` onto bucket ``i`` and keeping the newest tick of the
+        two.  Since indexes are taken modulo the number of buckets this is
+        exact for the power of two sizes of ``foldable`` blooms.  The capacity
+        is halved along with the size.  Returns whether the bloom was shrunk.
+        """
+        if not self.foldable or self.num_bytes < 2:
+            return False
+
+        self.set_cells(self.fold_ticks(self.get_cells(), self.num_bytes // 2))
+        self.folds += 1
+        self.capacity = self.unfolded_capacity // (1 << self.folds)
+        return True
 
     def get_meta(self):
         meta = super(TimingBloomFilter, self).get_meta()
+        meta['capacity'] = self.unfolded_capacity
         meta['decay_time'] = self.decay_time
         meta['disable_optimizations'] = not self._optimize
+        meta['foldable'] = self.foldable
+        meta['folds'] = self.folds
         return meta
 
     def remove(self, *args, **kwargs):
@@ -99,7 +499,7 @@ class TimingBloomFilter(CountingBloomFilter):
         raise NotImplementedError
 
     @classmethod
-    def load(cls, data_path):
+    def load(cls, data_path, clock=None):
         logging.info("Loading timing bloom from %s" % data_path)
         kwargs = None
 
@@ -107,6 +507,7 @@ class TimingBloomFilter(CountingBloomFilter):
             kwargs = json.load(meta_file)
 
         kwargs['data_path'] = data_path
+        kwargs['clock'] = clock
 
         capacity = kwargs['capacity']
         del kwargs['capacity']
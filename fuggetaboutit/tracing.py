@@ -0,0 +1,82 @@
+"""
+Hooks that are called at the start and end of the slow operations of the
+blooms (decays, scale ups, cleanups, compactions and saves) so that they can
+be traced or profiled without patching the library::
+
+    def log_slow(event, phase, info):
+        if phase == 'end' and info['duration'] > 0.1:
+            logging.warning("%s took %fs", event, info['duration'])
+
+    tracing.add_hook(log_slow)
+
+Every hook is called as ``hook(event, phase, info)`` where ``phase`` is
+``'start'`` or ``'end'`` and ``info`` is a dict holding the bloom and the
+metadata of the event.  The same dict is passed to both phases, with the
+``duration`` in seconds and any results of the operation added for the
+``'end'`` call.
+"""
+
+import cProfile
+from contextlib import contextmanager
+import logging
+import time
+
+_hooks = []
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _call_hooks(event, phase, info):
+    for hook in list(_hooks):
+        try:
+            hook(event, phase, info)
+        except Exception:
+            logging.exception("Tracing hook %r failed on %s %s", hook, phase, event)
+
+
+@contextmanager
+def trace(event, **info):
+    """
+    Calls the hooks around the body of the ``with`` block.  The info dict is
+    yielded so that the block can add the results of the operation.
+    """
+    if not _hooks:
+        yield info
+        return
+
+    _call_hooks(event, 'start', info)
+    start_time = time.time()
+    try:
+        yield info
+    finally:
+        info['duration'] = time.time() - start_time
+        _call_hooks(event, 'end', info)
+
+
+class ProfileHook(object):
+    """
+    Hook that runs a ``cProfile.Profile`` during the given events.  Read the
+    results from ``profile`` with ``pstats``.
+    """
+    def __init__(self, events=('decay',)):
+        self.events = events
+        self.profile = cProfile.Profile()
+        self._depth = 0
+
+    def __call__(self, event, phase, info):
+        if event not in self.events:
+            return
+        if phase == 'start':
+            if not self._depth:
+                self.profile.enable()
+            self._depth += 1
+        else:
+            self._depth -= 1
+            if not self._depth:
+                self.profile.disable()
@@ -41,6 +41,13 @@ setup(
     install_requires = [
         "numpy",
         "mmh3",
-        "tornado>=3",
+        "tornado>=4",
     ],
+
+    entry_points = {
+        'console_scripts': [
+            'fuggetaboutit-server = fuggetaboutit.server:main',
+            'fuggetaboutit-dedup = fuggetaboutit.dedup:main',
+        ],
+    },
 )
@@ -0,0 +1,82 @@
+import pytest
+
+from fuggetaboutit.clocks import ManualClock
+from fuggetaboutit.filter_group import FilterGroup
+from fuggetaboutit.tickers import ClockTicker
+from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
+from fuggetaboutit import tracing
+
+
+def get_group(clock, disable_optimizations=False, **kwargs):
+    blooms = [
+        TimingBloomFilter(capacity=1000, decay_time=70, clock=clock,
+                          disable_optimizations=disable_optimizations),
+        TimingBloomFilter(capacity=5000, decay_time=700, clock=clock,
+                          disable_optimizations=disable_optimizations),
+    ]
+    return FilterGroup(blooms, **kwargs)
+
+
+def test_add_and_contains():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        group = get_group(clock, disable_optimizations)
+        group.add('a')
+        group.add_batch(['b', 'c'])
+
+        assert 0b11 == group.contains('a')
+        assert 0 == group.contains('d')
+        assert [0b11, 0b11, 0] == list(group.contains_batch(['b', 'c', 'd']))
+        for bloom in group.blooms:
+            assert bloom.contains('a')
+            assert bloom.num_non_zero == (bloom.get_cells() != 0).sum()
+
+        # only the member with the longer window still has the keys
+        clock.advance(100)
+        assert 0b10 == group.contains('a')
+        assert [0b10, 0b10, 0] == list(group.contains_batch(['b', 'c', 'd']))
+
+
+def test_matches_members():
+    clock = ManualClock(1e9)
+    group = get_group(clock)
+    keys = [str(i) for i in xrange(2000)]
+    group.add_batch(keys[:1000])
+    clock.advance(50)
+    for key in keys[1000:1500]:
+        group.add(key)
+    clock.advance(30)
+
+    expected = [sum(bloom.contains(key) << i for i, bloom in enumerate(group.blooms)) for key in keys]
+    assert expected == list(group.contains_batch(keys))
+    assert expected == [group.contains(key) for key in keys]
+
+
+def test_decays_are_staggered():
+    clock = ManualClock(1e9)
+    group = get_group(clock, ticker=ClockTicker(clock))
+    decays = []
+    def hook(event, phase, info):
+        if event == 'decay' and phase == 'start':
+            decays.append((clock.time(), group.blooms.index(info['bloom'])))
+
+    tracing.add_hook(hook)
+    try:
+        for _ in xrange(2000):
+            clock.advance(1)
+    finally:
+        tracing.remove_hook(hook)
+
+    # every member decays once per tick and never at the same time as another
+    assert 200 == sum(1 for _, i in decays if i == 0)
+    assert 20 == sum(1 for _, i in decays if i == 1)
+    times = [time for time, _ in decays]
+    assert len(times) == len(set(times))
+
+
+def test_needs_a_shared_clock():
+    blooms = [TimingBloomFilter(capacity=100, decay_time=70, clock=ManualClock()) for _ in xrange(2)]
+    with pytest.raises(ValueError):
+        FilterGroup(blooms)
+    with pytest.raises(ValueError):
+        FilterGroup([])
@@ -0,0 +1,26 @@
+import pytest
+
+tornado_testing = pytest.importorskip("tornado.testing")
+
+from fuggetaboutit.metrics import get_metrics_app
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.stats import BloomStats
+
+
+class MetricsHandlerTests(tornado_testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=86400, stats=BloomStats())
+        return get_metrics_app(self.bloom)
+
+    def test_metrics(self):
+        self.bloom.add('a')
+        self.bloom.decay()
+
+        response = self.fetch('/metrics')
+
+        assert 200 == response.code
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        lines = response.body.splitlines()
+        assert 'fuggetaboutit_blooms 1.0' in lines
+        assert 'fuggetaboutit_adds_total 1.0' in lines
+        assert 'fuggetaboutit_decay_seconds_count 1.0' in lines
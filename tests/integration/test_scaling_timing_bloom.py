@@ -1,8 +1,17 @@
 from copy import copy
+import os
 import time
 import random
 
+import pytest
+
+from fuggetaboutit.clocks import ManualClock, WatermarkClock
+from fuggetaboutit.growth_policies import RateGrowthPolicy
+from fuggetaboutit.monitor import FalsePositiveMonitor
 from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.stats import BloomStats
+from fuggetaboutit.tickers import ClockTicker
+from fuggetaboutit import tracing
 
 
 BLOOM_DEFAULTS = {
@@ -219,8 +228,405 @@ def test_save_and_load_with_scaling(tmpdir):
     assert not third_gen_bloom.contains('201')
 
 
+def test_save_removes_cleaned_up_blooms(tmpdir):
+    testing_dir = tmpdir.mkdir('bloom_test')
+    temp_path = str(testing_dir)
+    clock = ManualClock(1e9)
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=100, data_path=temp_path,
+                                     clock=clock, min_fill_factor=None)
+    for i in range(170):
+        bloom.add('old-%d' % i)
+    clock.advance(60)
+    for i in range(10):
+        bloom.add('new-%d' % i)
+    assert 2 == len(bloom.blooms)
+    bloom.save()
+    assert 2 == len(testing_dir.join('blooms').listdir())
+
+    # The sub-blooms were created without a data_path of their own, so the
+    # cleanup only drops the expired one from memory
+    clock.advance(60)
+    bloom.decay()
+    assert 1 == len(bloom.blooms)
+    assert 2 == len(testing_dir.join('blooms').listdir())
+
+    bloom.save()
+    assert 1 == len(testing_dir.join('blooms').listdir())
+
+    loaded = ScalingTimingBloomFilter.load(temp_path, clock=clock)
+    assert 1 == len(loaded.blooms)
+    assert loaded.contains('new-1')
+    assert not loaded.contains('old-1')
+
+
 def test_scaling_bloom_accuracy(tmpdir):
     testing_dir = tmpdir.mkdir('bloom_test')
     temp_path = str(testing_dir)
 
     test_words = get_pseudorandom_words(num_words=9000)
+
+
+def test_single_call_probe_matches_sub_blooms():
+    # Get a bloom that has scaled a few times
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=86400)
+    words = get_pseudorandom_words(num_words=2000, word_length=23)
+    for word in words[:1000]:
+        bloom.add(word)
+    assert len(bloom.blooms) > 2
+
+    # Use keys of every length to exercise all of the hashing code paths
+    keys = words + ['x' * n for n in range(40)]
+    expected = [any(sub.contains(key) for sub in bloom.blooms) for key in keys]
+
+    assert expected == [bloom.contains(key) for key in keys]
+    assert expected == list(bloom.contains_batch(keys))
+    assert all(expected[:1000])
+
+
+def test_contains_batch_without_optimizations():
+    bloom = get_bloom(disable_optimizations=True)
+
+    result = bloom.contains_batch(['1', '50', '101'])
+
+    assert [True, True, False] == list(result)
+
+
+def test_scaling_with_prewarm():
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=86400, prewarm_fill_factor=0.5)
+    words = get_pseudorandom_words(num_words=1000)
+    for word in words:
+        bloom.add(word)
+
+    # The bloom should have scaled using the prewarmed blooms
+    assert len(bloom.blooms) > 2
+    assert [0, 1] == [sub.id for sub in bloom.blooms[:2]]
+    assert all(bloom.contains(word) for word in words)
+
+
+def test_rate_growth_policy_converges():
+    policy = RateGrowthPolicy(min_elapsed=0)
+    bloom = ScalingTimingBloomFilter(capacity=100, decay_time=1000, growth_policy=policy)
+    words = get_pseudorandom_words(num_words=5000)
+
+    # Simulate having seen 50 items over 100 seconds
+    policy.start_time -= 100
+    for word in words[:50]:
+        bloom.add(word)
+    capacity = bloom.get_capacity_for_id(1)
+    assert 500 < capacity < 1000
+
+    # A burst gets absorbed by a few sub-blooms
+    for word in words:
+        bloom.add(word)
+    assert len(bloom.blooms) <= 3
+    assert all(bloom.contains(word) for word in words)
+
+
+def test_compact():
+    bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=86400, foldable=True)
+    words = get_pseudorandom_words(num_words=400)
+
+    # Spread the words over a few sub-blooms
+    for word in words[:100]:
+        bloom.add(word)
+    bloom._add_new_bloom()
+    bloom._add_new_bloom()
+    for word in words[100:200]:
+        bloom.add(word)
+    assert 3 == len(bloom.blooms)
+    expected_error = bloom.get_expected_error()
+
+    # Everything ends up in the first bloom
+    assert bloom.compact()
+    assert [0] == [sub.id for sub in bloom.blooms]
+    assert all(bloom.contains(word) for word in words[:200])
+    false_positives = sum(bloom.contains(word) for word in words[200:])
+    assert false_positives <= 200 * expected_error + 1
+
+
+def test_compact_would_overfill():
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=86400, foldable=True)
+    words = get_pseudorandom_words(num_words=1000)
+    for word in words:
+        bloom.add(word)
+    num_blooms = len(bloom.blooms)
+    assert num_blooms > 2
+
+    assert not bloom.compact()
+    assert num_blooms == len(bloom.blooms)
+    assert all(bloom.contains(word) for word in words)
+
+
+def test_compact_not_foldable():
+    bloom = get_bloom()
+    bloom._add_new_bloom()
+    bloom.add('new')
+
+    assert not bloom.compact()
+    assert 2 == len(bloom.blooms)
+
+
+def get_status_bytes(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+
+
+def test_compact_peak_memory():
+    if not os.access('/proc/self/clear_refs', os.W_OK):
+        pytest.skip("Needs /proc/self/clear_refs to reset the peak RSS")
+
+    # Fill a few large sub-blooms with live ticks
+    bloom = ScalingTimingBloomFilter(capacity=200000, decay_time=86400, foldable=True)
+    bloom._add_new_bloom()
+    bloom._add_new_bloom()
+    for sub_bloom in bloom.blooms:
+        tick = sub_bloom.get_tick_range()[1]
+        sub_bloom.data.fill(tick << 4 | tick if sub_bloom._ENTRIES_PER_8BYTE == 2 else tick)
+        sub_bloom.num_non_zero = sub_bloom.num_bytes
+    data_nbytes = bloom.get_data_nbytes()
+
+    # Reset the peak RSS to the current RSS
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+    rss = get_status_bytes('VmRSS')
+
+    # Folding everything would overfill the target, which is only known
+    # once the blooms were folded
+    assert not bloom.compact()
+
+    # Only a copy of the smallest bloom and a block at a time were allocated
+    assert get_status_bytes('VmHWM') - rss < data_nbytes / 2
+
+
+def test_max_bytes():
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=86400, max_bytes=20000)
+    words = get_pseudorandom_words(num_words=5000)
+    for word in words:
+        bloom.add(word)
+
+    # Growth stops at the budget and the error rises instead
+    assert bloom.saturated
+    assert bloom.get_data_nbytes() <= 20000
+    assert bloom.get_current_error() > bloom.get_expected_error()
+    assert all(bloom.contains(word) for word in words)
+
+
+def test_get_stats():
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=86400, stats=BloomStats())
+    words = get_pseudorandom_words(num_words=1000)
+    for word in words:
+        bloom.add(word)
+    bloom.contains_batch(words[:10] + ['missing'])
+    bloom.contains('missing')
+    bloom.decay()
+
+    stats = bloom.get_stats()
+    assert 1000 == stats['adds']
+    assert 10 == stats['contains_hits']
+    assert 2 == stats['contains_misses']
+    assert len(bloom.blooms) - 1 == stats['scale_ups']
+    assert 1 == stats['decay']['count']
+    assert [sub.id for sub in bloom.blooms] == [gauges['id'] for gauges in stats['blooms']]
+    assert all(0 < gauges['fill_factor'] < 1 for gauges in stats['blooms'])
+
+
+def test_false_positive_monitor_scales_on_measured_error():
+    monitor = FalsePositiveMonitor(batch_size=1000, min_probes=1000)
+    bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=86400, monitor=monitor)
+
+    # Overfill the sub-bloom behind the scaling bloom's back so that its
+    # estimated size says it's empty
+    for word in get_pseudorandom_words(num_words=5000):
+        bloom.blooms[0].add(word)
+    bloom.blooms[0].num_non_zero = 0
+    assert bloom.blooms[0] is bloom.get_active_bloom()
+
+    monitor.run()
+
+    assert monitor.get_error(bloom.blooms[0]) > bloom.blooms[0].error
+    assert 2 == len(bloom.blooms)
+    assert bloom.blooms[1] is bloom.get_active_bloom()
+
+
+def test_tracing_hooks(tmpdir):
+    events = []
+    def hook(event, phase, info):
+        events.append((event, phase))
+        if phase == 'end':
+            assert info['duration'] >= 0
+
+    tracing.add_hook(hook)
+    try:
+        bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=86400, data_path=str(tmpdir))
+        bloom.add('a')
+        bloom.decay()
+        bloom.save()
+    finally:
+        tracing.remove_hook(hook)
+
+    assert [
+        ('add_new_bloom', 'start'), ('add_new_bloom', 'end'),
+        ('decay', 'start'),
+        ('decay', 'start'), ('decay', 'end'),
+        ('decay', 'end'),
+        ('save', 'start'),
+        ('save', 'start'), ('save', 'end'),
+        ('save', 'end'),
+    ] == events
+
+
+def test_memory_usage():
+    bloom = ScalingTimingBloomFilter(capacity=200, decay_time=86400)
+    for word in get_pseudorandom_words(num_words=1000):
+        bloom.add(word)
+
+    usage = bloom.memory_usage()
+
+    assert bloom.get_data_nbytes() == usage['nbytes']
+    assert [sub.id for sub in bloom.blooms] == [sub['id'] for sub in usage['blooms']]
+    assert all(4 == sub['bits_per_cell'] for sub in usage['blooms'])
+    assert 0 == usage['mapped_bytes']
+    assert usage['resident_bytes'] is None or usage['resident_bytes'] <= usage['nbytes']
+    assert 8 * usage['nbytes'] / bloom.get_size() == usage['bits_per_item']
+
+
+def test_clock_ticker_decays_backfill(tmpdir):
+    clock = WatermarkClock()
+    bloom = ScalingTimingBloomFilter(
+        capacity=500, decay_time=3600, ticker=ClockTicker(clock), clock=clock,
+        data_path=str(tmpdir),
+    )
+
+    # Replay a day of events, one per second, with ticks decaying on the way
+    start = 1e9
+    for i in xrange(0, 86400, 10):
+        bloom.add(str(i), timestamp=start + i)
+
+    assert start + 86390 == clock.time()
+    assert len(bloom.blooms) == 1
+    assert bloom.contains('86390')
+    assert not bloom.contains('0')
+    assert bloom.get_size() < 500
+
+    # Loaded blooms share the clock they're given
+    bloom.save()
+    reloaded = ScalingTimingBloomFilter.load(str(tmpdir), clock=clock)
+    assert all(sub_bloom.clock is clock for sub_bloom in reloaded.blooms)
+    assert reloaded.contains('86390')
+
+
+def test_add_batch_scales_like_add():
+    keys = get_pseudorandom_words(5000)
+    bloom = ScalingTimingBloomFilter(capacity=500, decay_time=3600)
+    batch_bloom = ScalingTimingBloomFilter(capacity=500, decay_time=3600)
+    for key in keys:
+        bloom.add(key)
+
+    assert len(keys) == batch_bloom.add_batch(keys)
+    assert len(bloom.blooms) == len(batch_bloom.blooms) > 1
+    for sub_bloom, batch_sub_bloom in zip(bloom.blooms, batch_bloom.blooms):
+        assert (sub_bloom.data == batch_sub_bloom.data).all()
+    assert batch_bloom.contains_batch(keys).all()
+
+
+def test_add_batch_decays_between_ticks():
+    clock = WatermarkClock()
+    bloom = ScalingTimingBloomFilter(capacity=5000, decay_time=700, clock=clock,
+                                     ticker=ClockTicker(clock))
+    decays = []
+    def hook(event, phase, info):
+        if event == 'decay' and phase == 'start' and info['bloom'] is bloom:
+            decays.append(info)
+
+    tracing.add_hook(hook)
+    try:
+        # a batch that spans twice the decay time keeps all of its keys
+        timestamps = [1e9 + i for i in xrange(1400)]
+        assert 1400 == bloom.add_batch([str(i) for i in xrange(1400)], timestamps)
+    finally:
+        tracing.remove_hook(hook)
+
+    assert len(decays) >= 14
+    assert bloom.contains('1399')
+    assert not bloom.contains('0')
+
+
+def test_add_if_new_scales_like_add():
+    keys = get_pseudorandom_words(5000)
+    for disable_optimizations in (False, True):
+        bloom = ScalingTimingBloomFilter(capacity=500, decay_time=3600,
+                                         disable_optimizations=disable_optimizations)
+        new_bloom = ScalingTimingBloomFilter(capacity=500, decay_time=3600,
+                                             disable_optimizations=disable_optimizations)
+        expected = []
+        for key in keys:
+            expected.append(not bloom.contains(key))
+            bloom.add(key)
+
+        assert expected == list(new_bloom.add_if_new_batch(keys[:2500])) + \
+            [new_bloom.add_if_new(key) for key in keys[2500:]]
+        assert len(bloom.blooms) == len(new_bloom.blooms) > 1
+        for sub_bloom, new_sub_bloom in zip(bloom.blooms, new_bloom.blooms):
+            assert (sub_bloom.data == new_sub_bloom.data).all()
+            assert sub_bloom.num_non_zero == new_sub_bloom.num_non_zero
+        assert not new_bloom.add_if_new_batch(keys).any()
+
+
+def test_last_seen_across_blooms():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        bloom = ScalingTimingBloomFilter(capacity=100, decay_time=70, clock=clock,
+                                         disable_optimizations=disable_optimizations)
+        bloom.add('a')
+        clock.advance(40)
+        for i in range(500):
+            bloom.add(str(i))
+        assert len(bloom.blooms) > 1
+
+        assert 40 - bloom.seconds_per_tick <= bloom.last_seen('a') <= 40
+        # the most recent add wins over older ones in other blooms
+        bloom.add('a')
+        assert 0 == bloom.last_seen('a')
+        assert 0 == bloom.last_seen('499')
+        assert bloom.last_seen('missing') is None
+
+
+def test_contains_between_across_blooms():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        bloom = ScalingTimingBloomFilter(capacity=100, decay_time=70, clock=clock,
+                                         disable_optimizations=disable_optimizations)
+        bloom.add('a')
+        clock.advance(40)
+        for i in range(500):
+            bloom.add(str(i))
+        bloom.add('a')
+        assert len(bloom.blooms) > 1
+
+        # the older add is still remembered by the first bloom
+        assert bloom.contains_between('a', 1e9 - 5, 1e9 + 5)
+        assert bloom.contains_between('a', 1e9 + 35, 1e9 + 45)
+        assert not bloom.contains_between('a', 1e9 + 15, 1e9 + 25)
+        assert [True, True, False] == list(bloom.contains_between_batch(['a', '499', 'missing'], 1e9 + 35, 1e9 + 45))
+        assert not bloom.contains_between_batch(['a', '499'], 1e9 + 15, 1e9 + 25).any()
+        # the sub-blooms answer batches like they answer single keys
+        for sub_bloom in bloom.blooms:
+            assert [sub_bloom.contains_between(key, 1e9 + 35, 1e9 + 45) for key in ('a', '0', '499')] == \
+                list(sub_bloom.contains_between_batch(['a', '0', '499'], 1e9 + 35, 1e9 + 45))
+
+
+def test_contains_between_outside_the_window():
+    for disable_optimizations in (False, True):
+        bloom = ScalingTimingBloomFilter(1000, decay_time=1,
+                                         disable_optimizations=disable_optimizations)
+        bloom.add('a')
+        now = time.time()
+
+        # ranges long before and far after the window are empty
+        assert not bloom.contains_between('a', 0, 100)
+        assert not bloom.contains_between('a', now + 1e6, now + 2e6)
+        assert not bloom.contains_between_batch(['a'], 0, 100).any()
+        assert not bloom.contains_between_batch(['a'], now + 1e6, now + 2e6).any()
+        assert bloom.contains_between('a', 0, now + 1e6)
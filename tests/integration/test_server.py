@@ -0,0 +1,56 @@
+import pytest
+
+tornado_testing = pytest.importorskip("tornado.testing")
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.server import BloomServer
+
+
+class BloomServerTests(tornado_testing.AsyncTestCase):
+    def setUp(self):
+        super(BloomServerTests, self).setUp()
+        self.bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=86400)
+        self.server = BloomServer(self.bloom, io_loop=self.io_loop)
+        sock, self.port = tornado_testing.bind_unused_port()
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        self.server.stop()
+        super(BloomServerTests, self).tearDown()
+
+    @tornado_testing.gen_test
+    def test_pipelined_commands(self):
+        stream = yield TCPClient(io_loop=self.io_loop).connect('127.0.0.1', self.port)
+
+        # Write all the commands before reading any of the replies
+        yield stream.write(
+            'ADD_IF_NEW a b\n'
+            'ADD c\n'
+            'CONTAINS a b c d\n'
+            'ADD_IF_NEW a d\n'
+        )
+
+        replies = []
+        for _ in range(4):
+            line = yield stream.read_until('\n')
+            replies.append(line.rstrip('\n'))
+
+        assert ['+11', '+OK', '+1110', '+01'] == replies
+        assert self.bloom.contains('d')
+        stream.close()
+
+    @tornado_testing.gen_test
+    def test_line_too_long(self):
+        self.server.max_line_size = 16
+        stream = yield TCPClient(io_loop=self.io_loop).connect('127.0.0.1', self.port)
+
+        # The complete command is still run before the connection is closed
+        yield stream.write('ADD a\n' + 'x' * 32)
+
+        assert '+OK\n' == (yield stream.read_until('\n'))
+        assert (yield stream.read_until('\n')).startswith('-ERR')
+        with pytest.raises(StreamClosedError):
+            yield stream.read_until('\n')
+        assert self.bloom.contains('a')
@@ -1,5 +1,6 @@
 import time
 
+from fuggetaboutit.clocks import ManualClock, WatermarkClock
 from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
 
 
@@ -159,3 +160,126 @@ def test_bloom_repeat_saves_without_optimization(tmpdir):
     assert third_gen_bloom.contains('50')
     assert third_gen_bloom.contains('103')
     assert not third_gen_bloom.contains('105')
+
+
+def test_manual_clock_decay():
+    clock = ManualClock(1e9)
+    bloom = TimingBloomFilter(capacity=1000, decay_time=100, clock=clock)
+    bloom.add('old')
+
+    clock.advance(50)
+    bloom.add('new')
+    bloom.decay()
+    assert bloom.contains('old')
+    assert bloom.contains('new')
+
+    # Once the decay time has passed only the newer key is left
+    clock.advance(60)
+    bloom.decay()
+    assert not bloom.contains('old')
+    assert bloom.contains('new')
+    assert 0 == bloom.add('older', timestamp=clock.time() - 150)
+
+
+def test_watermark_clock_backfill():
+    clock = WatermarkClock()
+    bloom = TimingBloomFilter(capacity=1000, decay_time=100, clock=clock)
+
+    bloom.add('a', timestamp=1e9)
+    bloom.add('b', timestamp=1e9 + 80)
+    assert 1e9 + 80 == clock.time()
+    assert bloom.contains('a')
+
+    # A late event within the window is kept and one outside it dropped
+    assert bloom.add('c', timestamp=1e9 + 20)
+    assert 0 == bloom.add('d', timestamp=1e9 - 50)
+
+    bloom.add('e', timestamp=1e9 + 150)
+    assert not bloom.contains('a')
+    assert bloom.contains('e')
+
+
+def test_add_batch_matches_add():
+    keys = [str(i) for i in range(2000)]
+    for disable_optimizations in (False, True):
+        bloom = TimingBloomFilter(capacity=5000, decay_time=86400,
+                                  disable_optimizations=disable_optimizations)
+        batch_bloom = TimingBloomFilter(capacity=5000, decay_time=86400,
+                                        disable_optimizations=disable_optimizations)
+        for key in keys:
+            bloom.add(key)
+
+        assert bloom.num_non_zero == batch_bloom.add_batch(keys)
+        assert (bloom.data == batch_bloom.data).all()
+        assert bloom.num_non_zero == batch_bloom.num_non_zero
+
+
+def test_add_batch_keeps_newest_tick():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        bloom = TimingBloomFilter(capacity=1000, decay_time=100, clock=clock,
+                                  disable_optimizations=disable_optimizations)
+
+        # An older event that comes second doesn't make the key expire sooner
+        bloom.add_batch(['a', 'a', 'old'], [1e9, 1e9 - 60, 1e9 - 200])
+        clock.advance(60)
+        bloom.decay()
+        assert bloom.contains('a')
+        assert not bloom.contains('old')
+
+
+def test_add_if_new_refreshes_seen_keys():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        bloom = TimingBloomFilter(capacity=1000, decay_time=100, clock=clock,
+                                  disable_optimizations=disable_optimizations)
+
+        assert bloom.add_if_new('a')
+        assert [False, True, False] == list(bloom.add_if_new_batch(['a', 'b', 'b']))
+        clock.advance(60)
+        assert not bloom.add_if_new('a')
+
+        # 'a' was seen again so it outlives 'b'
+        clock.advance(60)
+        assert bloom.contains('a')
+        assert bloom.add_if_new('b')
+
+
+def test_last_seen():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        bloom = TimingBloomFilter(capacity=1000, decay_time=70, clock=clock,
+                                  disable_optimizations=disable_optimizations)
+        bloom.add('a')
+        clock.advance(35)
+        bloom.add('b')
+
+        assert 35 - bloom.seconds_per_tick <= bloom.last_seen('a') <= 35
+        assert 0 == bloom.last_seen('b')
+        assert bloom.last_seen('c') is None
+        clock.advance(40)
+        assert bloom.last_seen('a') is None
+
+
+def test_contains_between():
+    for disable_optimizations in (False, True):
+        clock = ManualClock(1e9)
+        bloom = TimingBloomFilter(capacity=1000, decay_time=70, clock=clock,
+                                  disable_optimizations=disable_optimizations)
+        bloom.add('a')
+        clock.advance(30)
+        bloom.add('b')
+        clock.advance(20)
+
+        assert bloom.contains_between('a', 1e9 - 5, 1e9 + 5)
+        assert not bloom.contains_between('a', 1e9 + 20, 1e9 + 60)
+        assert bloom.contains_between('b', 1e9 + 20, 1e9 + 60)
+        assert not bloom.contains_between('b', 1e9 - 5, 1e9 + 15)
+        assert not bloom.contains_between('c', 1e9 - 5, 1e9 + 60)
+        assert [True, False, False] == list(bloom.contains_between_batch(['a', 'b', 'c'], 1e9 - 5, 1e9 + 5))
+        assert [False, True, False] == list(bloom.contains_between_batch(['a', 'b', 'c'], 1e9 + 20, 1e9 + 60))
+        assert not bloom.contains_between_batch(['a', 'b'], 0, 100).any()
+        # a range that starts before the window only reaches back to it
+        clock.advance(30)
+        assert not bloom.contains_between('a', 1e9 - 100, 1e9 + 100)
+        assert [False, True] == list(bloom.contains_between_batch(['a', 'b'], 1e9 - 100, 1e9 + 100))
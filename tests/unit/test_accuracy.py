@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+
+from fuggetaboutit import accuracy
+
+
+def test_get_arrival_times_spike():
+    rng = np.random.RandomState(1234)
+
+    times = accuracy.get_arrival_times('spike', 10000, 100.0, rng)
+
+    assert 10000 == len(times)
+    assert (np.diff(times) >= 0).all()
+    assert 0 <= times[0] and times[-1] <= 100.0
+    # a tenth of the time gets ten times the rate
+    in_spike = np.count_nonzero((40 <= times) & (times < 50))
+    assert 0.5 < in_spike / 10000.0 < 0.55
+
+
+def test_get_settings():
+    args = accuracy.get_parser().parse_args([
+        '--error', '0.01', '0.001', '--min-fill-factor', '0.2', '0.9', 'none',
+    ])
+
+    settings = list(accuracy.get_settings(args))
+
+    # min_fill_factor=0.9 isn't below max_fill_factor=0.8
+    assert 4 == len(settings)
+    assert set([0.2, None]) == set(s['min_fill_factor'] for s in settings)
+
+
+def test_main(tmpdir):
+    output = str(tmpdir.join('accuracy.json'))
+
+    accuracy.main([
+        '--num-keys', '5000', '--duration', '400', '--decay-time', '100',
+        '--samples', '200', '--growth-factor', '2', '4', '--output', output,
+    ])
+
+    with open(output) as output_file:
+        results = json.load(output_file)['results']
+    assert [2, 4] == [result['growth_factor'] for result in results]
+    for result in results:
+        assert 0.0 == result['fn_rate']
+        assert result['fp_rate'] < 0.05
+        assert result['max_nbytes'] > 0
+        assert 7 == len(result['measurements'])
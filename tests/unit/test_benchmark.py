@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+
+from fuggetaboutit import benchmark
+
+
+def get_result(per_op, **updates):
+    result = {'benchmark': 'add', 'layout': 'timing', 'size': 100, 'tick_bits': 4, 'per_op': per_op}
+    result.update(updates)
+    return result
+
+
+def test_compare():
+    old = {'results': [get_result(1.0), get_result(1.0, benchmark='decay')]}
+    new = {'results': [
+        get_result(1.05),
+        get_result(2.0, benchmark='decay'),
+        get_result(5.0, layout='scaled'),
+    ]}
+
+    regressions = benchmark.compare(old, new, threshold=0.1)
+
+    # Only decay got slower by more than the threshold and the new scaled
+    # layout has nothing to compare with
+    assert [(new['results'][1], 1.0, 2.0)] == regressions
+
+
+def test_main(tmpdir):
+    output = str(tmpdir.join('results.json'))
+
+    exit_code = benchmark.main([
+        '--sizes', '1e3', '--num-keys', '10', '--repeat', '1', '--output', output,
+    ])
+
+    assert 0 == exit_code
+    with open(output) as results_file:
+        results = json.load(results_file)
+    names = set((result['benchmark'], result['layout']) for result in results['results'])
+    assert ('add', 'timing') in names
+    assert ('add_batch', 'scaled') in names
+    assert ('add_if_new_batch', 'scaled') in names
+    assert ('contains_batch_miss', 'scaled') in names
+    assert ('scale_up', 'scaling') in names
+    assert ('scale_up', 'timing') not in names
+    assert all(result['ops'] for result in results['results'])
+
+
+def test_layouts_stay_under_max_fill_factor():
+    rng = np.random.RandomState(1234)
+    positives = benchmark.get_keys(1000, seed=1)
+    negatives = benchmark.get_keys(1000, seed=2)
+    for layout, num_blooms in (('timing', 1), ('scaling', 1), ('scaled', 3)):
+        case = benchmark.Case(layout, 1000, 4, positives, negatives, 0.5, rng)
+        assert num_blooms == len(benchmark.get_sub_blooms(case.bloom))
+
+        # benchmarks that add get a fresh bloom and don't scale it either
+        for fxn in (benchmark.bench_add, benchmark.bench_add_batch, benchmark.bench_add_if_new_batch):
+            assert fxn(case) is None or 0 < fxn(case)[1]
+        assert num_blooms == len(benchmark.get_sub_blooms(case.bloom))
+        fresh = case.fresh()
+        fresh.bloom.add_batch(fresh.negatives)
+        assert num_blooms == len(benchmark.get_sub_blooms(fresh.bloom))
@@ -0,0 +1,85 @@
+from mock import MagicMock, patch
+
+from fuggetaboutit.clocks import WallClock, ManualClock, WatermarkClock, CoarseClock
+from fuggetaboutit.tickers import ClockTicker
+
+
+@patch('time.time')
+def test_wall_clock(time_mock):
+    time_mock.return_value = 1234.5
+    clock = WallClock()
+
+    assert 1234.5 == clock.time()
+    clock.observe(5000)
+    assert 1234.5 == clock.time()
+
+
+def test_manual_clock():
+    clock = ManualClock(100.0)
+    listener = MagicMock()
+    clock.add_listener(listener)
+
+    clock.advance(10)
+    assert 110.0 == clock.time()
+    listener.assert_called_once_with(110.0)
+
+    # Events don't move a manual clock and it never goes backwards
+    clock.observe(500)
+    clock.set(50)
+    assert 110.0 == clock.time()
+    assert 1 == listener.call_count
+
+
+def test_watermark_clock():
+    clock = WatermarkClock(100.0)
+
+    clock.observe(150)
+    clock.observe(120)
+    assert 150 == clock.time()
+
+
+@patch('time.time')
+def test_coarse_clock(time_mock):
+    time_mock.return_value = 1000.0
+    ticker = MagicMock()
+    clock = CoarseClock(ticker, resolution=0.5)
+
+    ticker.setup.assert_called_once_with(clock.refresh, 0.5)
+    ticker.start.assert_called_once_with()
+
+    # The time is only read again when the ticker refreshes the clock
+    time_mock.return_value = 1000.3
+    assert 1000.0 == clock.time()
+    clock.refresh()
+    assert 1000.3 == clock.time()
+
+    clock.stop()
+    ticker.stop.assert_called_once_with()
+
+
+def test_clock_ticker():
+    clock = ManualClock(95.0)
+    callback = MagicMock()
+    ticker = ClockTicker(clock)
+    ticker.setup(callback, 10)
+
+    # Nothing happens before the ticker is started
+    clock.set(105)
+    assert not callback.called
+
+    ticker.start()
+    clock.set(109)
+    assert not callback.called
+
+    clock.set(110)
+    assert 1 == callback.call_count
+
+    # Jumping over several intervals calls back once
+    clock.set(150)
+    assert 2 == callback.call_count
+    clock.set(155)
+    assert 2 == callback.call_count
+
+    ticker.stop()
+    clock.set(200)
+    assert 2 == callback.call_count
@@ -331,6 +331,38 @@ def test_get_non_empty_size():
     assert expected_size == round(bloom.get_size())
 
 
+def test_get_headroom():
+    # Setup the bloom
+    bloom = get_bloom()
+
+    # Add a few keys
+    bloom.add('test1')
+    bloom.add('test2')
+
+    # Filling up the headroom should bring the size up to the requested size
+    headroom = bloom.get_headroom(10)
+    bloom.num_non_zero += int(round(headroom))
+    assert 10 == round(bloom.get_size())
+
+
+def test_get_size_full():
+    # Setup the bloom
+    bloom = get_bloom()
+    bloom.num_non_zero = bloom.num_bytes
+
+    # A bloom with every bucket set is infinitely full
+    assert float('inf') == bloom.get_size()
+
+
+def test_get_current_error():
+    # Setup the bloom
+    bloom = get_bloom()
+    bloom.num_non_zero = bloom.num_bytes // 2
+
+    # Half of the buckets are set so each hash matches half of the time
+    assert 0.5 ** bloom.num_hashes == bloom.get_current_error()
+
+
 def test_flush_data__without_data_path():
     # Get a bloom
     bloom = get_bloom(data_path=None)
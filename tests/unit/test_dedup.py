@@ -0,0 +1,70 @@
+import io
+from StringIO import StringIO
+
+import pytest
+
+from fuggetaboutit import dedup
+from fuggetaboutit.clocks import ManualClock
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+
+
+def test_parse_window():
+    assert 90 == dedup.parse_window('90')
+    assert 1800 == dedup.parse_window('30m')
+    assert 86400 == dedup.parse_window('24h')
+    assert 7 * 86400 == dedup.parse_window('7d')
+    with pytest.raises(ValueError):
+        dedup.parse_window('1w')
+
+
+def test_read_lines():
+    stream = StringIO('first\nsecond line\nthird\nlast')
+
+    chunks = list(dedup.read_lines(stream, buffer_size=8))
+
+    # lines are only split once they're complete
+    assert [['first'], ['second line', 'third'], ['last']] == chunks
+
+
+def test_read_lines_in_memory_stream():
+    # BytesIO has a fileno method that raises
+    assert [['a', 'b']] == list(dedup.read_lines(io.BytesIO('a\nb\n')))
+
+
+def test_get_new_lines():
+    bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=3600)
+    bloom.add('a')
+
+    assert ['b', 'c'] == dedup.get_new_lines(bloom, ['a', 'b', 'c', 'b'])
+    assert ['d'] == dedup.get_new_lines(bloom, ['c', 'd'])
+    assert bloom.contains('d')
+
+
+def test_get_new_lines_refreshes_seen_lines():
+    clock = ManualClock(1e9)
+    bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=100, clock=clock)
+
+    assert ['a', 'b'] == dedup.get_new_lines(bloom, ['a', 'b'])
+    clock.advance(60)
+    assert [] == dedup.get_new_lines(bloom, ['a'])
+
+    # 'a' was seen 60s ago and 'b' 120s ago
+    clock.advance(60)
+    assert ['b'] == dedup.get_new_lines(bloom, ['a', 'b'])
+
+
+def test_main(tmpdir):
+    state = str(tmpdir.join('state'))
+    argv = ['--state', state, '--window', '1h', '--capacity', '1e4', '--quiet']
+    output = StringIO()
+
+    counts = dedup.main(argv, StringIO('a\nb\na\nc\n'), output)
+
+    assert 'a\nb\nc\n' == output.getvalue()
+    assert [4, 3, 8] == counts
+
+    # The bloom is checkpointed so a second run remembers the lines
+    output = StringIO()
+    dedup.main(argv, StringIO('c\nd\n'), output)
+    assert 'd\n' == output.getvalue()
+    assert 3600 == ScalingTimingBloomFilter.load(state).decay_time
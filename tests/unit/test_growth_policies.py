@@ -0,0 +1,101 @@
+from mock import MagicMock, patch
+
+from fuggetaboutit.clocks import WallClock
+from fuggetaboutit.growth_policies import GeometricGrowthPolicy, RateGrowthPolicy
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+
+
+def get_scaling_bloom(size=0.0, **attrs):
+    bloom = MagicMock(ScalingTimingBloomFilter)
+    bloom.capacity = 1000
+    bloom.decay_time = 100
+    bloom.clock = WallClock()
+    bloom.max_fill_factor = 0.8
+    bloom.growth_factor = 2
+    bloom.blooms = [MagicMock(capacity=1000)]
+    bloom.get_size.return_value = size
+    for key, value in attrs.iteritems():
+        setattr(bloom, key, value)
+    return bloom
+
+
+def test_geometric_growth():
+    policy = GeometricGrowthPolicy(growth_factor=3)
+    bloom = get_scaling_bloom()
+
+    assert 693 == policy.get_capacity(bloom, 0)
+    assert 6238 == policy.get_capacity(bloom, 2)
+
+
+def test_geometric_without_growth():
+    policy = GeometricGrowthPolicy(growth_factor=None)
+    bloom = get_scaling_bloom()
+
+    assert 1000 == policy.get_capacity(bloom, 0)
+    assert 1000 == policy.get_capacity(bloom, 2)
+
+
+@patch('time.time')
+def test_rate_growth(time_mock):
+    policy = RateGrowthPolicy(headroom=1.0, max_growth=None)
+    bloom = get_scaling_bloom(size=8000.0)
+
+    # 8000 distinct items in 10 seconds with a 100 second decay time
+    time_mock.return_value = 1000
+    policy.setup(bloom)
+    time_mock.return_value = 1010
+
+    assert 800 == policy.get_insert_rate(bloom)
+    assert 100000 == policy.get_capacity(bloom, 1)
+
+
+@patch('time.time')
+def test_rate_growth_caps_elapsed_at_decay_time(time_mock):
+    policy = RateGrowthPolicy(headroom=1.0)
+    bloom = get_scaling_bloom(size=8000.0)
+
+    time_mock.return_value = 1000
+    policy.setup(bloom)
+    time_mock.return_value = 5000
+
+    assert 80 == policy.get_insert_rate(bloom)
+    assert 10000 == policy.get_capacity(bloom, 1)
+
+
+@patch('time.time')
+def test_rate_growth_minimum_and_fallback(time_mock):
+    policy = RateGrowthPolicy()
+    bloom = get_scaling_bloom(size=1.0)
+
+    # Without enough elapsed time the fallback policy is used
+    time_mock.return_value = 1000
+    policy.setup(bloom)
+    time_mock.return_value = 1000.5
+    assert 1386 == policy.get_capacity(bloom, 1)
+
+    # A tiny rate never gives less than the first sub-bloom's capacity
+    time_mock.return_value = 1050
+    assert 693 == policy.get_capacity(bloom, 1)
+
+
+@patch('time.time')
+def test_rate_growth_fallback_uses_growth_factor(time_mock):
+    policy = RateGrowthPolicy()
+    bloom = get_scaling_bloom(growth_factor=3)
+
+    time_mock.return_value = 1000
+    policy.setup(bloom)
+
+    assert 6238 == policy.get_capacity(bloom, 2)
+
+
+@patch('time.time')
+def test_rate_growth_max_growth(time_mock):
+    policy = RateGrowthPolicy(headroom=1.0, max_growth=4)
+    bloom = get_scaling_bloom(size=8000.0)
+
+    time_mock.return_value = 1000
+    policy.setup(bloom)
+    time_mock.return_value = 1010
+
+    assert 4000 == policy.get_capacity(bloom, 1)
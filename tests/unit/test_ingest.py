@@ -0,0 +1,84 @@
+import numpy as np
+
+from fuggetaboutit import ingest
+from fuggetaboutit.clocks import WatermarkClock
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.tickers import ClockTicker
+
+
+def test_read_chunks():
+    chunks = list(ingest.read_chunks(iter(str(i) for i in xrange(5)), 2))
+
+    assert [['0', '1'], ['2', '3'], ['4']] == chunks
+
+
+def test_parse_chunk():
+    keys, timestamps, num_malformed = ingest.parse_chunk(['a\t100\n', 'b\t200.5\n', 'c\t300'])
+
+    assert ['a', 'b', 'c'] == keys
+    assert [100.0, 200.5, 300.0] == timestamps.tolist()
+    assert 0 == num_malformed
+
+
+def test_parse_chunk_timestamp_first():
+    keys, timestamps, num_malformed = ingest.parse_chunk(['100,a\n', '200,b,c\r\n'], separator=',',
+                                                        timestamp_first=True)
+
+    assert ['a', 'b,c'] == keys
+    assert [100.0, 200.0] == timestamps.tolist()
+    assert 0 == num_malformed
+
+
+def test_parse_chunk_malformed():
+    lines = ['a\t100\n', 'no timestamp\n', 'b\tnot a number\n', 'c\td\t300\n']
+    keys, timestamps, num_malformed = ingest.parse_chunk(lines)
+
+    assert ['a', 'c\td'] == keys
+    assert [100.0, 300.0] == timestamps.tolist()
+    assert 2 == num_malformed
+
+
+
+def test_parse_chunk_misaligned_separators():
+    # as many separators as lines, but not one on every line
+    keys, timestamps, num_malformed = ingest.parse_chunk(['k\t1\t2\n', '3\n'])
+
+    assert ['k\t1'] == keys
+    assert [2.0] == timestamps.tolist()
+    assert 1 == num_malformed
+
+def test_ingest():
+    clock = WatermarkClock()
+    bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=600, clock=clock,
+                                     ticker=ClockTicker(clock))
+    start = 1e9
+    lines = ['key-%d\t%f\n' % (i, start + i) for i in xrange(3600)]
+    lines.insert(1000, 'garbage\n')
+    # older than the window once the clock has reached start + 1000
+    lines.insert(1001, 'late\t%f\n' % (start - 1000))
+    reports = []
+
+    progress = ingest.ingest(bloom, lines, chunk_size=500, report=reports.append, report_interval=0)
+
+    assert 3602 == progress.rows
+    assert 3600 == progress.added
+    assert 1 == progress.skipped
+    assert 1 == progress.malformed
+    assert start + 3599 == progress.event_time
+    assert 8 == len(reports)
+    assert bloom.contains('key-3599')
+    assert not bloom.contains('key-0')
+    assert not bloom.contains('late')
+
+
+def test_main(tmpdir):
+    log = tmpdir.join('events.log')
+    log.write(''.join('key-%d\t%d\n' % (i, 1e9 + i) for i in xrange(1000)))
+    data_path = str(tmpdir.join('bloom'))
+
+    summary = ingest.main([str(log), '--data-path', data_path, '--capacity', '1e4',
+                           '--decay-time', '3600', '--chunk-size', '100'])
+
+    assert 1000 == summary['added']
+    bloom = ScalingTimingBloomFilter.load(data_path, clock=WatermarkClock(1e9 + 1000))
+    assert np.all(bloom.contains_batch(['key-%d' % i for i in xrange(1000)]))
@@ -0,0 +1,75 @@
+import json
+
+from fuggetaboutit import loadtest
+
+
+def test_latency_histogram():
+    histogram = loadtest.LatencyHistogram()
+    for micros in xrange(1, 1001):
+        histogram.record(micros / 1e6)
+
+    # Percentiles are within the relative precision of the buckets
+    assert 1000 == histogram.total
+    assert abs(histogram.get_percentile(50) - 500e-6) <= 500e-6 / 16
+    assert abs(histogram.get_percentile(99) - 990e-6) <= 990e-6 / 16
+    assert 1000e-6 == histogram.get_percentile(100)
+    assert 1000e-6 == histogram.max
+
+
+def test_latency_histogram_merge():
+    first = loadtest.LatencyHistogram()
+    first.record(1e-3)
+    second = loadtest.LatencyHistogram()
+    second.record(2.0)
+
+    first.merge(second)
+
+    assert 2 == first.total
+    assert 2.0 == first.max
+    assert abs(first.get_percentile(100) - 2.0) <= 2.0 / 16
+
+
+def test_latency_histogram_empty():
+    histogram = loadtest.LatencyHistogram()
+
+    assert histogram.get_percentile(50) is None
+    assert 0 == histogram.summary()['count']
+
+
+def test_get_keys_zipf():
+    args = loadtest.get_parser().parse_args(['--distribution', 'zipf', '--key-space', '100'])
+
+    generator = loadtest.get_keys(args, 0)
+    keys = [next(generator) for _ in xrange(1000)]
+
+    assert all(0 <= int(key.split('-')[1]) < 100 for key in keys)
+    # the most popular key dominates
+    assert keys.count('key-0') > 100
+
+
+def test_get_keys_replay(tmpdir):
+    replay = tmpdir.join('keys')
+    replay.write('a\nb\nc\nd\n')
+    args = loadtest.get_parser().parse_args(['--replay', str(replay), '--processes', '2'])
+
+    generator = loadtest.get_keys(args, 1)
+    keys = [next(generator) for _ in xrange(4)]
+
+    assert ['b', 'd', 'b', 'd'] == keys
+
+
+def test_main_inprocess(tmpdir):
+    output = str(tmpdir.join('results.json'))
+
+    loadtest.main([
+        '--target', 'inprocess', '--processes', '2', '--duration', '0.5',
+        '--capacity', '1000', '--decay-interval', '0.1', '--output', output,
+    ])
+
+    with open(output) as results_file:
+        summary = json.load(results_file)
+    latency = summary['latency']
+    assert summary['requests'] == latency['add']['count'] + latency['contains']['count']
+    assert summary['requests_per_second'] > 0
+    assert latency['events']['count'] > 0
+    assert latency['add']['p50'] <= latency['add']['p99'] <= latency['add']['max']
@@ -0,0 +1,39 @@
+import numpy as np
+
+from fuggetaboutit.memory import estimate_memory, get_resident_bytes, is_mapped
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+
+
+def test_is_mapped(tmpdir):
+    mapped = np.memmap(str(tmpdir.join('data')), dtype=np.uint8, mode='w+', shape=(100,))
+
+    assert is_mapped(mapped)
+    assert is_mapped(mapped[10:])
+    assert not is_mapped(np.zeros((100,), dtype=np.uint8))
+
+
+def test_get_resident_bytes():
+    data = np.ones((100000,), dtype=np.uint8)
+
+    resident = get_resident_bytes(data)
+
+    # Every page was just written to so all of it should be resident
+    assert resident in (None, data.nbytes)
+
+
+def test_estimate_memory():
+    estimate = estimate_memory(1000, error=0.01, num_blooms=3)
+
+    assert [0, 1, 2] == [bloom['id'] for bloom in estimate['blooms']]
+    assert [693, 1386, 2772] == [bloom['capacity'] for bloom in estimate['blooms']]
+    assert sum(bloom['nbytes'] for bloom in estimate['blooms']) == estimate['nbytes']
+    assert 8 * estimate['nbytes'] / float(estimate['capacity']) == estimate['bits_per_item']
+
+
+def test_estimate_memory_matches_blooms():
+    bloom = ScalingTimingBloomFilter(capacity=1000, decay_time=100, error=0.01, foldable=True)
+    bloom._add_new_bloom()
+
+    estimate = estimate_memory(1000, error=0.01, num_blooms=2, foldable=True)
+
+    assert bloom.get_data_nbytes() == estimate['nbytes']
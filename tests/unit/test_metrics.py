@@ -0,0 +1,61 @@
+from mock import MagicMock
+import pytest
+
+pytest.importorskip("tornado.web")
+
+from fuggetaboutit.metrics import render_metrics
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.stats import BloomStats
+from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
+
+
+def get_bloom(stats=None):
+    sub_bloom = MagicMock(TimingBloomFilter)
+    sub_bloom.id = 2
+    sub_bloom.num_non_zero = 40
+    sub_bloom.capacity = 100
+
+    bloom = MagicMock(ScalingTimingBloomFilter)
+    bloom.blooms = [sub_bloom]
+    bloom.saturated = False
+    bloom.get_size.return_value = 20.5
+    bloom.get_expected_error.return_value = 0.005
+    bloom.get_current_error.return_value = 0.001
+    bloom.get_data_nbytes.return_value = 1024
+    bloom.get_stats.return_value = stats
+    return bloom
+
+
+def test_render_metrics():
+    bloom = get_bloom()
+
+    lines = render_metrics(bloom).splitlines()
+
+    assert '# TYPE fuggetaboutit_size gauge' in lines
+    assert 'fuggetaboutit_size 20.5' in lines
+    assert 'fuggetaboutit_expected_error 0.005' in lines
+    assert 'fuggetaboutit_saturated 0.0' in lines
+    assert 'fuggetaboutit_blooms 1.0' in lines
+    assert 'fuggetaboutit_data_bytes 1024.0' in lines
+    assert 'fuggetaboutit_bloom_num_non_zero{bloom="2"} 40.0' in lines
+    assert 'fuggetaboutit_bloom_capacity{bloom="2"} 100.0' in lines
+    assert not any('decay' in line for line in lines)
+
+
+def test_render_metrics_with_stats():
+    stats = BloomStats()
+    stats.counts[0] = 7
+    stats.decay_buckets[1] = 2
+    stats.decay_count = 2
+    stats.decay_sum = 0.006
+    bloom = get_bloom(stats.snapshot())
+
+    lines = render_metrics(bloom, prefix='dedup').splitlines()
+
+    assert '# TYPE dedup_adds_total counter' in lines
+    assert 'dedup_adds_total 7.0' in lines
+    assert '# TYPE dedup_decay_seconds histogram' in lines
+    assert 'dedup_decay_seconds_bucket{le="0.001"} 0.0' in lines
+    assert 'dedup_decay_seconds_bucket{le="0.005"} 2.0' in lines
+    assert 'dedup_decay_seconds_bucket{le="+Inf"} 2.0' in lines
+    assert 'dedup_decay_seconds_count 2.0' in lines
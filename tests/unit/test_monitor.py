@@ -0,0 +1,84 @@
+from mock import MagicMock
+
+from fuggetaboutit.monitor import FalsePositiveMonitor
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
+
+
+def get_monitor(hits, **kwargs):
+    sub_bloom = MagicMock(TimingBloomFilter)
+    sub_bloom.id = 0
+    sub_bloom.error = 0.01
+    bloom = MagicMock(ScalingTimingBloomFilter)
+    bloom.blooms = [sub_bloom]
+
+    monitor = FalsePositiveMonitor(**kwargs)
+    monitor.setup(bloom)
+    monitor.probe = MagicMock(monitor.probe, side_effect=hits)
+    return monitor, bloom, sub_bloom
+
+
+def test_get_canaries():
+    monitor = FalsePositiveMonitor(batch_size=3)
+
+    first = monitor.get_canaries()
+    second = monitor.get_canaries()
+
+    assert 3 == len(first) == len(set(first))
+    assert not set(first) & set(second)
+
+
+def test_setup_with_ticker():
+    ticker = MagicMock()
+    monitor = FalsePositiveMonitor(ticker=ticker, interval=30)
+
+    monitor.setup(MagicMock(ScalingTimingBloomFilter))
+
+    ticker.setup.assert_called_once_with(monitor.run, 30)
+    ticker.start.assert_called_once_with()
+
+
+def test_run_under_error():
+    monitor, bloom, sub_bloom = get_monitor([1, 2], batch_size=100, min_probes=200)
+
+    monitor.run()
+    monitor.run()
+
+    assert 0.015 == monitor.get_error(sub_bloom)
+    assert not monitor.is_over_error(sub_bloom)
+    assert not bloom.get_active_bloom.called
+
+
+def test_run_over_error():
+    monitor, bloom, sub_bloom = get_monitor([30, 30], batch_size=100, min_probes=200)
+
+    # Not enough probes to tell yet
+    monitor.run()
+    assert 0.3 == monitor.get_error(sub_bloom)
+    assert not monitor.is_over_error(sub_bloom)
+    assert not bloom.get_active_bloom.called
+
+    monitor.run()
+    assert monitor.is_over_error(sub_bloom)
+    bloom.get_active_bloom.assert_called_once_with()
+
+
+def test_run_rolling_window():
+    monitor, bloom, sub_bloom = get_monitor([30, 30, 0, 0], batch_size=100, min_probes=0, window=2)
+
+    for _ in range(4):
+        monitor.run()
+
+    assert 0.0 == monitor.get_error(sub_bloom)
+
+
+def test_run_forgets_removed_blooms():
+    monitor, bloom, sub_bloom = get_monitor([30, 0], batch_size=100)
+
+    monitor.run()
+    new_bloom = MagicMock(TimingBloomFilter)
+    bloom.blooms = [new_bloom]
+    monitor.run()
+
+    assert monitor.get_error(sub_bloom) is None
+    assert 0.0 == monitor.get_error(new_bloom)
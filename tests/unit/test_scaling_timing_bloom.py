@@ -4,7 +4,9 @@ import json
 from mock import MagicMock, mock_open, patch
 import pytest
 
+from fuggetaboutit.clocks import WALL_CLOCK
 from fuggetaboutit.exceptions import PersistenceDisabledException
+from fuggetaboutit.growth_policies import GeometricGrowthPolicy
 from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
 from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
 from fuggetaboutit.tickers import NoOpTicker
@@ -22,7 +24,10 @@ BLOOM_DEFAULTS = {
 }
 
 TIMING_BLOOM_DEFAULTS = {
-    'seconds_per_tick': 100
+    'seconds_per_tick': 100,
+    'num_non_zero': 1,
+    'foldable': False,
+    '_optimize': False,
 }
 
 
@@ -86,7 +91,9 @@ def test_basic_init(timing_bloom_mock):
         decay_time=decay_time,
         error=0.0001,
         id=0,
-        disable_optimizations=False
+        disable_optimizations=False,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
     expected_ticker_class = NoOpTicker
@@ -107,6 +114,8 @@ def test_init_without_optimizations(timing_bloom_mock):
         capacity=capacity,
         decay_time=decay_time,
         disable_optimizations=disable_optimizations,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
     assert_bloom_values(bloom, {
@@ -133,6 +142,8 @@ def test_init_without_optimizations(timing_bloom_mock):
         error=0.0001,
         id=0,
         disable_optimizations=disable_optimizations,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
     expected_ticker_class = NoOpTicker
@@ -179,6 +190,8 @@ def test_init_without_growth_factor(timing_bloom_mock):
         error=0.0001,
         id=0,
         disable_optimizations=False,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
 
@@ -218,6 +231,8 @@ def test_full_init():
         insert_tail=insert_tail,
         blooms=blooms,
         disable_optimizations=disable_optimizations,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
     # Check that the bloom's state matches expectations
@@ -328,6 +343,20 @@ def test_expected_error():
     assert expected_error == error
 
 
+def test_current_error():
+    # Get a bloom
+    bloom = get_bloom([
+        {'return_values': {'get_current_error': 0.002}},
+        {'return_values': {'get_current_error': 0.5}},
+    ])
+
+    # Call get_current_error
+    error = bloom.get_current_error()
+
+    # Check results
+    assert abs(0.501 - error) < 1e-12
+
+
 def test_get_capacity_for_id_with_growth():
     # Get a bloom
     bloom = get_bloom(growth_factor=3, bloom_mocks=[{}])
@@ -366,6 +395,21 @@ def test_get_capacity_for_id_without_growth():
     assert expected_capacity == capacity
 
 
+def test_get_capacity_for_id_with_policy():
+    # Get a bloom
+    policy = MagicMock(GeometricGrowthPolicy)
+    policy.get_capacity.return_value = 4321
+    bloom = get_bloom(growth_policy=policy, bloom_mocks=[{}])
+
+    # Call get capacity for id 2
+    capacity = bloom.get_capacity_for_id(2)
+
+    # Check results
+    assert 4321 == capacity
+    policy.setup.assert_called_once_with(bloom)
+    policy.get_capacity.assert_called_once_with(bloom, 2)
+
+
 @patch('fuggetaboutit.scaling_timing_bloom_filter.TimingBloomFilter')
 def test_add_new_bloom_without_id(timing_bloom_mock):
     # Get a bloom
@@ -386,6 +430,8 @@ def test_add_new_bloom_without_id(timing_bloom_mock):
         error=0.00005,
         id=1,
         disable_optimizations=False,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
     # Check that the returned bloom is the correct bloom
@@ -419,6 +465,8 @@ def test_add_new_bloom_with_id(timing_bloom_mock):
         error=3.125e-06,
         id=5,
         disable_optimizations=False,
+        foldable=False,
+        clock=WALL_CLOCK,
     )
 
     # Check that the returned bloom is the correct bloom
@@ -432,6 +480,57 @@ def test_add_new_bloom_with_id(timing_bloom_mock):
     bloom.get_capacity_for_id.assert_called_once_with(5)
 
 
+@patch('fuggetaboutit.scaling_timing_bloom_filter.TimingBloomFilter')
+def test_add_new_bloom_with_id_0(timing_bloom_mock):
+    # Get a bloom
+    bloom = get_bloom(bloom_mocks=[{'attrs': {'id': 1}}])
+
+    # Call add bloom
+    bloom._add_new_bloom(bloom_id=0)
+
+    # Check that the bloom was created with the requested id
+    assert 0 == timing_bloom_mock.call_args[1]['id']
+
+
+def test_get_active_bloom_prewarm():
+    # Get a bloom
+    bloom = get_bloom(prewarm_fill_factor=0.5, bloom_mocks=[
+        {'return_values': {'get_size': 4}, 'attrs': {'id': 0, 'capacity': 1000}},
+    ])
+    sub_bloom = bloom.blooms[0]
+    sub_bloom.get_headroom.side_effect = lambda size: size - 4
+    bloom._start_prewarm = MagicMock(bloom._start_prewarm)
+
+    # Below the prewarm point the headroom only goes up to it
+    bloom.get_active_bloom()
+    assert 496 == bloom._active_headroom
+    assert not bloom._start_prewarm.called
+
+    # Past the prewarm point the next bloom gets prewarmed
+    sub_bloom.get_headroom.side_effect = lambda size: size - 600
+    bloom.get_active_bloom()
+    assert 200 == bloom._active_headroom
+    bloom._start_prewarm.assert_called_once_with()
+
+
+@patch('fuggetaboutit.scaling_timing_bloom_filter.TimingBloomFilter')
+def test_add_new_bloom_uses_prewarmed_bloom(timing_bloom_mock):
+    # Get a bloom
+    bloom = get_bloom(prewarm_fill_factor=0.5, bloom_mocks=[{'attrs': {'id': 0}}])
+
+    # Prewarm the next bloom and wait for it
+    bloom._start_prewarm()
+    _, thread, _ = bloom._prewarm
+    thread.join()
+    timing_bloom_mock.return_value.touch_pages.assert_called_once_with()
+
+    # Scale up and check that the prewarmed bloom was used
+    new_bloom = bloom._add_new_bloom()
+    assert timing_bloom_mock.return_value is new_bloom
+    assert 1 == timing_bloom_mock.call_count
+    assert bloom._prewarm is None
+
+
 def test_get_bloom_iter_insert_tail():
     # Get a bloom
     bloom = get_bloom(insert_tail=True, bloom_mocks=[
@@ -519,6 +618,7 @@ def test_get_active_bloom_scale():
     # Setup mocks
     bloom._add_new_bloom = MagicMock(bloom._add_new_bloom)
     new_bloom = MagicMock(TimingBloomFilter)
+    new_bloom.capacity = 4000
     bloom._add_new_bloom.return_value = new_bloom
 
     # Call get active bloom
@@ -535,6 +635,28 @@ def test_get_active_bloom_scale():
     bloom.blooms[0].get_size.assert_called_once_with()
 
 
+def test_get_active_bloom_over_max_bytes():
+    # Get a bloom whose blooms already use up the memory budget
+    bloom = get_bloom(max_bytes=1000, bloom_mocks=[
+        {'attrs': {'id': 0, 'capacity': 1000, 'error': 0.001, 'data': MagicMock(nbytes=400)}, 'return_values': {'get_size': 999}},
+        {'attrs': {'id': 1, 'capacity': 2000, 'error': 0.001, 'data': MagicMock(nbytes=500)}, 'return_values': {'get_size': 1900}},
+    ])
+
+    # Setup mocks
+    bloom._add_new_bloom = MagicMock(bloom._add_new_bloom)
+    bloom.compact = MagicMock(bloom.compact, return_value=False)
+
+    # Call get active bloom
+    active_bloom = bloom.get_active_bloom()
+
+    # Growth is refused and the emptiest bloom keeps receiving adds
+    assert not bloom._add_new_bloom.called
+    bloom.compact.assert_called_once_with()
+    assert bloom.saturated
+    assert bloom.blooms[1] == active_bloom
+    assert float('inf') == bloom._active_headroom
+
+
 def test_add_simple():
     # Get a bloom
     bloom = get_bloom(bloom_mocks=[{}])
@@ -552,6 +674,45 @@ def test_add_simple():
     sub_bloom_mock.add.assert_called_once_with(key, None)
 
 
+def test_add_uses_cached_active_bloom():
+    # Get a bloom
+    bloom = get_bloom(bloom_mocks=[
+        {'return_values': {'get_size': 4, 'get_headroom': 10, 'add': 3}, 'attrs': {'capacity': 1000}},
+    ])
+    sub_bloom_mock = bloom.blooms[0]
+    bloom.get_active_bloom = MagicMock(wraps=bloom.get_active_bloom)
+
+    # Do a few adds that fit in the headroom
+    bloom.add('a')
+    bloom.add('b')
+    bloom.add('c')
+
+    # Check that the active bloom was only looked up once
+    bloom.get_active_bloom.assert_called_once_with()
+    assert 3 == sub_bloom_mock.add.call_count
+    assert sub_bloom_mock is bloom._active_bloom
+    assert 1 == bloom._active_headroom
+
+    # Exhaust the headroom and check that the bloom will be re-evaluated
+    bloom.add('d')
+    assert bloom._active_bloom is None
+    bloom.add('e')
+    assert 2 == bloom.get_active_bloom.call_count
+
+
+def test_decay_resets_active_bloom():
+    # Get a bloom
+    bloom = get_bloom(bloom_mocks=[
+        {'return_values': {'get_size': 4, 'get_headroom': 10, 'add': 3}, 'attrs': {'id': 0, 'capacity': 1000, 'num_non_zero': 5}},
+    ])
+    bloom.add('a')
+    assert bloom._active_bloom is not None
+
+    # Decay and make sure the cached bloom was dropped
+    bloom.decay()
+    assert bloom._active_bloom is None
+
+
 def test_add_with_timestamp():
     # Get a bloom
     bloom = get_bloom(bloom_mocks=[{}])
@@ -573,8 +734,8 @@ def test_add_with_timestamp():
 def test_contains_hit():
     # Get a bloom
     bloom = get_bloom(bloom_mocks=[
-        {'return_values': {'contains': False}},
-        {'return_values': {'contains': True}},
+        {'return_values': {'contains': False, 'get_size': 20}},
+        {'return_values': {'contains': True, 'get_size': 10}},
     ])
 
     # Call contains
@@ -593,8 +754,8 @@ def test_contains_hit():
 def test_contains_miss():
     # Get a bloom
     bloom = get_bloom(bloom_mocks=[
-        {'return_values': {'contains': False}},
-        {'return_values': {'contains': False}},
+        {'return_values': {'contains': False, 'get_size': 10}},
+        {'return_values': {'contains': False, 'get_size': 20}},
     ])
 
     # Call contains
@@ -610,6 +771,42 @@ def test_contains_miss():
         sub_bloom.contains.assert_called_once_with(key)
 
 
+def test_contains_probes_fullest_bloom_first():
+    # Get a bloom
+    bloom = get_bloom(bloom_mocks=[
+        {'attrs': {'id': 0}, 'return_values': {'contains': True, 'get_size': 10}},
+        {'attrs': {'id': 1}, 'return_values': {'contains': True, 'get_size': 30}},
+        {'attrs': {'id': 2, 'num_non_zero': 0}, 'return_values': {'contains': True, 'get_size': 0}},
+    ])
+
+    # Check the probe order skips the empty bloom
+    expected_ids = [1, 0]
+    assert expected_ids == [sub_bloom.id for sub_bloom in bloom.get_probe_order()]
+
+    # Call contains
+    result = bloom.contains('test')
+
+    # Check that only the fullest bloom had to be probed
+    assert result
+    bloom.blooms[1].contains.assert_called_once_with('test')
+    assert not bloom.blooms[0].contains.called
+    assert not bloom.blooms[2].contains.called
+
+
+def test_probe_order_keeps_empty_active_bloom():
+    # Get a bloom
+    bloom = get_bloom(bloom_mocks=[
+        {'attrs': {'id': 0, 'capacity': 1000}, 'return_values': {'get_size': 900}},
+        {'attrs': {'id': 1, 'capacity': 2000, 'num_non_zero': 0}, 'return_values': {'get_size': 0}},
+    ])
+    assert [0] == [sub_bloom.id for sub_bloom in bloom.get_probe_order()]
+
+    # Once the empty bloom starts receiving adds it has to be probed
+    bloom.get_active_bloom()
+    expected_ids = [0, 1]
+    assert expected_ids == [sub_bloom.id for sub_bloom in bloom.get_probe_order()]
+
+
 @patch('shutil.rmtree')
 def test_cleanup_empty_blooms_noop(rmtree_mock):
     # Get a bloom
@@ -739,6 +936,38 @@ def test_try_to_shrink__shrink():
     bloom._add_new_bloom.assert_called_once_with(4)
 
 
+def test_try_to_shrink__fold():
+    # Get a bloom
+    bloom = get_bloom(bloom_mocks=[
+        {'attrs': {'id': 5, 'capacity': 2000, 'foldable': True}, 'return_values': {'get_size': 100, 'shrink': True}},
+    ])
+    bloom._add_new_bloom = MagicMock(bloom._add_new_bloom)
+
+    # Try to shrink
+    did_shrink = bloom.try_to_shrink()
+
+    # Check that the bloom was folded instead of adding a smaller bloom
+    assert did_shrink
+    bloom.blooms[0].shrink.assert_called_once_with()
+    assert not bloom._add_new_bloom.called
+
+
+def test_try_to_shrink__fold_would_overfill():
+    # Get a bloom
+    bloom = get_bloom(min_fill_factor=0.5, bloom_mocks=[
+        {'attrs': {'id': 5, 'capacity': 2000, 'foldable': True}, 'return_values': {'get_size': 900}},
+    ])
+    bloom._add_new_bloom = MagicMock(bloom._add_new_bloom)
+
+    # Try to shrink
+    did_shrink = bloom.try_to_shrink()
+
+    # Folding would put the bloom over max_fill_factor so a new bloom is added
+    assert did_shrink
+    assert not bloom.blooms[0].shrink.called
+    bloom._add_new_bloom.assert_called_once_with(4)
+
+
 def test_decay():
     # Get a bloom
     bloom = get_bloom(bloom_mocks=[{}])
@@ -797,6 +1026,9 @@ def test_get_meta():
         'max_fill_factor': 0.9,
         'insert_tail': False,
         'disable_optimizations': True,
+        'prewarm_fill_factor': 0.5,
+        'foldable': True,
+        'max_bytes': 1 << 20,
     }
     bloom = get_bloom(bloom_mocks=[{}], **config)
 
@@ -873,7 +1105,7 @@ def test_load__with_blooms(timing_bloom_mock):
 
     # Check that the sub blooms were loaded as expected
     for path in bloom_paths:
-        timing_bloom_mock.load.assert_any_call(path)
+        timing_bloom_mock.load.assert_any_call(path, clock=None)
     expected_load_calls = len(bloom_paths)
     assert expected_load_calls == timing_bloom_mock.load.call_count
 
@@ -0,0 +1,94 @@
+from mock import MagicMock
+import pytest
+
+pytest.importorskip("tornado.tcpserver")
+
+from tornado.ioloop import IOLoop
+
+from fuggetaboutit.clocks import WALL_CLOCK, CoarseClock
+from fuggetaboutit.scaling_timing_bloom_filter import ScalingTimingBloomFilter
+from fuggetaboutit.server import execute, get_bloom as get_server_bloom, get_parser, process_buffer
+
+
+def get_bloom(contains=False):
+    bloom = MagicMock(ScalingTimingBloomFilter)
+    bloom.contains_batch.side_effect = lambda keys: [contains] * len(keys)
+    return bloom
+
+
+def test_execute_add():
+    bloom = get_bloom()
+
+    reply = execute(bloom, 'ADD foo bar')
+
+    assert '+OK' == reply
+    bloom.add_batch.assert_called_once_with(['foo', 'bar'])
+
+
+def test_execute_contains():
+    bloom = get_bloom()
+    bloom.contains_batch.side_effect = None
+    bloom.contains_batch.return_value = [True, False, True]
+
+    reply = execute(bloom, 'CONTAINS a b c')
+
+    assert '+101' == reply
+    bloom.contains_batch.assert_called_once_with(['a', 'b', 'c'])
+    assert not bloom.add_batch.called
+
+
+def test_execute_add_if_new():
+    bloom = get_bloom()
+    bloom.add_if_new_batch.return_value = [False, True]
+
+    reply = execute(bloom, 'add_if_new a b')
+
+    assert '+01' == reply
+    bloom.add_if_new_batch.assert_called_once_with(['a', 'b'])
+
+
+def test_execute_errors():
+    bloom = get_bloom()
+
+    assert execute(bloom, '').startswith('-ERR')
+    assert execute(bloom, 'FOO a').startswith('-ERR')
+    assert execute(bloom, 'ADD').startswith('-ERR')
+    assert not bloom.add_batch.called
+
+
+def test_process_buffer_pipelined():
+    bloom = get_bloom(contains=True)
+
+    reply, remainder = process_buffer(bloom, 'ADD a\r\nCONTAINS a b\nCONTA')
+
+    assert '+OK\n+11\n' == reply
+    assert 'CONTA' == remainder
+
+
+def test_process_buffer_partial():
+    bloom = get_bloom()
+
+    reply, remainder = process_buffer(bloom, 'ADD a')
+
+    assert '' == reply
+    assert 'ADD a' == remainder
+    assert not bloom.add_batch.called
+
+
+def test_get_bloom_clock():
+    io_loop = IOLoop()
+    args = get_parser().parse_args(['--capacity', '1000'])
+
+    # Commands read a cached time by default
+    bloom = get_server_bloom(args, io_loop)
+    assert isinstance(bloom.clock, CoarseClock)
+    assert bloom.blooms[0].clock is bloom.clock
+    assert 0.1 == bloom.clock.resolution
+    bloom.stop()
+    bloom.clock.stop()
+
+    args = get_parser().parse_args(['--capacity', '1000', '--clock-resolution', '0'])
+    bloom = get_server_bloom(args, io_loop)
+    assert WALL_CLOCK is bloom.clock
+    bloom.stop()
+    io_loop.close()
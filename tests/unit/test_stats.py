@@ -0,0 +1,57 @@
+from mock import MagicMock, patch
+
+from fuggetaboutit.stats import BloomStats, get_bloom_gauges
+from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
+
+
+def test_record_contains():
+    stats = BloomStats()
+
+    stats.record_contains(True)
+    stats.record_contains(False)
+    stats.record_contains(3, 10)
+
+    snapshot = stats.snapshot()
+    assert 4 == snapshot['contains_hits']
+    assert 8 == snapshot['contains_misses']
+    assert 0 == snapshot['adds']
+
+
+@patch('time.time')
+def test_record_decay(time_mock):
+    stats = BloomStats()
+
+    time_mock.return_value = 100.5
+    stats.record_decay(100.0)
+    time_mock.return_value = 100.003
+    stats.record_decay(100.0)
+
+    decay = stats.snapshot()['decay']
+    assert 2 == decay['count']
+    assert abs(0.503 - decay['sum']) < 1e-9
+    assert abs(0.003 - decay['last']) < 1e-9
+    histogram = dict(decay['histogram'])
+    assert 0 == histogram[0.001]
+    assert 1 == histogram[0.005]
+    assert 2 == histogram[0.5]
+    assert 2 == histogram[float('inf')]
+
+
+def test_get_bloom_gauges():
+    bloom = MagicMock(TimingBloomFilter)
+    bloom.id = 3
+    bloom.capacity = 1000
+    bloom.num_bytes = 400
+    bloom.num_non_zero = 100
+    bloom.get_current_error.return_value = 0.01
+
+    gauges = get_bloom_gauges(bloom)
+
+    assert {
+        'id': 3,
+        'capacity': 1000,
+        'num_bytes': 400,
+        'num_non_zero': 100,
+        'fill_factor': 0.25,
+        'error': 0.01,
+    } == gauges
@@ -4,6 +4,8 @@ from mock import MagicMock, patch, sentinel
 import numpy as np
 import pytest
 
+from fuggetaboutit.clocks import ManualClock
+from fuggetaboutit.stats import BloomStats
 from fuggetaboutit.timing_bloom_filter import TimingBloomFilter
 
 from ..utils import assert_bloom_values
@@ -169,6 +171,25 @@ def test_get_tick_range(time_mock):
     assert expected_range == tick_range
 
 
+def test_get_tick_range_cached():
+    # Get a bloom on a manual clock
+    clock = ManualClock(1388056353.436583)
+    bloom = get_bloom(clock=clock)
+
+    # The range is computed once and kept until the next tick
+    with patch.object(bloom, 'refresh_tick_range', wraps=bloom.refresh_tick_range) as refresh_mock:
+        assert (12, 4) == bloom.get_tick_range()
+        clock.advance(60)
+        assert (12, 4) == bloom.get_tick_range()
+        assert 4 == bloom.get_tick()
+        assert 1 == refresh_mock.call_count
+
+        # Moving into the next tick refreshes it
+        clock.advance(bloom.seconds_per_tick)
+        assert (13, 5) == bloom.get_tick_range()
+        assert 2 == refresh_mock.call_count
+
+
 def test_get_interval_test_min_lt_max():
     # Get a bloom
     bloom = get_bloom()
@@ -419,9 +440,182 @@ def test_get_meta():
     # Make sure the meta data gets returned as expected
     expected_meta = copy(BLOOM_DEFAULTS)
     del expected_meta['data_path']
+    expected_meta['foldable'] = False
+    expected_meta['folds'] = 0
     assert expected_meta == bloom.get_meta()
 
 
+def test_init_foldable():
+    # Get a bloom
+    bloom = get_bloom(foldable=True)
+
+    # The number of buckets should be rounded up to a power of two
+    assert_bloom_values(bloom, {
+        'num_bytes': 32768,
+        'num_hashes': 12,
+        'capacity': 1000,
+    })
+    assert (16384,) == bloom.data.shape
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'disable_optimizations': True},
+    {'foldable': True},
+    {'foldable': True, 'folds': 2},
+])
+def test_get_data_nbytes(kwargs):
+    # The estimate should match what a bloom actually allocates
+    bloom = get_bloom(**kwargs)
+    nbytes = TimingBloomFilter.get_data_nbytes(bloom.unfolded_capacity, bloom.error, **kwargs)
+    assert bloom.data.nbytes == nbytes
+
+
+def test_init_folded():
+    # Get a bloom that has already been shrunk twice
+    bloom = get_bloom(foldable=True, folds=2)
+
+    assert_bloom_values(bloom, {
+        'num_bytes': 8192,
+        'num_hashes': 12,
+        'capacity': 250,
+        'unfolded_capacity': 1000,
+    })
+    assert 1000 == bloom.get_meta()['capacity']
+
+
+def test_shrink_not_foldable():
+    # Get a bloom
+    bloom = get_bloom()
+    bloom.add('test')
+
+    # Try to shrink it
+    assert not bloom.shrink()
+    assert 17728 == bloom.num_bytes
+
+
+@pytest.mark.parametrize('disable_optimizations', [False, True])
+def test_shrink(disable_optimizations):
+    # Get a bloom with a few keys
+    bloom = get_bloom(foldable=True, disable_optimizations=disable_optimizations)
+    keys = [str(i) for i in range(100)]
+    for key in keys:
+        bloom.add(key)
+    cells = bloom.get_cells()
+
+    # Shrink it twice
+    assert bloom.shrink()
+    assert bloom.shrink()
+
+    # Check the new geometry
+    assert_bloom_values(bloom, {
+        'num_bytes': 8192,
+        'capacity': 250,
+        'folds': 2,
+        'num_non_zero': np.count_nonzero(bloom.get_cells()),
+    })
+    expected_cells = cells.reshape(4, 8192).max(axis=0)
+    assert (expected_cells == bloom.get_cells()).all()
+
+    # All of the keys should still be found
+    assert all(bloom.contains(key) for key in keys)
+
+
+@patch('time.time')
+def test_newest_ticks(time_mock):
+    # Get a bloom with 4 bit ticks
+    bloom = get_bloom()
+    time_mock.return_value = 1388056353.436583
+    tick_min, tick_max = bloom.get_tick_range()
+    assert (12, 4) == (tick_min, tick_max)
+
+    # Combine ticks around the ring, 13 is older than 2 and 8 is expired
+    first = np.array([0, 13, 2, 8, 3], dtype=np.uint8)
+    second = np.array([4, 2, 13, 0, 8], dtype=np.uint8)
+    result = bloom.newest_ticks(first, second)
+
+    expected = [4, 2, 2, 0, 3]
+    assert expected == list(result)
+
+
+@patch('time.time')
+def test_fold_ticks(time_mock):
+    # Get a bloom with 4 bit ticks
+    bloom = get_bloom()
+    time_mock.return_value = 1388056353.436583
+
+    # Fold three rows of ticks onto one, 13 is older than 2 and 8 is expired
+    cells = np.array([
+        0, 13, 2, 8,
+        4, 2, 13, 0,
+        13, 0, 3, 8,
+    ], dtype=np.uint8)
+    result = bloom.fold_ticks(cells, 4)
+
+    expected = [4, 2, 3, 0]
+    assert expected == list(result)
+
+
+@pytest.mark.parametrize('disable_optimizations', [False, True])
+@pytest.mark.parametrize('block_size', [4, 1 << 12, 1 << 16])
+def test_fold_blooms(disable_optimizations, block_size):
+    # Get two foldable blooms whose keys were added at a few ticks
+    clock = ManualClock(1e9)
+    target = get_bloom(capacity=500, foldable=True, clock=clock, disable_optimizations=disable_optimizations)
+    other = get_bloom(capacity=2000, foldable=True, clock=clock, disable_optimizations=disable_optimizations)
+    for i in range(300):
+        (target if i % 2 else other).add(str(i))
+        if i % 100 == 99:
+            clock.advance(target.seconds_per_tick)
+    target_data = target.data.copy()
+
+    data, num_non_zero = target.fold_blooms([target, other], block_size)
+
+    # The blocks are folded like the whole buckets are
+    expected = target.fold_ticks(np.concatenate((target.get_cells(), other.get_cells())), target.num_bytes)
+    assert (target._pack_cells(expected) == data).all()
+    assert np.count_nonzero(expected) == num_non_zero
+    assert (target_data == target.data).all()
+
+
+def test_get_cells_range():
+    bloom = get_bloom()
+    bloom.add('test')
+    cells = bloom.get_cells()
+
+    assert (cells[3:4] == bloom.get_cells(3, 4)).all()
+    assert (cells[100:201] == bloom.get_cells(100, 201)).all()
+    assert (cells[7:] == bloom.get_cells(7)).all()
+
+
+@pytest.mark.parametrize('disable_optimizations', [False, True])
+def test_get_stats(disable_optimizations):
+    # Get a bloom with stats
+    bloom = get_bloom(stats=BloomStats(), disable_optimizations=disable_optimizations)
+
+    # Exercise it
+    bloom.add('test')
+    bloom.contains('test')
+    bloom.contains('other')
+    bloom.decay()
+
+    # Check the results
+    stats = bloom.get_stats()
+    assert 1 == stats['adds']
+    assert 1 == stats['contains_hits']
+    assert 1 == stats['contains_misses']
+    assert 1 == stats['decay']['count']
+    assert 1 == len(stats['blooms'])
+    assert bloom.num_hashes == stats['blooms'][0]['num_non_zero']
+
+
+def test_get_stats_disabled():
+    # Get a bloom without stats
+    bloom = get_bloom()
+
+    assert bloom.get_stats() is None
+
+
 def test_remove():
     # Get a bloom
     bloom = get_bloom()
@@ -438,3 +632,17 @@ def test_remove_all():
     # Call remove_all
     with pytest.raises(NotImplementedError):
         bloom.remove_all('test')
+
+
+@patch('time.time')
+def test_get_descriptor(time_mock):
+    # Get a bloom
+    bloom = get_bloom()
+    time_mock.return_value = 1388056353.436583
+
+    # Get the descriptor
+    descriptor = bloom.get_descriptor()
+
+    # Check results
+    expected_descriptor = (bloom.data.ctypes.data, 17728, 12, 12, 4)
+    assert expected_descriptor == descriptor
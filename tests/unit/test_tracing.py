@@ -0,0 +1,68 @@
+from mock import MagicMock, patch
+import pytest
+
+from fuggetaboutit import tracing
+
+
+@pytest.fixture
+def hook():
+    hook = MagicMock()
+    tracing.add_hook(hook)
+    yield hook
+    tracing.remove_hook(hook)
+
+
+@patch('time.time')
+def test_trace(time_mock, hook):
+    time_mock.side_effect = [10.0, 12.5]
+
+    with tracing.trace('decay', bloom='bloom') as info:
+        # Check that the start hook was called before the body
+        hook.assert_called_once_with('decay', 'start', info)
+        info['num_removed'] = 1
+
+    assert 2 == hook.call_count
+    hook.assert_called_with('decay', 'end', info)
+    assert {'bloom': 'bloom', 'num_removed': 1, 'duration': 2.5} == info
+
+
+def test_trace_with_error(hook):
+    with pytest.raises(ValueError):
+        with tracing.trace('save'):
+            raise ValueError()
+
+    # The end hook is still called
+    assert 'end' == hook.call_args[0][1]
+
+
+def test_trace_with_failing_hook(hook):
+    hook.side_effect = Exception()
+
+    # A failing hook doesn't break the operation
+    with tracing.trace('save') as info:
+        info['saved'] = True
+
+    assert 2 == hook.call_count
+
+
+def test_trace_without_hooks():
+    with tracing.trace('decay', bloom='bloom') as info:
+        pass
+
+    assert {'bloom': 'bloom'} == info
+
+
+def test_profile_hook():
+    hook = tracing.ProfileHook(events=('decay',))
+    hook.profile = MagicMock()
+
+    # Nested events only toggle the profiler once
+    hook('decay', 'start', {})
+    hook('decay', 'start', {})
+    hook('save', 'start', {})
+    hook('save', 'end', {})
+    hook('decay', 'end', {})
+    hook('decay', 'end', {})
+
+    hook.profile.enable.assert_called_once_with()
+    hook.profile.disable.assert_called_once_with()